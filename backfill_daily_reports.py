@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Script to rebuild the DailyReport rows of past days from SpeedHistory and LocationHistory.
+
+Each day is recomputed in one vectorized pass with the same rules (and the same
+environment thresholds) the writer applies incrementally, and upserted over the
+stored reports.
+"""
+
+import os
+import sys
+import argparse
+from datetime import date, timedelta
+from dotenv import load_dotenv
+
+# Add the src directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from Services.DatabaseConnection import DatabaseConnection
+from Schemas.DailyReportAggregator import DailyReportAggregator
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Rebuild DailyReport rows from the history tables')
+    parser.add_argument('--date', type=date.fromisoformat, default=date.today() - timedelta(days=1),
+                        help='First day to rebuild, YYYY-MM-DD (default: yesterday)')
+    parser.add_argument('--days', type=int, default=1, help='Number of days to rebuild (default: 1)')
+    args = parser.parse_args()
+
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        print("DATABASE_URL not found in environment variables")
+        return
+
+    aggregator = DailyReportAggregator(
+        speed_limit=float(os.getenv("SPEED_LIMIT_KMH", "80")),
+        acceleration_threshold=float(os.getenv("SUDDEN_ACCELERATION_KMH_S", "10")),
+        brake_threshold=float(os.getenv("SUDDEN_BRAKE_KMH_S", "12")),
+        turn_threshold=float(os.getenv("SUDDEN_TURN_DEG_S", "30"))
+    )
+    db = DatabaseConnection(db_url)
+    try:
+        for offset in range(args.days):
+            day = args.date + timedelta(days=offset)
+            print(f"📊 {day}: {aggregator.backfill(db, day)} daily reports rebuilt")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,798 @@
+#!/usr/bin/env python3
+"""
+Script to benchmark the hot paths of the MQTT writer.
+
+Each benchmark is a subcommand. Benchmarks that need a database use --url, which
+defaults to DATABASE_URL and falls back to an in-memory SQLite stand-in.
+"""
+
+import os
+import sys
+import time
+import uuid
+import re
+import argparse
+import datetime
+import logging
+import math
+import random
+from dotenv import load_dotenv
+
+# Add the src directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from Services.DatabaseConnection import DatabaseConnection
+from Services.PartitionManager import PartitionManager
+from Services.Metrics import Metrics
+from Services.LogPipeline import LogPipeline
+from Schemas.TopicRouter import TopicRouter
+from Schemas import MQTTToDatabaseWriter, AsyncMQTTToDatabaseWriter, ReorderBuffer, TrajectoryCompressor
+from Schemas import IdGenerator, RollupAggregator
+
+
+def report(name, count, elapsed, unit="rows"):
+    """Print a throughput line for a benchmark run"""
+    rate = count / elapsed if elapsed > 0 else float('inf')
+    print(f"{name:<28} {count:>10} {unit} in {elapsed:8.3f}s  -> {rate:>12,.0f} {unit}/s")
+
+
+def speed_rows(count, unit_ids):
+    """Generate SpeedHistory-shaped rows"""
+    now = datetime.datetime.now()
+    return [
+        (str(uuid.uuid4()), unit_ids[i % len(unit_ids)], round(i % 120 + 0.5, 1),
+         now + datetime.timedelta(milliseconds=i))
+        for i in range(count)
+    ]
+
+
+def create_scratch_table(database, table):
+    """Create a SpeedHistory-shaped table without foreign keys for benchmarking"""
+    database.execute_query(f'DROP TABLE IF EXISTS "{table}"')
+    database.execute_query(
+        f'CREATE TABLE "{table}" ('
+        '"speed_id" varchar PRIMARY KEY, "unit_id" varchar, "driver_id" varchar, '
+        '"speed" numeric, "recorded_at" timestamp)'
+    )
+
+
+def benchmark_copy(args):
+    """Compare per-row insert_data against batched copy_rows, with and without duplicate skipping"""
+    database = DatabaseConnection(args.url)
+    table = "BenchmarkSpeedHistory"
+    columns = ['speed_id', 'unit_id', 'speed', 'recorded_at']
+    unit_ids = [str(uuid.uuid4()) for _ in range(args.units)]
+    print(f"Database: {database.engine.dialect.name} ({database.engine.dialect.driver})")
+
+    try:
+        create_scratch_table(database, table)
+        rows = speed_rows(args.rows, unit_ids)
+        start = time.perf_counter()
+        for row in rows:
+            database.insert_data(table, dict(zip(columns, row)))
+        report("insert_data (per row)", len(rows), time.perf_counter() - start)
+
+        create_scratch_table(database, table)
+        rows = speed_rows(args.rows, unit_ids)
+        start = time.perf_counter()
+        for offset in range(0, len(rows), args.batch_size):
+            database.copy_rows(table, columns, rows[offset:offset + args.batch_size])
+        report(f"copy_rows (batch {args.batch_size})", len(rows), time.perf_counter() - start)
+
+        # History batches skip keys already stored; a conflict is rare (redelivery, replay)
+        for label, conflicts in (("skip_duplicates", False), ("skip_duplicates, 1 dup/batch", True)):
+            create_scratch_table(database, table)
+            rows = speed_rows(args.rows, unit_ids)
+            start = time.perf_counter()
+            for offset in range(0, len(rows), args.batch_size):
+                batch = rows[offset:offset + args.batch_size]
+                if conflicts and offset:
+                    batch = batch + [rows[offset - 1]]
+                database.copy_rows(table, columns, batch, skip_duplicates=True)
+            report(label, len(rows), time.perf_counter() - start)
+
+        if database.engine.dialect.driver == 'psycopg2':
+            # Every batch through the staging table, without trying a plain COPY first
+            create_scratch_table(database, table)
+            rows = speed_rows(args.rows, unit_ids)
+            start = time.perf_counter()
+            for offset in range(0, len(rows), args.batch_size):
+                database._copy_through_staging(table, columns, rows[offset:offset + args.batch_size])
+                database.conn.commit()
+            report("staging table (every batch)", len(rows), time.perf_counter() - start)
+    finally:
+        database.execute_query(f'DROP TABLE IF EXISTS "{table}"')
+        database.close()
+
+
+PARAMETERS = ['Combustible', 'Velocidad', 'Panic', 'RPM', 'Temperatura', 'Latitud', 'Longitud']
+NAMESPACE = uuid.UUID('6ba7b810-9dad-11d1-80b4-00c04fd430c8')
+
+
+def legacy_parse_and_dispatch(topic, handlers):
+    """The per-message regex parsing and if/elif dispatch used before TopicRouter"""
+    match = re.match(r'U(\d+)_(.+)', topic) or re.match(r'U(\d+)/(.+)', topic)
+    if not match:
+        return None
+    unit_info = {'unit_number': match.group(1), 'parameter': match.group(2).lower()}
+    unit_uuid = str(uuid.uuid5(NAMESPACE, f"unit_{unit_info['unit_number']}"))
+    parameter = unit_info['parameter']
+    if parameter in ['combustible', 'fuel']:
+        handlers['fuel'](unit_uuid)
+    elif parameter in ['velocidad', 'speed']:
+        handlers['speed'](unit_uuid)
+    elif parameter == 'panic':
+        handlers['panic'](unit_uuid)
+    elif parameter == 'rpm':
+        handlers['rpm'](unit_uuid)
+    elif parameter in ['temperatura', 'temperature']:
+        handlers['temperature'](unit_uuid)
+    elif parameter in ['latitud', 'latitude']:
+        handlers['latitude'](unit_uuid)
+    elif parameter in ['longitud', 'longitude']:
+        handlers['longitude'](unit_uuid)
+    return unit_info
+
+
+def benchmark_router(args):
+    """Compare legacy topic parsing + dispatch against the memoized TopicRouter"""
+    topics = [f"U{unit}_{parameter}" for unit in range(1, args.units + 1) for parameter in PARAMETERS]
+    stream = [topics[i % len(topics)] for i in range(args.messages)]
+    noop = lambda *a: None
+    handlers = {name: noop for name in ['fuel', 'speed', 'panic', 'rpm', 'temperature', 'latitude', 'longitude']}
+
+    start = time.perf_counter()
+    for topic in stream:
+        legacy_parse_and_dispatch(topic, handlers)
+    report("regex + if/elif (legacy)", len(stream), time.perf_counter() - start, "msgs")
+
+    router = TopicRouter(lambda unit_number: str(uuid.uuid5(NAMESPACE, f"unit_{unit_number}")))
+    for names in [['combustible', 'fuel'], ['velocidad', 'speed'], 'panic', 'rpm',
+                  ['temperatura', 'temperature'], ['latitud', 'latitude'], ['longitud', 'longitude']]:
+        router.register(names, noop)
+    start = time.perf_counter()
+    for topic in stream:
+        route = router.resolve(topic)
+        route.handler(route.unit_uuid, "0", None)
+    report("TopicRouter (memoized)", len(stream), time.perf_counter() - start, "msgs")
+    print(f"Route cache: {router.cache_info()}")
+
+
+def create_scratch_units(database, table):
+    """Create a Units-shaped table without foreign keys for benchmarking"""
+    database.execute_query(f'DROP TABLE IF EXISTS "{table}"')
+    database.execute_query(
+        f'CREATE TABLE "{table}" ('
+        '"unit_id" varchar PRIMARY KEY, "fuel_level" numeric, "current_speed" numeric, '
+        '"panic_button_active" boolean, "rpm" int, "temperature" int, '
+        '"created_at" timestamp, "updated_at" timestamp)'
+    )
+
+
+def benchmark_statements(args):
+    """Per-call cost of the writer's statement shapes with and without the statement cache"""
+    units_table, history_table = "BenchmarkUnits", "BenchmarkSpeedHistory"
+    unit_ids = [str(uuid.uuid4()) for _ in range(args.units)]
+    now = datetime.datetime.now()
+
+    for label, options in [("uncached", {'statement_cache': False}),
+                           ("cached", {'statement_cache': True, 'prepared_statements': False}),
+                           ("cached + prepared", {'statement_cache': True, 'prepared_statements': True})]:
+        database = DatabaseConnection(args.url, **options)
+        if label == "cached + prepared" and not database.prepared_statements:
+            database.close()
+            continue
+        try:
+            create_scratch_units(database, units_table)
+            create_scratch_table(database, history_table)
+            database.upsert_rows(units_table, [{'unit_id': unit_id, 'updated_at': now} for unit_id in unit_ids],
+                                 conflict_columns=['unit_id'])
+
+            shapes = {
+                'insert_data SpeedHistory': lambda i: database.insert_data(history_table, {
+                    'speed_id': str(uuid.uuid4()), 'unit_id': unit_ids[i % len(unit_ids)],
+                    'speed': 42.5, 'recorded_at': now}),
+                'update_data Units': lambda i: database.update_data(units_table, {
+                    'fuel_level': 50.0, 'updated_at': now}, 'unit_id = :unit_id',
+                    {'unit_id': unit_ids[i % len(unit_ids)]}),
+                'upsert_rows Units': lambda i: database.upsert_rows(units_table, [
+                    {'unit_id': unit_id, 'fuel_level': 50.0, 'current_speed': 42.5, 'rpm': 2000,
+                     'temperature': 90, 'updated_at': now} for unit_id in unit_ids
+                ], conflict_columns=['unit_id'],
+                    update_columns=['fuel_level', 'current_speed', 'rpm', 'temperature', 'updated_at']),
+            }
+            print(f"--- {label} ({database.engine.dialect.name}) ---")
+            for name, call in shapes.items():
+                calls = args.calls if not name.startswith('upsert') else max(1, args.calls // 20)
+                with database.transaction():
+                    start = time.perf_counter()
+                    for i in range(calls):
+                        call(i)
+                    elapsed = time.perf_counter() - start
+                print(f"{name:<28} {calls:>8} calls  {elapsed / calls * 1e6:10.1f} us/call")
+        finally:
+            database.execute_query(f'DROP TABLE IF EXISTS "{units_table}"')
+            database.execute_query(f'DROP TABLE IF EXISTS "{history_table}"')
+            database.close()
+
+
+def benchmark_ingest(args):
+    """End-to-end msgs/s of the sync and async writers fed by the simulator's burst mode"""
+    import threading
+    import paho.mqtt.client as mqtt
+    from simulate_mqtt import publish_burst
+
+    modes = ['sync', 'async'] if args.mode == 'both' else [args.mode]
+    for mode in modes:
+        writer_class = AsyncMQTTToDatabaseWriter if mode == 'async' else MQTTToDatabaseWriter
+        writer = writer_class(topic="vehicle_telemetry", url=args.url, table_name="Units", columns=[],
+                              flush_size=args.flush_size)
+        thread = threading.Thread(target=writer.start, args=(args.host, args.port), daemon=True)
+        thread.start()
+        time.sleep(args.warmup)
+
+        publisher = mqtt.Client()
+        publisher.connect(args.host, args.port, 60)
+        publisher.loop_start()
+        start = time.perf_counter()
+        published = publish_burst(publisher, [1, 2, 3], args.cycles, packed=args.packed)
+        publisher.loop_stop()
+        publisher.disconnect()
+
+        # Wait until every published message has been written (or dropped by the sync queue)
+        def written():
+            if mode == 'async':
+                return writer.flushed
+            return writer.batch_writer.flushed + writer.batch_writer.dropped
+        deadline = time.monotonic() + args.timeout
+        while written() < published and time.monotonic() < deadline:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        report(f"{mode} writer", written(), elapsed, "msgs")
+
+        if mode == 'async':
+            writer.stop()
+            thread.join()
+        else:
+            writer.mqtt_client.disconnect()
+            thread.join()
+            print(f"Dropped by the full write queue: {writer.batch_writer.dropped}")
+        writer.close()
+
+
+def benchmark_payload(args):
+    """Decode + apply cost of a vehicle cycle: one message per metric vs packed JSON vs binary frame"""
+    from simulate_mqtt import packed_message
+
+    writer = MQTTToDatabaseWriter(topic="vehicle_telemetry", url=args.url, table_name="Units", columns=[])
+    values = {'Combustible': 71.5, 'Velocidad': 80.1, 'RPM': 2000, 'Temperatura': 90,
+              'Latitud': 19.451234, 'Longitud': -99.151234}
+    units = range(1, args.units + 1)
+    streams = {
+        'one value per topic': [(f"fleet/{unit}/{name}", str(value).encode())
+                                for unit in units for name, value in values.items()],
+        'packed json': [(topic, payload.encode())
+                        for topic, payload in (packed_message(unit, values, 'json') for unit in units)],
+        'packed frame': [packed_message(unit, values, 'frame') for unit in units],
+    }
+
+    for name, stream in streams.items():
+        start = time.perf_counter()
+        for _ in range(args.cycles):
+            now = datetime.datetime.now()
+            for topic, payload in stream:
+                route = writer.router.resolve(topic)
+                route.handler(route.unit_uuid, payload if route.binary else payload.decode('utf-8'), now)
+            writer._take_pending(final=True)
+            # Packed payloads repeat their device timestamp every cycle: keep them from being deduplicated
+            writer.reorder = ReorderBuffer(0)
+        elapsed = time.perf_counter() - start
+        report(name, args.cycles * len(units), elapsed, "cycles")
+        payload_bytes = sum(len(payload) for _, payload in stream) / len(units)
+        print(f"{'':<28} {args.cycles * len(stream):>10} msgs, {payload_bytes:.0f} payload bytes per cycle")
+    writer.db.close()
+
+
+def simulated_track(kind, points, rng, noise=3.0):
+    """Generate (latitude, longitude) fixes one second apart for a simulated drive, with GPS noise in meters"""
+    meters = math.radians(1) * TrajectoryCompressor.EARTH_RADIUS
+    base_lat, base_lon = 19.4326, -99.1332
+    x = y = 0.0
+    heading = rng.uniform(0, 2 * math.pi)
+    fixes = []
+    for i in range(points):
+        if kind == 'straight road':
+            step = 25.0
+        elif kind == 'city grid':
+            # 200 m blocks: stop 20 s at the corner, then turn left or right
+            block = i % 30
+            step = 0.0 if block >= 20 else 10.0
+            if block == 29:
+                heading += rng.choice((-1, 1)) * math.pi / 2
+        elif kind == 'winding road':
+            step = 15.0
+            heading += 0.15 * math.sin(i / 20)
+        else:  # parked
+            step = 0.0
+        x += step * math.cos(heading)
+        y += step * math.sin(heading)
+        lat = base_lat + (y + rng.gauss(0, noise)) / meters
+        lon = base_lon + (x + rng.gauss(0, noise)) / (meters * math.cos(math.radians(base_lat)))
+        fixes.append((lat, lon))
+    return fixes
+
+
+def benchmark_trajectory(args):
+    """Compression ratio, max deviation and throughput of the trajectory compressor on simulated tracks"""
+    rng = random.Random(args.seed)
+    start_time = datetime.datetime(2024, 6, 10)
+    for kind in ('straight road', 'city grid', 'winding road', 'parked'):
+        compressor = TrajectoryCompressor(tolerance=args.tolerance, max_points=args.max_points,
+                                          max_interval=args.max_interval)
+        tracks = {}
+        for unit in range(args.units):
+            unit_id = f"unit-{unit}"
+            tracks[unit_id] = [
+                (f"{unit_id}-{i}", unit_id, lat, lon, start_time + datetime.timedelta(seconds=i))
+                for i, (lat, lon) in enumerate(simulated_track(kind, args.points, rng))
+            ]
+        # Interleave the units like a live feed
+        feed = [track[i] for i in range(args.points) for track in tracks.values()]
+        kept = []
+        start = time.perf_counter()
+        for row in feed:
+            kept.extend(compressor.add(row))
+        kept.extend(compressor.expire())
+        elapsed = time.perf_counter() - start
+
+        # Distance from every original fix to the segment of the simplified track around it
+        max_deviation = 0.0
+        kept_by_unit = {}
+        for row in kept:
+            kept_by_unit.setdefault(row[1], []).append(row)
+        for unit_id, track in tracks.items():
+            simplified = sorted(kept_by_unit[unit_id], key=lambda row: row[4])
+            segment = 0
+            for row in track:
+                while segment + 1 < len(simplified) - 1 and simplified[segment + 1][4] <= row[4]:
+                    segment += 1
+                start_row, end_row = simplified[segment], simplified[min(segment + 1, len(simplified) - 1)]
+                deviation = TrajectoryCompressor.distance_to_segment(row[2:4], start_row[2:4], end_row[2:4])
+                max_deviation = max(max_deviation, deviation)
+
+        report(kind, len(feed), elapsed, "points")
+        print(f"{'':<28} {len(kept):>10} kept -> {len(feed) / len(kept):5.1f}x smaller, "
+              f"max deviation {max_deviation:.2f} m (tolerance {args.tolerance} m)")
+
+
+def benchmark_reads(args):
+    """Peak memory and time of reading a large history table at once vs in bounded batches"""
+    import subprocess
+    import tempfile
+    url = args.url
+    if url == "sqlite://":
+        # Each read runs in its own process, so an in-memory database cannot be shared
+        url = f"sqlite:///{os.path.join(tempfile.gettempdir(), 'benchmark_reads.db')}"
+    table = "BenchmarkSpeedHistory"
+    if args.mode is not None:
+        read_table(url, table, args.mode, args.batch_size)
+        return
+
+    database = DatabaseConnection(url)
+    print(f"Database: {database.engine.dialect.name} ({database.engine.dialect.driver})")
+    try:
+        create_scratch_table(database, table)
+        unit_ids = [str(uuid.uuid4()) for _ in range(args.units)]
+        for offset in range(0, args.rows, 100000):
+            database.copy_rows(table, ['speed_id', 'unit_id', 'speed', 'recorded_at'],
+                               speed_rows(min(100000, args.rows - offset), unit_ids))
+        database.close()
+        for mode in ('fetch_all', 'iter_batches'):
+            subprocess.run([sys.executable, __file__, '--url', url, 'reads', '--mode', mode,
+                            '--batch-size', str(args.batch_size)], check=True)
+    finally:
+        database = DatabaseConnection(url)
+        database.execute_query(f'DROP TABLE IF EXISTS "{table}"')
+        database.close()
+
+
+def read_table(url, table, mode, batch_size):
+    """Read a table with fetch_all or iter_batches and report the memory it took (run in a fresh process)"""
+    import resource
+
+    def peak_mb():
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    database = DatabaseConnection(url)
+    database.fetch_one(table)
+    baseline = peak_mb()
+    start = time.perf_counter()
+    if mode == 'fetch_all':
+        rows = database.fetch_all(table).height
+    else:
+        rows = sum(batch.height for batch in database.fetch_all(table, iter_batches=True, batch_size=batch_size))
+    report(mode, rows, time.perf_counter() - start)
+    print(f"{'':<28} peak memory +{peak_mb() - baseline:,.0f} MB")
+    database.close()
+
+
+HISTORY_QUERIES = {
+    'unit, last hour': (
+        'SELECT "speed", "recorded_at" FROM {table} WHERE "unit_id" = :unit_id '
+        'AND "recorded_at" >= :end - interval \'1 hour\' ORDER BY "recorded_at"'
+    ),
+    'latest point, 20 units': (
+        'SELECT l.* FROM unnest(CAST(:unit_ids AS uuid[])) AS u("unit_id") CROSS JOIN LATERAL ('
+        'SELECT h."unit_id", h."speed", h."recorded_at" FROM {table} h WHERE h."unit_id" = u."unit_id" '
+        'ORDER BY h."recorded_at" DESC LIMIT 1) l'
+    ),
+    'fleet, one day': (
+        'SELECT count(*), avg("speed") FROM {table} '
+        'WHERE "recorded_at" >= :end - interval \'2 days\' AND "recorded_at" < :end - interval \'1 day\''
+    ),
+}
+
+
+def benchmark_history(args):
+    """Typical history queries on an unpartitioned table vs the daily partitioned layout of migration 001"""
+    database = DatabaseConnection(args.url)
+    if database.engine.dialect.name != 'postgresql':
+        print("The history layout benchmark needs PostgreSQL (--url or DATABASE_URL)")
+        database.close()
+        return
+    heap, partitioned = "BenchmarkHistoryHeap", "BenchmarkHistoryPartitioned"
+    end = datetime.datetime.now().replace(microsecond=0)
+    start = end - datetime.timedelta(days=args.days)
+    unit_ids = [str(uuid.UUID(int=i + 1)) for i in range(args.units)]
+    try:
+        for table in (heap, partitioned):
+            database.execute_query(f'DROP TABLE IF EXISTS "{table}"')
+        # The layout before migration 001
+        database.execute_query(
+            f'CREATE TABLE "{heap}" ("speed_id" uuid PRIMARY KEY, "unit_id" uuid, "driver_id" uuid, '
+            '"speed" numeric, "recorded_at" timestamp)'
+        )
+        # The layout after it
+        database.execute_query(
+            f'CREATE TABLE "{partitioned}" ("speed_id" uuid NOT NULL, "unit_id" uuid, "driver_id" uuid, '
+            '"speed" real, "recorded_at" timestamp NOT NULL, PRIMARY KEY ("speed_id", "recorded_at")) '
+            'PARTITION BY RANGE ("recorded_at")'
+        )
+        database.execute_query(f'CREATE INDEX ON "{partitioned}" ("unit_id", "recorded_at")')
+        database.execute_query(f'CREATE INDEX ON "{partitioned}" USING brin ("recorded_at")')
+        PartitionManager(database, tables=[partitioned]).create_partitions(partitioned, start.date(), end.date())
+
+        for table in (heap, partitioned):
+            load_start = time.perf_counter()
+            # Rows spread evenly over the time range, units interleaved like a live feed
+            database.execute_query(
+                f'INSERT INTO "{table}" ("speed_id", "unit_id", "speed", "recorded_at") '
+                'SELECT gen_random_uuid(), CAST(lpad(to_hex(g % :units + 1), 32, \'0\') AS uuid), '
+                '(g % 120) + 0.5, '
+                'CAST(:start AS timestamp) + (g * CAST(:step AS double precision)) * interval \'1 second\' '
+                'FROM generate_series(0, :rows - 1) AS g',
+                {'units': args.units, 'start': start, 'rows': args.rows,
+                 'step': (end - start).total_seconds() / args.rows}
+            )
+            database.execute_query(f'ANALYZE "{table}"')
+            report(f"load {table}", args.rows, time.perf_counter() - load_start)
+
+        params = {'unit_id': unit_ids[0], 'unit_ids': unit_ids[:20], 'end': end}
+        print(f"{'query':<28} {'unpartitioned':>14} {'partitioned':>14}")
+        for name, query in HISTORY_QUERIES.items():
+            timings = []
+            for table in (heap, partitioned):
+                runs = []
+                for _ in range(args.repeat):
+                    run_start = time.perf_counter()
+                    database.fetch_frame(query.format(table=f'"{table}"'), params)
+                    runs.append(time.perf_counter() - run_start)
+                timings.append(sorted(runs)[len(runs) // 2])
+            print(f"{name:<28} {timings[0] * 1000:>11.1f} ms {timings[1] * 1000:>11.1f} ms  "
+                  f"-> {timings[0] / timings[1]:,.0f}x")
+        for table in (heap, partitioned):
+            size = database.fetch_frame('SELECT pg_total_relation_size(c."oid") '
+                                        '+ COALESCE(sum(pg_total_relation_size(i."inhrelid")), 0) AS "bytes" '
+                                        'FROM pg_class c LEFT JOIN pg_inherits i ON i."inhparent" = c."oid" '
+                                        'WHERE c."oid" = to_regclass(:table) GROUP BY c."oid"', {'table': f'"{table}"'})
+            print(f"{table:<28} {size['bytes'][0] / 1024 ** 2:>11,.0f} MB with indexes")
+    finally:
+        for table in (heap, partitioned):
+            database.execute_query(f'DROP TABLE IF EXISTS "{table}"')
+        database.close()
+
+
+def benchmark_ids(args):
+    """Insert throughput into a primary-key indexed table as it grows: uuid4 vs time-ordered IDs"""
+    database = DatabaseConnection(args.url)
+    table = "BenchmarkIds"
+    columns = ['speed_id', 'unit_id', 'speed', 'recorded_at']
+    postgres = database.engine.dialect.name == 'postgresql'
+    unit_ids = [str(uuid.uuid4()) for _ in range(args.units)]
+    generator = IdGenerator()
+    variants = {
+        'uuid4': lambda unit_id, recorded_at: str(uuid.uuid4()),
+        'uuid7 new': lambda unit_id, recorded_at: generator.new(),
+        'uuid7 for_sample': lambda unit_id, recorded_at: IdGenerator.for_sample(unit_id, 'SpeedHistory', recorded_at),
+    }
+    print(f"Database: {database.engine.dialect.name} ({database.engine.dialect.driver}), "
+          f"{args.rows:,} rows in batches of {args.batch_size:,}")
+
+    try:
+        for name, mint in variants.items():
+            database.execute_query(f'DROP TABLE IF EXISTS "{table}"')
+            database.execute_query(
+                f'CREATE TABLE "{table}" ("speed_id" {"uuid" if postgres else "varchar"} PRIMARY KEY, '
+                '"unit_id" varchar, "speed" real, "recorded_at" timestamp)'
+            )
+            # Deterministic IDs are written the way the writer does, skipping stored keys
+            skip_duplicates = name == 'uuid7 for_sample'
+            recorded_at = datetime.datetime.now()
+            step = datetime.timedelta(milliseconds=1)
+            written, window_rows, window_start = 0, 0, time.perf_counter()
+            start = window_start
+            while written < args.rows:
+                rows = []
+                for i in range(min(args.batch_size, args.rows - written)):
+                    unit_id = unit_ids[(written + i) % len(unit_ids)]
+                    recorded_at += step
+                    rows.append((mint(unit_id, recorded_at), unit_id, (written + i) % 120 + 0.5, recorded_at))
+                database.copy_rows(table, columns, rows, skip_duplicates=skip_duplicates)
+                written += len(rows)
+                window_rows += len(rows)
+                if window_rows >= args.report_every or written == args.rows:
+                    # The rate of the last stretch shows the slowdown as the index outgrows memory
+                    report(f"{name} @ {written:,}", window_rows, time.perf_counter() - window_start)
+                    window_rows, window_start = 0, time.perf_counter()
+            report(f"{name} total", written, time.perf_counter() - start)
+            if postgres:
+                size = database.fetch_frame(f'SELECT pg_indexes_size(\'"{table}"\') AS "bytes"')
+                print(f"{'':<28} primary key index: {size['bytes'][0] / 1024 ** 2:,.0f} MB")
+    finally:
+        database.execute_query(f'DROP TABLE IF EXISTS "{table}"')
+        database.close()
+
+
+def benchmark_rollups(args):
+    """Per-sample cost of the rollup windows and rows stored per simulated day"""
+    rollups = RollupAggregator(flush_interval=args.flush_interval)
+    unit_ids = [str(uuid.UUID(int=i + 1)) for i in range(args.units)]
+    parameters = sorted(RollupAggregator.PARAMETERS)
+    day = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    samples, minute_rows, hour_rows, elapsed = 0, 0, 0, 0.0
+    rng = random.Random(1)
+    # One sample of every parameter per unit every `interval` seconds of recorded time
+    for second in range(0, 86400, args.interval):
+        timestamp = day + datetime.timedelta(seconds=second)
+        values = {parameter: rng.uniform(0, 100) for parameter in parameters}
+        start = time.perf_counter()
+        for unit_id in unit_ids:
+            rollups.add_many(unit_id, values, timestamp)
+        for table, rows in rollups.take_rows(None if second % args.flush_interval == 0 else float('-inf')):
+            if table == 'MinuteRollup':
+                minute_rows += len(rows)
+            else:
+                hour_rows += len(rows)
+        elapsed += time.perf_counter() - start
+        samples += len(unit_ids) * len(parameters)
+    report("add_many + flushes", samples, elapsed, unit="samples")
+    print(f"{'rows per day':<28} {samples:>10,} raw samples, {minute_rows:,} minute rows "
+          f"and {hour_rows:,} hour rows upserted")
+    print(f"{'rows per day (stored)':<28} {len(unit_ids) * len(parameters) * 1440:>10,} minute, "
+          f"{len(unit_ids) * len(parameters) * 24:,} hour")
+
+
+def benchmark_metrics(args):
+    """Cost of the metrics recorded per message, and of rendering a scrape"""
+    metrics = Metrics()
+    received = metrics.counter('messages_received_total', 'Messages received')
+    parsed = metrics.counter('messages_parsed_total', 'Messages parsed', labels=('parameter',))
+    units = metrics.counter('unit_messages_total', 'Messages per unit', labels=('unit',))
+    latency = metrics.histogram('receive_to_commit_seconds', 'Receive to commit')
+    rng = random.Random(1)
+    messages = [(PARAMETERS[i % len(PARAMETERS)], str(i % args.units + 1), rng.expovariate(50))
+                for i in range(args.messages)]
+
+    start = time.perf_counter()
+    for parameter, unit, seconds in messages:
+        pass
+    baseline = time.perf_counter() - start
+    start = time.perf_counter()
+    for parameter, unit, seconds in messages:
+        # What the writer records for every message: three counters and one latency
+        received.inc()
+        parsed.inc(parameter)
+        units.inc(unit)
+        latency.observe(seconds)
+    elapsed = time.perf_counter() - start - baseline
+    report("record per message", len(messages), elapsed, unit="msgs")
+    print(f"{'':<28} {elapsed / len(messages) * 1e9:,.0f} ns per message")
+
+    start = time.perf_counter()
+    body = metrics.render()
+    report("render scrape", len(body.splitlines()), time.perf_counter() - start, unit="lines")
+
+
+class SlowStream:
+    """A log destination that stalls on every write, like a full pipe to the log driver"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def write(self, text):
+        time.sleep(self.delay)
+
+    def flush(self):
+        pass
+
+
+def benchmark_logging(args):
+    """Per-message cost on the emitting thread: print() per message vs the queued, rate-limited logging"""
+    rng = random.Random(1)
+    messages = [(f"fleet/{i % args.units + 1}/{PARAMETERS[i % len(PARAMETERS)]}", f"{rng.uniform(0, 120):.1f}")
+                for i in range(args.messages)]
+
+    # What on_message used to do: three unbuffered lines per message (PYTHONUNBUFFERED=1 in Docker)
+    with open(os.devnull, 'w', buffering=1) as devnull:
+        start = time.perf_counter()
+        for topic, payload in messages:
+            print(f"📨 Received: {topic} ({len(payload)} bytes)", file=devnull)
+            print(f"🔍 Parsed: Unit {topic.split('/')[1]}, Parameter: {topic.split('/')[2]}", file=devnull)
+            print("✅ Data written to database (1 messages)", file=devnull)
+        report("print x3 to /dev/null", len(messages), time.perf_counter() - start, unit="msgs")
+
+    logger = logging.getLogger('benchmark')
+    tracer = logging.getLogger('benchmark.trace')
+    tracer.setLevel(logging.DEBUG)
+    trace_units = frozenset(['1'])
+    with open(os.devnull, 'w') as devnull:
+        pipeline = LogPipeline(json_output=True, stream=devnull, queue_size=args.queue_size)
+        pipeline.start()
+        try:
+            # The writer now logs per message only for traced units (1 of --units here)
+            start = time.perf_counter()
+            for topic, payload in messages:
+                unit = topic.split('/')[1]
+                if unit in trace_units:
+                    tracer.debug("📨 Received %s: %r", topic, payload, extra={'unit': unit})
+            report("untraced + 1 traced unit", len(messages), time.perf_counter() - start, unit="msgs")
+
+            # An error repeated on every message (e.g. an unroutable topic) is rate limited
+            start = time.perf_counter()
+            for topic, payload in messages:
+                logger.warning("❌ Could not route topic (unknown format, unit or parameter): %s", topic)
+            report("warning on every message", len(messages), time.perf_counter() - start, unit="msgs")
+        finally:
+            pipeline.stop()
+        print(f"{'':<28} {pipeline.stats()}")
+
+    # A stalled destination: the emitter drops records instead of waiting for the listener
+    count = min(args.messages, 100000)
+    pipeline = LogPipeline(json_output=True, stream=SlowStream(0.001), rate_limit=0, queue_size=args.queue_size)
+    pipeline.start()
+    try:
+        start = time.perf_counter()
+        for topic, payload in messages[:count]:
+            logger.warning("Record for %s", topic)
+        report("stalled output, no limit", count, time.perf_counter() - start, unit="msgs")
+    finally:
+        pipeline.handler.queue.queue.clear()
+        pipeline.stop()
+    print(f"{'':<28} {pipeline.stats()}")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Benchmark the MQTT writer hot paths')
+    parser.add_argument('--url', type=str, default=os.getenv("DATABASE_URL") or "sqlite://",
+                        help='Database URL (default: DATABASE_URL or in-memory SQLite)')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    copy_parser = subparsers.add_parser(
+        'copy', help='insert_data vs copy_rows for history appends, and duplicate skipping')
+    copy_parser.add_argument('--rows', type=int, default=20000, help='Rows to write per path (default: 20000)')
+    copy_parser.add_argument('--batch-size', type=int, default=500, help='Rows per copy_rows call (default: 500)')
+    copy_parser.add_argument('--units', type=int, default=50, help='Distinct unit IDs (default: 50)')
+    copy_parser.set_defaults(func=benchmark_copy)
+
+    router_parser = subparsers.add_parser('router', help='Topic parse + dispatch messages/sec')
+    router_parser.add_argument('--messages', type=int, default=500000, help='Messages to route (default: 500000)')
+    router_parser.add_argument('--units', type=int, default=100, help='Distinct units (default: 100)')
+    router_parser.set_defaults(func=benchmark_router)
+
+    statements_parser = subparsers.add_parser('statements', help='Per-call statement overhead with and without caching')
+    statements_parser.add_argument('--calls', type=int, default=5000, help='Calls per statement shape (default: 5000)')
+    statements_parser.add_argument('--units', type=int, default=50, help='Units per upsert (default: 50)')
+    statements_parser.set_defaults(func=benchmark_statements)
+
+    ingest_parser = subparsers.add_parser('ingest',
+                                          help='End-to-end msgs/s of the sync vs async writer (needs a broker)')
+    ingest_parser.add_argument('--mode', choices=['sync', 'async', 'both'], default='both',
+                               help='Writer to run (default: both)')
+    ingest_parser.add_argument('--host', type=str, default=os.getenv("MQTT_HOST", "localhost"), help='MQTT broker host')
+    ingest_parser.add_argument('--port', type=int, default=int(os.getenv("MQTT_PORT", "1883")), help='MQTT broker port')
+    ingest_parser.add_argument('--cycles', type=int, default=2000,
+                               help='Simulator cycles for units 1-3 (default: 2000)')
+    ingest_parser.add_argument('--flush-size', type=int, default=500, help='Messages per batch (default: 500)')
+    ingest_parser.add_argument('--warmup', type=float, default=2.0,
+                               help='Seconds to let the writer subscribe (default: 2)')
+    ingest_parser.add_argument('--timeout', type=float, default=120.0,
+                               help='Seconds to wait for the writes (default: 120)')
+    ingest_parser.add_argument('--packed', choices=['json', 'frame'],
+                               help='Publish one packed message per unit and cycle')
+    ingest_parser.set_defaults(func=benchmark_ingest)
+
+    payload_parser = subparsers.add_parser('payload',
+                                           help='Decode + apply per vehicle cycle: per-metric vs packed payloads')
+    payload_parser.add_argument('--cycles', type=int, default=2000, help='Cycles per unit (default: 2000)')
+    payload_parser.add_argument('--units', type=int, default=50, help='Distinct units (default: 50)')
+    payload_parser.set_defaults(func=benchmark_payload)
+
+    trajectory_parser = subparsers.add_parser(
+        'trajectory', help='LocationHistory compression ratio and max deviation on simulated tracks')
+    trajectory_parser.add_argument('--points', type=int, default=3600,
+                                   help='Fixes per unit, one per second (default: 3600)')
+    trajectory_parser.add_argument('--units', type=int, default=20, help='Distinct units (default: 20)')
+    trajectory_parser.add_argument('--tolerance', type=float, default=10.0, help='Tolerance in meters (default: 10)')
+    trajectory_parser.add_argument('--max-points', type=int, default=32, help='Fixes buffered per unit (default: 32)')
+    trajectory_parser.add_argument('--max-interval', type=float, default=60.0,
+                                   help='Longest gap between kept fixes in seconds (default: 60)')
+    trajectory_parser.add_argument('--seed', type=int, default=1,
+                                   help='Random seed for the simulated tracks (default: 1)')
+    trajectory_parser.set_defaults(func=benchmark_trajectory)
+
+    reads_parser = subparsers.add_parser('reads',
+                                         help='Peak memory of fetch_all vs iter_batches on a large history table')
+    reads_parser.add_argument('--rows', type=int, default=1000000, help='Rows in the scratch table (default: 1000000)')
+    reads_parser.add_argument('--units', type=int, default=50, help='Distinct unit IDs (default: 50)')
+    reads_parser.add_argument('--batch-size', type=int, default=10000,
+                              help='Rows per batch for iter_batches (default: 10000)')
+    reads_parser.add_argument('--mode', choices=['fetch_all', 'iter_batches'], help=argparse.SUPPRESS)
+    reads_parser.set_defaults(func=benchmark_reads)
+
+    history_parser = subparsers.add_parser('history',
+                                           help='History queries before vs after the partitioned layout (PostgreSQL)')
+    history_parser.add_argument('--rows', type=int, default=5000000, help='Speed samples per table (default: 5000000)')
+    history_parser.add_argument('--units', type=int, default=200, help='Distinct units (default: 200)')
+    history_parser.add_argument('--days', type=int, default=30, help='Days covered by the samples (default: 30)')
+    history_parser.add_argument('--repeat', type=int, default=5,
+                                help='Runs per query, the median is reported (default: 5)')
+    history_parser.set_defaults(func=benchmark_history)
+
+    ids_parser = subparsers.add_parser('ids', help='Insert throughput with uuid4 vs time-ordered (UUIDv7) primary keys')
+    ids_parser.add_argument('--rows', type=int, default=10000000, help='Rows to insert per ID kind (default: 10000000)')
+    ids_parser.add_argument('--units', type=int, default=200, help='Distinct units (default: 200)')
+    ids_parser.add_argument('--batch-size', type=int, default=10000, help='Rows per copy_rows call (default: 10000)')
+    ids_parser.add_argument('--report-every', type=int, default=1000000,
+                            help='Rows between throughput lines (default: 1000000)')
+    ids_parser.set_defaults(func=benchmark_ids)
+
+    rollups_parser = subparsers.add_parser('rollups',
+                                           help='Rollup window cost per sample and rows per day vs raw history')
+    rollups_parser.add_argument('--units', type=int, default=200, help='Distinct units (default: 200)')
+    rollups_parser.add_argument('--interval', type=int, default=5,
+                                help='Seconds between samples of a unit (default: 5)')
+    rollups_parser.add_argument('--flush-interval', type=int, default=60,
+                                help='Seconds of recorded time between flushes (default: 60)')
+    rollups_parser.set_defaults(func=benchmark_rollups)
+
+    metrics_parser = subparsers.add_parser('metrics', help='Per-message cost of the writer metrics and of a scrape')
+    metrics_parser.add_argument('--messages', type=int, default=1000000, help='Messages to record (default: 1000000)')
+    metrics_parser.add_argument('--units', type=int, default=200, help='Distinct units (default: 200)')
+    metrics_parser.set_defaults(func=benchmark_metrics)
+
+    logging_parser = subparsers.add_parser('logging',
+                                           help='Per-message logging cost: print() vs queued, rate-limited records')
+    logging_parser.add_argument('--messages', type=int, default=200000, help='Messages to log (default: 200000)')
+    logging_parser.add_argument('--units', type=int, default=200, help='Distinct units (default: 200)')
+    logging_parser.add_argument('--queue-size', type=int, default=10000,
+                                help='Records queued before dropping (default: 10000)')
+    logging_parser.set_defaults(func=benchmark_logging)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Script to apply the pending schema migrations in src/Database/migrations.
+
+Each migration runs once, in its own transaction, and is recorded in the
+"SchemaMigrations" table. Migrations require PostgreSQL.
+"""
+
+import os
+import sys
+import argparse
+import logging
+from dotenv import load_dotenv
+
+# Add the src directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from Services.DatabaseConnection import DatabaseConnection
+from Services.SchemaMigrator import SchemaMigrator
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Apply the pending schema migrations')
+    parser.add_argument('--target', type=int, help='Last migration version to apply (default: all)')
+    parser.add_argument('--list', action='store_true', help='Only list the pending migrations')
+    args = parser.parse_args()
+    # Show the migrations as they are applied
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        print("DATABASE_URL not found in environment variables")
+        return
+
+    db = DatabaseConnection(db_url)
+    try:
+        migrator = SchemaMigrator(db)
+        if args.list:
+            pending = migrator.pending()
+            for version, name, _ in pending:
+                print(f"⏳ {version:03d} {name}")
+            print(f"{len(pending)} pending migrations")
+            return
+        applied = migrator.migrate(args.target)
+        print(f"✅ {len(applied)} migrations applied")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,37 @@ import random
 import time
 import json
 import argparse
+import os
+import sys
 
-def simulate_unit_data(client, unit_number, delay=2):
+# The packed formats are defined by the writer (src/Schemas/TelemetryFrame.py)
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+# Packed payload field of each simulated parameter
+PACKED_FIELDS = {
+    'Combustible': 'fuel_level',
+    'Velocidad': 'current_speed',
+    'RPM': 'rpm',
+    'Temperatura': 'temperature',
+    'Latitud': 'latitude',
+    'Longitud': 'longitude',
+}
+
+def unit_topic(unit_number, parameter, legacy=False):
+    """Topic of a unit parameter: fleet/<unit>/<param>, or the legacy U<unit>_<param>"""
+    if legacy:
+        return f"U{unit_number}_{parameter}"
+    return f"fleet/{unit_number}/{parameter}"
+
+def packed_message(unit_number, values, packed):
+    """Topic and payload carrying every value of a cycle in one message ('json' or 'frame')"""
+    from Schemas.TelemetryFrame import TelemetryFrame
+    fields = {PACKED_FIELDS[name]: value for name, value in values.items()}
+    if packed == 'frame':
+        return f"fleet/{unit_number}/frame", TelemetryFrame.encode(time.time(), fields)
+    return f"fleet/{unit_number}/packed", TelemetryFrame.encode_json(time.time(), fields)
+
+def simulate_unit_data(client, unit_number, delay=2, legacy=False, packed=None):
     """Simulate telemetry data for a specific unit"""
     
     topics_and_ranges = {
@@ -26,9 +55,9 @@ def simulate_unit_data(client, unit_number, delay=2):
     while True:
         try:
             # Generate random values for each parameter
+            values = {}
             for topic_suffix, (min_val, max_val) in topics_and_ranges.items():
-                # Use the original format with underscore: U1_Combustible
-                topic = f"U{unit_number}_{topic_suffix}"
+                topic = unit_topic(unit_number, topic_suffix, legacy)
                 
                 if topic_suffix in ['Latitud', 'Longitud']:
                     # GPS coordinates with more precision
@@ -40,6 +69,10 @@ def simulate_unit_data(client, unit_number, delay=2):
                     # Float values with 1 decimal
                     value = round(random.uniform(min_val, max_val), 1)
                 
+                if packed:
+                    values[topic_suffix] = value
+                    continue
+                
                 # Publish the value
                 result = client.publish(topic, str(value))
                 if result.rc == 0:
@@ -50,9 +83,18 @@ def simulate_unit_data(client, unit_number, delay=2):
                 # Small delay between topics
                 time.sleep(0.1)
             
+            if packed:
+                # Every value of the cycle in one publish
+                topic, payload = packed_message(unit_number, values, packed)
+                result = client.publish(topic, payload)
+                if result.rc == 0:
+                    print(f"✅ Published: {topic} ({len(payload)} bytes, {len(values)} values)")
+                else:
+                    print(f"❌ Failed to publish: {topic} (rc: {result.rc})")
+            
             # Occasionally simulate panic button (rare event)
             if random.random() < 0.05:  # 5% chance
-                panic_topic = f"U{unit_number}_Panic"
+                panic_topic = unit_topic(unit_number, 'Panic', legacy)
                 panic_value = "1"
                 result = client.publish(panic_topic, panic_value)
                 print(f"🚨 Published: {panic_topic} = {panic_value}")
@@ -72,6 +114,43 @@ def simulate_unit_data(client, unit_number, delay=2):
             print(f"Error in simulation: {e}")
             time.sleep(1)
 
+def publish_burst(client, units, cycles, legacy=False, packed=None):
+    """Publish `cycles` full telemetry cycles for every unit as fast as possible.
+    
+    Used to benchmark the writer's ingest throughput. With `packed` ('json' or
+    'frame') each cycle is a single message per unit. The client's network loop
+    must be running. Returns the number of messages published.
+    """
+    topics_and_ranges = {
+        'Combustible': (0, 100),
+        'Velocidad': (0, 120),
+        'RPM': (600, 3000),
+        'Temperatura': (70, 110),
+        'Latitud': (19.4, 19.5),
+        'Longitud': (-99.2, -99.1),
+    }
+    published = 0
+    info = None
+    for _ in range(cycles):
+        for unit_number in units:
+            values = {}
+            for topic_suffix, (min_val, max_val) in topics_and_ranges.items():
+                value = round(random.uniform(min_val, max_val), 6 if topic_suffix in ['Latitud', 'Longitud'] else 1)
+                if packed:
+                    values[topic_suffix] = value
+                    continue
+                # QoS 1 so the broker does not shed the burst
+                info = client.publish(unit_topic(unit_number, topic_suffix, legacy), str(value), qos=1)
+                published += 1
+            if packed:
+                topic, payload = packed_message(unit_number, values, packed)
+                info = client.publish(topic, payload, qos=1)
+                published += 1
+    # QoS 1 messages are delivered in order: once the last one is acknowledged, all are
+    if info is not None:
+        info.wait_for_publish()
+    return published
+
 def on_connect(client, userdata, flags, reason_code, properties):
     if reason_code.is_failure:
         print(f"Failed to connect: {reason_code}")
@@ -85,9 +164,28 @@ def main():
     parser.add_argument('--port', type=int, default=1883, help='MQTT broker port (default: 1883)')
     parser.add_argument('--delay', type=int, default=2, help='Delay between cycles in seconds (default: 2)')
     parser.add_argument('--all-units', action='store_true', help='Simulate all units (1, 2, 3)')
+    parser.add_argument('--burst', type=int, default=0,
+                        help='Publish this many cycles for units 1-3 without delays, then exit (default: off)')
+    parser.add_argument('--legacy-topics', action='store_true',
+                        help='Publish on U<unit>_<param> instead of fleet/<unit>/<param>')
+    parser.add_argument('--packed', choices=['json', 'frame'],
+                        help='Publish each cycle as one packed message on fleet/<unit>/packed (json) '
+                             'or fleet/<unit>/frame (binary)')
     
     args = parser.parse_args()
     
+    if args.burst:
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        client.on_connect = on_connect
+        client.connect(args.host, args.port, 60)
+        client.loop_start()
+        start = time.time()
+        published = publish_burst(client, [1, 2, 3], args.burst, args.legacy_topics, args.packed)
+        print(f"🚀 Published {published} messages in {time.time() - start:.2f}s")
+        client.loop_stop()
+        client.disconnect()
+        return
+    
     if args.all_units:
         import threading
         
@@ -96,7 +194,7 @@ def main():
             client.on_connect = on_connect
             client.connect(args.host, args.port, 60)
             client.loop_start()
-            simulate_unit_data(client, unit_num, args.delay)
+            simulate_unit_data(client, unit_num, args.delay, args.legacy_topics, args.packed)
             client.disconnect()
         
         print("Starting simulation for all units (1, 2, 3)")
@@ -124,7 +222,7 @@ def main():
         client.connect(args.host, args.port, 60)
         client.loop_start()
         
-        simulate_unit_data(client, args.unit, args.delay)
+        simulate_unit_data(client, args.unit, args.delay, args.legacy_topics, args.packed)
         
         client.disconnect()
 
@@ -0,0 +1,85 @@
+-- Partition "SpeedHistory" and "LocationHistory" by day on "recorded_at".
+--
+-- The tables are rebuilt as declaratively partitioned tables (one partition per day,
+-- plus a default partition for rows without a usable "recorded_at"), the stored rows
+-- are copied into them, and the old tables are dropped. The primary key of a
+-- partitioned table must contain the partition key, so it becomes (id, recorded_at).
+--
+-- Indexes: B-tree on ("unit_id", "recorded_at") for "unit X over a time range" and
+-- "latest fixes per unit", BRIN on "recorded_at" for range scans over the whole fleet.
+-- Metrics move from numeric to compact fixed-size types.
+--
+-- Later days are created ahead of time by the writer's PartitionManager.
+
+ALTER TABLE "SpeedHistory" RENAME TO "SpeedHistory_unpartitioned";
+ALTER TABLE "LocationHistory" RENAME TO "LocationHistory_unpartitioned";
+
+CREATE TABLE "SpeedHistory" (
+  "speed_id" UUID NOT NULL,
+  "unit_id" UUID REFERENCES "Units" ("unit_id"),
+  "driver_id" UUID REFERENCES "Drivers" ("driver_id"),
+  "speed" real,
+  "recorded_at" timestamp NOT NULL,
+  PRIMARY KEY ("speed_id", "recorded_at")
+) PARTITION BY RANGE ("recorded_at");
+
+CREATE TABLE "LocationHistory" (
+  "location_id" UUID NOT NULL,
+  "unit_id" UUID REFERENCES "Units" ("unit_id"),
+  "driver_id" UUID REFERENCES "Drivers" ("driver_id"),
+  "latitude" double precision,
+  "longitude" double precision,
+  "recorded_at" timestamp NOT NULL,
+  PRIMARY KEY ("location_id", "recorded_at")
+) PARTITION BY RANGE ("recorded_at");
+
+CREATE TABLE "SpeedHistory_default" PARTITION OF "SpeedHistory" DEFAULT;
+CREATE TABLE "LocationHistory_default" PARTITION OF "LocationHistory" DEFAULT;
+
+CREATE INDEX "SpeedHistory_unit_recorded_at" ON "SpeedHistory" ("unit_id", "recorded_at");
+CREATE INDEX "SpeedHistory_recorded_at_brin" ON "SpeedHistory" USING brin ("recorded_at");
+CREATE INDEX "LocationHistory_unit_recorded_at" ON "LocationHistory" ("unit_id", "recorded_at");
+CREATE INDEX "LocationHistory_recorded_at_brin" ON "LocationHistory" USING brin ("recorded_at");
+
+-- One partition per day holding stored rows, through a week from today
+DO $$
+DECLARE
+  history text;
+  first_day date;
+  last_day date;
+BEGIN
+  FOREACH history IN ARRAY ARRAY['SpeedHistory', 'LocationHistory'] LOOP
+    EXECUTE format('SELECT min("recorded_at")::date, max("recorded_at")::date FROM %I', history || '_unpartitioned')
+      INTO first_day, last_day;
+    first_day := LEAST(COALESCE(first_day, current_date), current_date);
+    last_day := GREATEST(COALESCE(last_day, current_date), current_date) + 7;
+    FOR day IN 0 .. last_day - first_day LOOP
+      EXECUTE format(
+        'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+        history || '_p' || to_char(first_day + day, 'YYYYMMDD'), history, first_day + day, first_day + day + 1
+      );
+    END LOOP;
+  END LOOP;
+END $$;
+
+-- Rows without a recorded time keep their place in the default partition, stamped with the epoch
+INSERT INTO "SpeedHistory" ("speed_id", "unit_id", "driver_id", "speed", "recorded_at")
+SELECT "speed_id", "unit_id", "driver_id", "speed"::real, COALESCE("recorded_at", 'epoch')
+FROM "SpeedHistory_unpartitioned";
+
+INSERT INTO "LocationHistory" ("location_id", "unit_id", "driver_id", "latitude", "longitude", "recorded_at")
+SELECT "location_id", "unit_id", "driver_id", "latitude"::double precision, "longitude"::double precision,
+       COALESCE("recorded_at", 'epoch')
+FROM "LocationHistory_unpartitioned";
+
+DROP TABLE "SpeedHistory_unpartitioned";
+DROP TABLE "LocationHistory_unpartitioned";
+
+-- Hot "Units" metrics in compact types ("rpm" stays integer: a faulty sensor may report more than 32767)
+ALTER TABLE "Units"
+  ALTER COLUMN "fuel_level" TYPE real,
+  ALTER COLUMN "current_speed" TYPE real,
+  ALTER COLUMN "temperature" TYPE smallint;
+
+ANALYZE "SpeedHistory";
+ANALYZE "LocationHistory";
@@ -0,0 +1,55 @@
+-- Minute and hour rollups of the numeric telemetry, maintained by the writer.
+--
+-- One row per unit, parameter ("fuel_level", "current_speed", "rpm", "temperature")
+-- and bucket start, with min/max/sum/count and the last value of the bucket. The
+-- writer upserts partial buckets and merges them with the stored row, so the
+-- average is "sum_value" / "sample_count" (also stored as "avg_value").
+--
+-- "MinuteRollup" grows with the fleet like the history, so it is partitioned by day
+-- on "bucket" and its partitions follow the same maintenance and retention. "HourRollup"
+-- is 60 times smaller and kept whole.
+
+CREATE TABLE "MinuteRollup" (
+  "unit_id" UUID NOT NULL REFERENCES "Units" ("unit_id"),
+  "parameter" varchar(32) NOT NULL,
+  "bucket" timestamp NOT NULL,
+  "min_value" real,
+  "max_value" real,
+  "sum_value" double precision,
+  "sample_count" integer,
+  "avg_value" double precision GENERATED ALWAYS AS ("sum_value" / NULLIF("sample_count", 0)) STORED,
+  "last_value" real,
+  "last_at" timestamp,
+  PRIMARY KEY ("unit_id", "parameter", "bucket")
+) PARTITION BY RANGE ("bucket");
+
+CREATE TABLE "MinuteRollup_default" PARTITION OF "MinuteRollup" DEFAULT;
+
+CREATE TABLE "HourRollup" (
+  "unit_id" UUID NOT NULL REFERENCES "Units" ("unit_id"),
+  "parameter" varchar(32) NOT NULL,
+  "bucket" timestamp NOT NULL,
+  "min_value" real,
+  "max_value" real,
+  "sum_value" double precision,
+  "sample_count" integer,
+  "avg_value" double precision GENERATED ALWAYS AS ("sum_value" / NULLIF("sample_count", 0)) STORED,
+  "last_value" real,
+  "last_at" timestamp,
+  PRIMARY KEY ("unit_id", "parameter", "bucket")
+);
+
+-- Fleet-wide charts scan a time range for one parameter
+CREATE INDEX "MinuteRollup_parameter_bucket" ON "MinuteRollup" ("parameter", "bucket");
+CREATE INDEX "HourRollup_parameter_bucket" ON "HourRollup" ("parameter", "bucket");
+
+-- One partition per day from yesterday through a week from today
+DO $$
+BEGIN
+  FOR day IN -1 .. 7 LOOP
+    EXECUTE format(
+      'CREATE TABLE %I PARTITION OF "MinuteRollup" FOR VALUES FROM (%L) TO (%L)',
+      'MinuteRollup_p' || to_char(current_date + day, 'YYYYMMDD'), current_date + day, current_date + day + 1
+    );
+  END LOOP;
+END $$;
@@ -0,0 +1,22 @@
+-- Per-field freshness of "Units".
+--
+-- "updated_at" is the newest time across every field of a unit, so comparing it alone
+-- lets a field with a later sample block a newer value of another field (fuel at t-10,
+-- speed at t, then fuel at t-1 was dropped). Each telemetry field gets the time of its
+-- own value, and the writer keeps, column by column, the newer of the stored and the
+-- incoming value. Writers started before this migration keep comparing "updated_at".
+
+ALTER TABLE "Units"
+  ADD COLUMN "fuel_level_at" timestamp,
+  ADD COLUMN "current_speed_at" timestamp,
+  ADD COLUMN "panic_button_active_at" timestamp,
+  ADD COLUMN "rpm_at" timestamp,
+  ADD COLUMN "temperature_at" timestamp;
+
+-- Stored values are at least as old as the row
+UPDATE "Units" SET
+  "fuel_level_at" = CASE WHEN "fuel_level" IS NOT NULL THEN "updated_at" END,
+  "current_speed_at" = CASE WHEN "current_speed" IS NOT NULL THEN "updated_at" END,
+  "panic_button_active_at" = CASE WHEN "panic_button_active" IS NOT NULL THEN "updated_at" END,
+  "rpm_at" = CASE WHEN "rpm" IS NOT NULL THEN "updated_at" END,
+  "temperature_at" = CASE WHEN "temperature" IS NOT NULL THEN "updated_at" END;
@@ -0,0 +1,383 @@
+import asyncio
+import datetime
+import logging
+import time
+
+from Services import AsyncDatabaseConnection
+from Schemas.Writer import MQTTToDatabaseWriter, tracer
+from Schemas.DailyReportAggregator import DailyReportAggregator
+from Schemas.RollupAggregator import RollupAggregator
+from Schemas.RuleEngine import RuleEngine
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncMQTTToDatabaseWriter(MQTTToDatabaseWriter):
+    """
+    An asyncio variant of MQTTToDatabaseWriter.
+
+    Receiving and writing run as two tasks on one event loop: the receive task reads
+    messages from an aiomqtt client and routes them, the write task collects them into
+    batches and writes each batch in one asyncpg transaction. A slow query only delays
+    the write task; the receive task keeps reading while the write is in flight.
+
+    The two tasks are connected by a bounded asyncio.Queue. When the database falls
+    behind and the queue fills up, the receive task waits on it instead of dropping
+    messages, and incoming messages accumulate in aiomqtt's own queue, which is bounded
+    to the same size. Only messages beyond both bounds are discarded (by aiomqtt).
+
+    Topic routing, the "Units" and history buffers, location pairing and the unit
+    registry are inherited, so both writers produce the same rows. Every batch is
+    committed on its own; commit_policy and history_async_commit only apply to the
+    synchronous writer. The unit registry keeps using the synchronous connection,
+    refreshed off the event loop. Alerts are published with the receiving aiomqtt client.
+
+    Attributes:
+    - async_db (AsyncDatabaseConnection): The asyncpg pool used for the batch writes.
+    - queue_size (int): Maximum number of messages waiting to be written.
+    - flush_size (int): Number of queued messages that triggers a database write.
+    - flush_interval (float): Maximum time in seconds a message waits before being written.
+    - reconnect_interval (float): Seconds to wait before reconnecting to the MQTT broker.
+    - received (int): Number of messages routed and queued.
+    - waited (int): Number of messages that had to wait for room in the queue.
+    - flushed (int): Number of messages written to the database.
+    - batches (int): Number of batches written to the database.
+
+    Methods:
+    - start(endpoint, port, keep_alive): Run the writer until interrupted.
+    - run(endpoint, port, keep_alive): Coroutine running the receive and write tasks.
+    - stop(): Ask a running writer to flush its queue and return; safe from any thread.
+    - close(): Release the database connections.
+    """
+    _STOP = object()
+
+    def __init__(self, topic: str, url: str, table_name: str, columns: list,
+                 queue_size: int = 10000, flush_size: int = 500, flush_interval: float = 0.5,
+                 reconnect_interval: float = 5.0, db_options: dict = None, **options):
+        """
+        Initialize the AsyncMQTTToDatabaseWriter.
+
+        Parameters:
+        - topic (str): The MQTT topic to subscribe to.
+        - url (str): The database URL to connect to (PostgreSQL).
+        - table_name (str): The name of the database table to write data to.
+        - columns (list): The list of columns in the database table.
+        - queue_size (int): Maximum number of messages waiting to be written.
+        - flush_size (int): Number of queued messages that triggers a database write.
+        - flush_interval (float): Maximum time in seconds a message waits before being written.
+        - reconnect_interval (float): Seconds to wait before reconnecting to the MQTT broker.
+        - db_options (dict): Connection pool options; pool_size and statement_cache also size the asyncpg pool.
+        - options: Remaining MQTTToDatabaseWriter options (location pairing, unit registry).
+        """
+        super().__init__(topic, url, table_name, columns, queue_size=queue_size, flush_size=flush_size,
+                         flush_interval=flush_interval, db_options=db_options, **options)
+        db_options = db_options or {}
+        self.async_db = AsyncDatabaseConnection(
+            url,
+            pool_size=db_options.get('pool_size', 5),
+            statement_cache=db_options.get('statement_cache', True)
+        )
+        self.queue_size = queue_size
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval
+        self.reconnect_interval = reconnect_interval
+
+        self._queue = None
+        self._loop = None
+        self._receiver = None
+        self._stopping = False
+        self._client = None
+        self._publishing = set()
+
+        self.received = 0
+        self.waited = 0
+        self.flushed = 0
+        self.batches = 0
+
+    def start(self, endpoint: str, port: int, keep_alive: int = 60):
+        """
+        Run the writer on a new event loop until it is stopped or interrupted.
+
+        Parameters:
+        - endpoint (str): The MQTT broker endpoint to connect to.
+        - port (int): The port number of the MQTT broker.
+        - keep_alive (int): MQTT keep alive in seconds.
+
+        Returns:
+        - None
+        """
+        asyncio.run(self.run(endpoint, port, keep_alive))
+
+    async def run(self, endpoint: str, port: int, keep_alive: int = 60):
+        """
+        Receive and write messages until stop() is called or the task is cancelled.
+
+        The queue is drained and the pending rows written before returning.
+
+        Parameters:
+        - endpoint (str): The MQTT broker endpoint to connect to.
+        - port (int): The port number of the MQTT broker.
+        - keep_alive (int): MQTT keep alive in seconds.
+
+        Returns:
+        - None
+        """
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._stopping = False
+        await self.async_db.open()
+        writer = asyncio.create_task(self._write_loop())
+        self._receiver = asyncio.create_task(self._receive_loop(endpoint, port, keep_alive))
+        try:
+            await self._receiver
+        except asyncio.CancelledError:
+            # Cancelled from outside (e.g. Ctrl+C under asyncio.run): propagate once drained
+            if not self._stopping:
+                raise
+        finally:
+            # The stop sentinel may wait for room like any message: the writer is still draining
+            await self._queue.put(self._STOP)
+            await writer
+            self._queue_location_rows(self.location_pairer.expire())
+            logger.info("📍 Location pairing: %s", self.location_pairer.stats())
+            await self._write_pending_async(self._take_pending(final=True))
+            logger.info("🕒 Reordering: %s, units: %s", self.reorder.stats(), self.unit_state.stats())
+            if self.daily_reports is not None:
+                logger.info("📊 Daily reports: %s", self.daily_reports.stats())
+            if self.rollups is not None:
+                logger.info("📈 Rollups: %s", self.rollups.stats())
+            if self.rules is not None:
+                logger.info("🚨 Notifications: %s", self.rules.stats())
+            await self.async_db.close()
+            logger.info("⚡ Async writer: %d received, %d waited for queue room, %d written in %d batches",
+                        self.received, self.waited, self.flushed, self.batches)
+
+    def stop(self):
+        """
+        Ask a running writer to stop receiving, flush its queue and return from run().
+
+        Returns:
+        - None
+        """
+        if self._loop is not None and self._receiver is not None:
+            self._stopping = True
+            self._loop.call_soon_threadsafe(self._receiver.cancel)
+
+    def close(self):
+        """
+        Release the database connections once run() has returned.
+
+        Returns:
+        - None
+        """
+        if self.partitions is not None:
+            self.partitions.stop()
+        logger.info("🐘 Database pool: %s", self.db.pool_stats())
+        self.db.close()
+
+    async def _receive_loop(self, endpoint, port, keep_alive):
+        """
+        Read messages from the broker and queue them, reconnecting on connection loss.
+
+        aiomqtt is imported here so the synchronous writer does not depend on it.
+        """
+        import aiomqtt
+        topics = self.subscription_topics(self.subscribed_units, self.legacy_topics)
+        while True:
+            try:
+                logger.info("Connecting to MQTT broker at %s:%s", endpoint, port)
+                async with aiomqtt.Client(endpoint, port, keepalive=keep_alive) as client:
+                    async with client.messages(queue_maxsize=self.queue_size) as messages:
+                        await client.subscribe([(topic, 0) for topic in topics])
+                        logger.info("🚐 Subscribed to %d topic filters, ready to receive vehicle telemetry data!",
+                                    len(topics))
+                        self._client = client
+                        try:
+                            async for message in messages:
+                                await self._receive(message.topic.value, message.payload)
+                        finally:
+                            self._client = None
+            except aiomqtt.MqttError as e:
+                logger.warning("❌ MQTT connection lost (%s), reconnecting in %ss", e, self.reconnect_interval)
+                await asyncio.sleep(self.reconnect_interval)
+
+    async def _receive(self, topic, payload):
+        """
+        Route one message and queue it, waiting for room if the writer is behind.
+
+        Parameters:
+        - topic (str): The MQTT topic.
+        - payload (bytes): The raw message payload.
+        """
+        try:
+            metrics = self.metrics
+            if metrics is not None:
+                self._messages_received.inc()
+            route = self.router.resolve(topic)
+            if route is None:
+                if metrics is not None:
+                    self._messages_dropped.inc(('', 'unroutable'))
+                logger.warning("❌ Could not route topic (unknown format, unit or parameter): %s", topic)
+                return
+            if metrics is not None:
+                self._messages_parsed.inc(route.parameter)
+                self._unit_messages.inc(route.unit_number)
+            received_at = datetime.datetime.now()
+            item = (route, payload if route.binary else payload.decode('utf-8'), received_at)
+            if route.unit_number in self.trace_units:
+                tracer.debug("📨 Received %s: %r", topic, item[1],
+                             extra={'unit': route.unit_number, 'parameter': route.parameter})
+            try:
+                self._queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self.waited += 1
+                await self._queue.put(item)
+            self.received += 1
+            self.last_message_time = received_at
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("💥 Error processing message: %s", e)
+
+    async def _write_loop(self):
+        """
+        Collect queued messages into batches and write them until the stop sentinel.
+        """
+        stopping = False
+        while not stopping:
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                await self._housekeeping_async()
+                continue
+            if item is self._STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(batch) < self.flush_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._write_batch_async(batch)
+            await self._housekeeping_async()
+
+    async def _write_batch_async(self, batch):
+        """
+        Apply a batch to the in-memory buffers and write the resulting rows in one transaction.
+
+        Parameters:
+        - batch (list): Tuples of (route, payload, received_at) queued by _receive
+        """
+        if self.metrics is not None:
+            self._batch_messages.observe(len(batch))
+        try:
+            self._apply(batch)
+            await self._write_pending_async(self._take_pending())
+            self._observe_committed()
+            logger.debug("✅ Data written to database (%d messages)", len(batch))
+        except Exception as e:
+            logger.exception("💥 Error flushing batch of %d messages: %s", len(batch), e)
+        self.flushed += len(batch)
+        self.batches += 1
+
+    async def _housekeeping_async(self):
+        """
+        Write the history rows whose reorder window elapsed, and refresh the unit
+        registry off the event loop when it is due.
+        """
+        try:
+            await self._write_pending_async(self._take_pending())
+            await asyncio.to_thread(self.units.refresh_if_due)
+        except Exception as e:
+            logger.exception("💥 Error in writer housekeeping: %s", e)
+
+    async def _write_pending_async(self, writes):
+        """
+        Write drained rows in one transaction, falling back to one row per transaction.
+
+        Parameters:
+        - writes (list): (table, rows) pairs returned by _take_pending
+
+        Returns:
+        - bool: True if everything was written in one transaction
+        """
+        if not writes:
+            return True
+        try:
+            async with self.async_db.transaction() as conn:
+                await self._write_rows_async(conn, writes)
+                # The transaction commits when the block exits
+                started = time.perf_counter()
+            if self.metrics is not None:
+                self._commit_seconds.observe(time.perf_counter() - started)
+            return True
+        except Exception as e:
+            logger.warning("⚠️ Batch write failed (%s), retrying row by row", e)
+
+        for table, rows in writes:
+            for row in rows:
+                try:
+                    async with self.async_db.transaction() as conn:
+                        await self._write_rows_async(conn, [(table, [row])])
+                except Exception as e:
+                    logger.error("❌ Dropped %s row: %s", table, e)
+        return False
+
+    def _queue_depth(self):
+        """Return the number of messages waiting in the asyncio queue"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _publish_alert(self, unit_id, rule, value, detail, recorded_at):
+        """
+        Publish an alert with the aiomqtt client in a background task, if connected to the broker.
+        """
+        if self._client is None:
+            return
+        topic, payload = self._alert_message(unit_id, rule, value, detail, recorded_at)
+        task = self._loop.create_task(self._client.publish(topic, payload, qos=1))
+        # Keep a reference until the task is done, and report failures instead of losing them
+        self._publishing.add(task)
+        task.add_done_callback(self._published)
+
+    def _published(self, task):
+        """Forget a finished alert publication, reporting its failure"""
+        self._publishing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("❌ Alert not published: %s", task.exception())
+
+    async def _write_rows_async(self, conn, writes):
+        """
+        Issue the statements for drained rows: one upsert for "Units", "DailyReport" and each
+        rollup table, one COPY per history table and for "Notifications".
+
+        Parameters:
+        - conn (asyncpg.Connection): The connection of the open transaction
+        - writes (list): (table, rows) pairs returned by _take_pending
+        """
+        for table, rows in writes:
+            started = time.perf_counter()
+            if table == 'Units':
+                await self.async_db.upsert_rows(conn, 'Units', rows, conflict_columns=['unit_id'],
+                                                **self._prepare_unit_rows(rows))
+            elif table == 'DailyReport':
+                await self.async_db.upsert_rows(conn, 'DailyReport', rows, conflict_columns=['daily_report_id'],
+                                                update_columns=DailyReportAggregator.UPDATE_COLUMNS)
+            elif table in RollupAggregator.TABLES:
+                await self.async_db.upsert_rows(conn, table, rows, conflict_columns=RollupAggregator.CONFLICT_COLUMNS,
+                                                update_columns=[], merge_columns=RollupAggregator.MERGE_COLUMNS)
+            elif table == 'Notifications':
+                await self.async_db.copy_rows(conn, table, RuleEngine.COLUMNS, rows, skip_duplicates=True)
+            else:
+                await self.async_db.copy_rows(conn, table, self.HISTORY_COLUMNS[table], rows, skip_duplicates=True)
+            if self.metrics is not None:
+                self._statement_seconds.observe(time.perf_counter() - started, table)
@@ -0,0 +1,472 @@
+import datetime
+import logging
+import math
+import time
+import uuid
+
+import polars as pl
+
+logger = logging.getLogger(__name__)
+
+
+class DailyReportAggregator:
+    """
+    Incrementally maintain one "DailyReport" row per unit and day from the history stream.
+
+    Speed samples and location fixes are folded into a small per-unit state as they are
+    written, in recorded-time order, so the report never needs a scan over the history:
+    - max_speed: speed_id of the fastest SpeedHistory sample of the day.
+    - speed_limit_reached: times the speed went above `speed_limit`.
+    - conduction_time: seconds driven, i.e. time between consecutive speed samples
+      (at most `max_gap` apart) while the earlier one was at least `moving_speed`.
+    - sudden_accelerations / sudden_brakes: times the speed rose / fell faster than
+      the threshold, in km/h per second, between consecutive samples.
+    - sudden_turns: times the heading changed faster than `turn_threshold` degrees per
+      second. Headings come from consecutive fixes at least `min_turn_distance` meters apart.
+    Each event is counted once when it starts, not once per sample.
+
+    Dirty reports are handed out for an upsert every `flush_interval` seconds, and a
+    day's final report as soon as the unit's first sample of the next day arrives. The
+    previous day stays open, so the speed and location streams of a unit can each
+    finish their day on their own schedule.
+    Report IDs are derived from the unit and day, so upserts are idempotent and a
+    restarted writer picks up the counts stored so far (see load()). Samples older than
+    the unit's current state are ignored; rebuild() recomputes whole days from history
+    with one vectorized Polars pass, using the same rules, for backfills.
+
+    Attributes:
+    - speed_limit (float): Speed in km/h above which the limit counts as reached.
+    - moving_speed (float): Speed in km/h from which the unit counts as driving.
+    - acceleration_threshold (float): Speed gain in km/h per second that counts as a sudden acceleration.
+    - brake_threshold (float): Speed loss in km/h per second that counts as a sudden brake.
+    - turn_threshold (float): Heading change in degrees per second that counts as a sudden turn.
+    - min_turn_distance (float): Meters between two fixes for their heading to be used.
+    - max_gap (float): Seconds between two samples beyond which they are not compared.
+    - flush_interval (float): Seconds between upserts of an updated report.
+    - reports_written (int): Report rows handed out for writing.
+    - late (int): Samples ignored because they were older than the unit's state or day.
+
+    Methods:
+    - report_id(unit_id, day): Return the deterministic DailyReport ID of a unit and day.
+    - load(db): Load the reports stored recently so a restarted writer keeps counting from them.
+    - add_speeds(rows): Fold SpeedHistory rows into the reports.
+    - add_locations(rows): Fold LocationHistory rows into the reports.
+    - take_rows(now): Return the report rows due for an upsert.
+    - rebuild(speeds, locations): Compute report rows from history frames in one pass.
+    - backfill(db, day): Rebuild the reports of one day from history and upsert them.
+    - stats(): Return the aggregation counters.
+    """
+    NAMESPACE = uuid.UUID('6ba7b810-9dad-11d1-80b4-00c04fd430c8')
+
+    # Columns refreshed by every upsert (created_at is only written on insert)
+    UPDATE_COLUMNS = ['max_speed', 'speed_limit_reached', 'conduction_time', 'sudden_accelerations',
+                      'sudden_brakes', 'sudden_turns', 'updated_at']
+    COUNTERS = ('speed_limit_reached', 'sudden_accelerations', 'sudden_brakes', 'sudden_turns')
+
+    # Meters per degree of latitude
+    METERS_PER_DEGREE = math.radians(1) * 6371008.8
+
+    class _Report:
+        """Running report of one unit for one day"""
+        __slots__ = ('unit_id', 'day', 'report_id', 'max_speed', 'max_speed_id', 'speed_limit_reached',
+                     'conduction_time', 'sudden_accelerations', 'sudden_brakes', 'sudden_turns',
+                     'speed', 'speed_at', 'speeding', 'accelerating', 'braking',
+                     'latitude', 'longitude', 'fix_at', 'heading', 'heading_at', 'turning',
+                     'created_at', 'dirty', 'flushed_at')
+
+        def __init__(self, unit_id, day, report_id):
+            self.unit_id = unit_id
+            self.day = day
+            self.report_id = report_id
+            self.max_speed = None
+            self.max_speed_id = None
+            self.speed_limit_reached = 0
+            self.conduction_time = 0.0
+            self.sudden_accelerations = 0
+            self.sudden_brakes = 0
+            self.sudden_turns = 0
+            self.speed = self.speed_at = None
+            self.speeding = self.accelerating = self.braking = False
+            self.latitude = self.longitude = self.fix_at = None
+            self.heading = self.heading_at = None
+            self.turning = False
+            self.created_at = datetime.datetime.now()
+            self.dirty = False
+            self.flushed_at = time.monotonic()
+
+    def __init__(self, speed_limit: float = 80.0, moving_speed: float = 5.0, acceleration_threshold: float = 10.0,
+                 brake_threshold: float = 12.0, turn_threshold: float = 30.0, min_turn_distance: float = 5.0,
+                 max_gap: float = 120.0, flush_interval: float = 60.0):
+        """
+        Initialize the DailyReportAggregator.
+
+        Parameters:
+        - speed_limit (float): Speed in km/h above which the limit counts as reached.
+        - moving_speed (float): Speed in km/h from which the unit counts as driving.
+        - acceleration_threshold (float): Speed gain in km/h per second that counts as a sudden acceleration.
+        - brake_threshold (float): Speed loss in km/h per second that counts as a sudden brake.
+        - turn_threshold (float): Heading change in degrees per second that counts as a sudden turn.
+        - min_turn_distance (float): Meters between two fixes for their heading to be used.
+        - max_gap (float): Seconds between two samples beyond which they are not compared.
+        - flush_interval (float): Seconds between upserts of an updated report.
+        """
+        self.speed_limit = speed_limit
+        self.moving_speed = moving_speed
+        self.acceleration_threshold = acceleration_threshold
+        self.brake_threshold = brake_threshold
+        self.turn_threshold = turn_threshold
+        self.min_turn_distance = min_turn_distance
+        self.max_gap = max_gap
+        self.flush_interval = flush_interval
+
+        # unit_id -> _Report of the unit's latest day, and of the day before
+        self._reports = {}
+        self._previous = {}
+        # Final rows of days that rolled over, waiting to be written
+        self._closed = []
+        # daily_report_id -> stored counts loaded by load()
+        self._stored = {}
+
+        self.reports_written = 0
+        self.late = 0
+
+    @classmethod
+    def report_id(cls, unit_id: str, day: datetime.date) -> str:
+        """
+        Return the deterministic DailyReport ID of a unit and day.
+
+        Parameters:
+        - unit_id (str): The unit UUID.
+        - day (datetime.date): The report day.
+
+        Returns:
+        - str: The daily_report_id.
+        """
+        return str(uuid.uuid5(cls.NAMESPACE, f"daily_report:{unit_id}:{day.isoformat()}"))
+
+    def load(self, db) -> bool:
+        """
+        Load the reports updated in the last two days, so a restarted writer keeps
+        counting from the stored values instead of overwriting them.
+
+        Parameters:
+        - db (DatabaseConnection): The database connection.
+
+        Returns:
+        - bool: True if the reports were loaded, False if the query failed.
+        """
+        try:
+            df = db.fetch_frame(
+                'SELECT d."daily_report_id", d."max_speed", s."speed" AS "max_speed_value", '
+                'd."speed_limit_reached", d."conduction_time", d."sudden_accelerations", '
+                'd."sudden_brakes", d."sudden_turns" '
+                'FROM "DailyReport" d LEFT JOIN "SpeedHistory" s ON s."speed_id" = d."max_speed" '
+                'WHERE d."updated_at" >= :since',
+                {'since': datetime.datetime.now() - datetime.timedelta(days=2)}
+            )
+        except Exception as e:
+            logger.error("Error loading daily reports: %s", e)
+            return False
+        self._stored = {str(row['daily_report_id']): row for row in df.iter_rows(named=True)}
+        return True
+
+    def add_speeds(self, rows):
+        """
+        Fold SpeedHistory rows into the reports.
+
+        Parameters:
+        - rows (iterable): (speed_id, unit_id, speed, recorded_at) rows in recorded-time order per unit.
+        """
+        for speed_id, unit_id, speed, recorded_at in rows:
+            if speed is None:
+                continue
+            report = self._report(unit_id, recorded_at)
+            if report is None:
+                continue
+            if report.speed_at is not None:
+                if recorded_at <= report.speed_at:
+                    self.late += 1
+                    continue
+                elapsed = (recorded_at - report.speed_at).total_seconds()
+                accelerating = braking = False
+                if elapsed <= self.max_gap:
+                    if report.speed >= self.moving_speed:
+                        report.conduction_time += elapsed
+                    rate = (speed - report.speed) / elapsed
+                    accelerating = rate >= self.acceleration_threshold
+                    braking = rate <= -self.brake_threshold
+                if accelerating and not report.accelerating:
+                    report.sudden_accelerations += 1
+                if braking and not report.braking:
+                    report.sudden_brakes += 1
+                report.accelerating, report.braking = accelerating, braking
+            speeding = speed > self.speed_limit
+            if speeding and not report.speeding:
+                report.speed_limit_reached += 1
+            report.speeding = speeding
+            if report.max_speed is None or speed > report.max_speed:
+                report.max_speed, report.max_speed_id = speed, speed_id
+            report.speed, report.speed_at = speed, recorded_at
+            report.dirty = True
+
+    def add_locations(self, rows):
+        """
+        Fold LocationHistory rows into the reports.
+
+        Parameters:
+        - rows (iterable): (location_id, unit_id, latitude, longitude, recorded_at) rows, in recorded-time
+          order per unit.
+        """
+        for _, unit_id, latitude, longitude, recorded_at in rows:
+            if latitude is None or longitude is None:
+                continue
+            report = self._report(unit_id, recorded_at)
+            if report is None:
+                continue
+            if report.fix_at is not None:
+                if recorded_at <= report.fix_at:
+                    self.late += 1
+                    continue
+                dx = (longitude - report.longitude) * math.cos(math.radians(report.latitude)) * self.METERS_PER_DEGREE
+                dy = (latitude - report.latitude) * self.METERS_PER_DEGREE
+                if math.hypot(dx, dy) >= self.min_turn_distance:
+                    heading = math.degrees(math.atan2(dx, dy)) % 360
+                    turning = False
+                    if report.heading is not None:
+                        elapsed = (recorded_at - report.heading_at).total_seconds()
+                        if elapsed <= self.max_gap:
+                            change = abs((heading - report.heading + 180) % 360 - 180)
+                            turning = change / elapsed >= self.turn_threshold
+                    if turning and not report.turning:
+                        report.sudden_turns += 1
+                        report.dirty = True
+                    report.turning = turning
+                    report.heading, report.heading_at = heading, recorded_at
+            report.latitude, report.longitude, report.fix_at = latitude, longitude, recorded_at
+
+    def take_rows(self, now: float = None) -> list:
+        """
+        Return the report rows due for an upsert: days that rolled over, and updated
+        reports not written for `flush_interval` seconds.
+
+        Parameters:
+        - now (float): The current time.monotonic(); None returns every updated report.
+
+        Returns:
+        - list: "DailyReport" rows as dicts.
+        """
+        rows, self._closed = self._closed, []
+        for reports in (self._previous, self._reports):
+            for report in reports.values():
+                if report.dirty and (now is None or now - report.flushed_at >= self.flush_interval):
+                    rows.append(self._row(report))
+                    report.dirty = False
+                    report.flushed_at = now if now is not None else time.monotonic()
+        self.reports_written += len(rows)
+        return rows
+
+    def rebuild(self, speeds: pl.DataFrame, locations: pl.DataFrame) -> list:
+        """
+        Compute report rows from history in one vectorized pass per table.
+
+        Parameters:
+        - speeds (pl.DataFrame): SpeedHistory columns speed_id, unit_id, speed, recorded_at.
+        - locations (pl.DataFrame): LocationHistory columns unit_id, latitude, longitude, recorded_at.
+
+        Returns:
+        - list: "DailyReport" rows as dicts, one per unit and day present in the history.
+        """
+        group = ['unit_id', 'day']
+        now = datetime.datetime.now()
+
+        speed_reports = pl.DataFrame(schema={'unit_id': pl.Utf8, 'day': pl.Date})
+        if len(speeds):
+            speed_reports = (
+                self._timestamps(speeds).lazy()
+                .filter(pl.col('speed').is_not_null())
+                .with_columns(pl.col('unit_id').cast(pl.Utf8), pl.col('speed').cast(pl.Float64),
+                              day=pl.col('recorded_at').dt.date())
+                .unique(subset=['unit_id', 'recorded_at'], keep='first', maintain_order=True)
+                .sort(['unit_id', 'recorded_at'])
+                .with_columns(
+                    elapsed=(pl.col('recorded_at').diff().dt.total_milliseconds() / 1000).over(group),
+                    previous=pl.col('speed').shift(1).over(group),
+                )
+                .with_columns(
+                    compared=pl.col('elapsed') <= self.max_gap,
+                    rate=(pl.col('speed') - pl.col('previous')) / pl.col('elapsed'),
+                    speeding=pl.col('speed') > self.speed_limit,
+                )
+                .with_columns(
+                    accelerating=(pl.col('compared')
+                                  & (pl.col('rate') >= self.acceleration_threshold)).fill_null(False),
+                    braking=(pl.col('compared') & (pl.col('rate') <= -self.brake_threshold)).fill_null(False),
+                    driving=(pl.col('compared') & (pl.col('previous') >= self.moving_speed)).fill_null(False),
+                )
+                .group_by(group)
+                .agg(
+                    max_speed=pl.col('speed_id').cast(pl.Utf8).get(pl.col('speed').arg_max()),
+                    speed_limit_reached=self._starts('speeding'),
+                    conduction_time=pl.col('elapsed').filter(pl.col('driving')).sum(),
+                    sudden_accelerations=self._starts('accelerating'),
+                    sudden_brakes=self._starts('braking'),
+                )
+                .collect()
+            )
+
+        turn_reports = pl.DataFrame(schema={'unit_id': pl.Utf8, 'day': pl.Date})
+        if len(locations):
+            turn_reports = (
+                self._timestamps(locations).lazy()
+                .filter(pl.col('latitude').is_not_null() & pl.col('longitude').is_not_null())
+                .with_columns(pl.col('unit_id').cast(pl.Utf8), pl.col('latitude').cast(pl.Float64),
+                              pl.col('longitude').cast(pl.Float64), day=pl.col('recorded_at').dt.date())
+                .unique(subset=['unit_id', 'recorded_at'], keep='first', maintain_order=True)
+                .sort(['unit_id', 'recorded_at'])
+                .with_columns(
+                    dx=((pl.col('longitude') - pl.col('longitude').shift(1))
+                        * pl.col('latitude').shift(1).radians().cos() * self.METERS_PER_DEGREE).over(group),
+                    dy=((pl.col('latitude') - pl.col('latitude').shift(1)) * self.METERS_PER_DEGREE).over(group),
+                )
+                .filter((pl.col('dx') ** 2 + pl.col('dy') ** 2).sqrt() >= self.min_turn_distance)
+                .with_columns(heading=self._wrap(pl.arctan2(pl.col('dx'), pl.col('dy')).degrees()))
+                .with_columns(
+                    change=(self._wrap(pl.col('heading') - pl.col('heading').shift(1) + 180) - 180).abs().over(group),
+                    elapsed=(pl.col('recorded_at').diff().dt.total_milliseconds() / 1000).over(group),
+                )
+                .with_columns(
+                    turning=((pl.col('elapsed') <= self.max_gap)
+                             & (pl.col('change') / pl.col('elapsed') >= self.turn_threshold)).fill_null(False)
+                )
+                .group_by(group)
+                .agg(sudden_turns=self._starts('turning'))
+                .collect()
+            )
+
+        reports = speed_reports
+        if len(turn_reports):
+            reports = speed_reports.join(turn_reports, on=group, how='outer_coalesce')
+        rows = []
+        for report in reports.iter_rows(named=True):
+            rows.append({
+                'daily_report_id': self.report_id(report['unit_id'], report['day']),
+                'unit': report['unit_id'],
+                'max_speed': report.get('max_speed'),
+                'speed_limit_reached': report.get('speed_limit_reached') or 0,
+                'conduction_time': round(report.get('conduction_time') or 0.0, 3),
+                'sudden_accelerations': report.get('sudden_accelerations') or 0,
+                'sudden_brakes': report.get('sudden_brakes') or 0,
+                'sudden_turns': report.get('sudden_turns') or 0,
+                'created_at': now,
+                'updated_at': now,
+            })
+        return rows
+
+    def backfill(self, db, day: datetime.date) -> int:
+        """
+        Rebuild the reports of one day from history and upsert them, replacing the stored counts.
+
+        Parameters:
+        - db (DatabaseConnection): The database connection.
+        - day (datetime.date): The day to rebuild.
+
+        Returns:
+        - int: Number of reports written.
+        """
+        start = datetime.datetime.combine(day, datetime.time())
+        bounds = {'start': start, 'end': start + datetime.timedelta(days=1)}
+        speeds = db.fetch_frame(
+            'SELECT "speed_id", "unit_id", "speed", "recorded_at" FROM "SpeedHistory" '
+            'WHERE "recorded_at" >= :start AND "recorded_at" < :end', bounds
+        )
+        locations = db.fetch_frame(
+            'SELECT "unit_id", "latitude", "longitude", "recorded_at" FROM "LocationHistory" '
+            'WHERE "recorded_at" >= :start AND "recorded_at" < :end', bounds
+        )
+        rows = self.rebuild(speeds, locations)
+        if rows and not db.upsert_rows('DailyReport', rows, conflict_columns=['daily_report_id'],
+                                       update_columns=self.UPDATE_COLUMNS, keep_existing_on_null=False):
+            raise RuntimeError(f"Could not write the daily reports of {day}")
+        return len(rows)
+
+    def stats(self) -> dict:
+        """
+        Return the aggregation counters.
+
+        Returns:
+        - dict: Reports written, late samples ignored and reports in progress.
+        """
+        return {'reports_written': self.reports_written, 'late': self.late, 'open': len(self._reports)}
+
+    @staticmethod
+    def _wrap(degrees: pl.Expr) -> pl.Expr:
+        """
+        Wrap angles into [0, 360); Polars' % keeps the sign of the dividend.
+        """
+        return degrees - 360 * (degrees / 360).floor()
+
+    @staticmethod
+    def _timestamps(frame: pl.DataFrame) -> pl.DataFrame:
+        """
+        Parse recorded_at if the driver returned it as text (SQLite).
+        """
+        if frame.schema['recorded_at'] == pl.Utf8:
+            return frame.with_columns(pl.col('recorded_at').str.to_datetime())
+        return frame
+
+    @staticmethod
+    def _starts(flag: str) -> pl.Expr:
+        """
+        Count the rows where a flag turns on, i.e. the events rather than the samples in them.
+        """
+        return (pl.col(flag) & ~pl.col(flag).shift(1).fill_null(False)).sum()
+
+    def _report(self, unit_id, recorded_at):
+        """
+        Return the running report of a unit for the sample's day, rolling over to a new
+        day when needed; None if the sample is older than the previous day.
+        """
+        day = recorded_at.date()
+        report = self._reports.get(unit_id)
+        if report is not None and report.day == day:
+            return report
+        previous = self._previous.get(unit_id)
+        if previous is not None and previous.day == day:
+            return previous
+        if report is not None and report.day > day:
+            self.late += 1
+            return None
+        if report is not None:
+            # The finished day is written now and stays open for the other stream
+            for finished in (previous, report):
+                if finished is not None and finished.dirty:
+                    self._closed.append(self._row(finished))
+                    finished.dirty = False
+            self._previous[unit_id] = report
+        report = self._reports[unit_id] = self._Report(unit_id, day, self.report_id(unit_id, day))
+        stored = self._stored.pop(report.report_id, None)
+        if stored is not None:
+            # Continue from the counts a previous run wrote for this day
+            for counter in self.COUNTERS:
+                setattr(report, counter, stored[counter] or 0)
+            report.conduction_time = float(stored['conduction_time'] or 0)
+            report.max_speed_id = stored['max_speed'] and str(stored['max_speed'])
+            report.max_speed = float(stored['max_speed_value']) if stored['max_speed_value'] is not None else None
+        return report
+
+    def _row(self, report):
+        """
+        Build the "DailyReport" row of a running report.
+        """
+        return {
+            'daily_report_id': report.report_id,
+            'unit': report.unit_id,
+            'max_speed': report.max_speed_id,
+            'speed_limit_reached': report.speed_limit_reached,
+            'conduction_time': round(report.conduction_time, 3),
+            'sudden_accelerations': report.sudden_accelerations,
+            'sudden_brakes': report.sudden_brakes,
+            'sudden_turns': report.sudden_turns,
+            'created_at': report.created_at,
+            'updated_at': datetime.datetime.now(),
+        }
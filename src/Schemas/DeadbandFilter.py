@@ -0,0 +1,133 @@
+import datetime
+
+
+class DeadbandFilter:
+    """
+    Suppress telemetry values that have not meaningfully changed since the last one written.
+
+    The last value written is cached per unit and field. A new value is skipped when it
+    is within the field's deadband of that value, unless `max_silence` seconds (of
+    recorded time) have passed since it was written: the heartbeat keeps "Units".updated_at
+    and the history fresh for parked vehicles. A value is within the deadband when
+
+        abs(value - last) <= max(absolute[field], relative * abs(last))
+
+    With no bands configured only exact repeats are skipped. Non-numeric values (the
+    panic button) are skipped only when equal. Values recorded before the cached one
+    are passed through untouched, so late samples are left to the "Units" freshness guard.
+
+    Attributes:
+    - absolute (dict): Field -> absolute deadband, in the field's unit.
+    - relative (float): Deadband as a fraction of the last value, for every numeric field.
+    - max_silence (datetime.timedelta): Longest gap between two written values of a field.
+    - written (dict): Field -> number of values passed.
+    - suppressed (dict): Field -> number of values skipped.
+
+    Methods:
+    - parse_bands(spec): Parse "field=band,..." into an absolute deadband dict.
+    - accept(unit_id, field, value, timestamp): Check whether a value should be written.
+    - accept_many(unit_id, fields, timestamp): Return the fields of a packed update that should be written.
+    - stats(): Return the written and suppressed counts per field.
+    """
+    def __init__(self, absolute: dict = None, relative: float = 0.0, max_silence: float = 60.0):
+        """
+        Initialize the DeadbandFilter.
+
+        Parameters:
+        - absolute (dict): Field -> absolute deadband, e.g. {'fuel_level': 0.5, 'rpm': 50}.
+        - relative (float): Deadband as a fraction of the last value (0.01 = 1%).
+        - max_silence (float): Seconds after which a value is written even if unchanged.
+        """
+        self.absolute = absolute or {}
+        self.relative = relative
+        self.max_silence = datetime.timedelta(seconds=max_silence)
+
+        # (unit_id, field) -> (value, timestamp) last written
+        self._last = {}
+
+        self.written = {}
+        self.suppressed = {}
+
+    @staticmethod
+    def parse_bands(spec: str) -> dict:
+        """
+        Parse an absolute deadband specification such as "fuel_level=0.5,rpm=50".
+
+        Parameters:
+        - spec (str): Comma separated field=band pairs; empty for none.
+
+        Returns:
+        - dict: Field -> band.
+        """
+        bands = {}
+        for part in spec.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            field, _, band = part.partition('=')
+            try:
+                bands[field.strip()] = float(band)
+            except ValueError:
+                raise ValueError(f"Invalid deadband: {part!r}. Expected field=number")
+        return bands
+
+    def accept(self, unit_id: str, field: str, value, timestamp: datetime.datetime) -> bool:
+        """
+        Check whether a value should be written, and remember it if so.
+
+        Parameters:
+        - unit_id (str): The unit UUID.
+        - field (str): The field name ("Units" column).
+        - value: The new value.
+        - timestamp (datetime.datetime): When the value was recorded.
+
+        Returns:
+        - bool: True to write the value, False to skip it.
+        """
+        key = (unit_id, field)
+        last = self._last.get(key)
+        if last is not None:
+            last_value, last_time = last
+            if timestamp < last_time:
+                return True
+            if timestamp - last_time < self.max_silence and not self._changed(field, last_value, value):
+                self.suppressed[field] = self.suppressed.get(field, 0) + 1
+                return False
+        self._last[key] = (value, timestamp)
+        self.written[field] = self.written.get(field, 0) + 1
+        return True
+
+    def accept_many(self, unit_id: str, fields: dict, timestamp: datetime.datetime) -> dict:
+        """
+        Return the fields of a packed update that should be written.
+
+        Parameters:
+        - unit_id (str): The unit UUID.
+        - fields (dict): Field -> new value.
+        - timestamp (datetime.datetime): When the values were recorded.
+
+        Returns:
+        - dict: The fields to write.
+        """
+        return {field: value for field, value in fields.items() if self.accept(unit_id, field, value, timestamp)}
+
+    def stats(self) -> dict:
+        """
+        Return the written and suppressed counts per field.
+
+        Returns:
+        - dict: Field -> {'written': n, 'suppressed': n}.
+        """
+        return {
+            field: {'written': self.written.get(field, 0), 'suppressed': self.suppressed.get(field, 0)}
+            for field in sorted(set(self.written) | set(self.suppressed))
+        }
+
+    def _changed(self, field, last_value, value):
+        """
+        Check whether a value is outside the deadband of the last written one.
+        """
+        if value is None or last_value is None or isinstance(value, bool) or isinstance(last_value, bool):
+            return value != last_value
+        delta = abs(value - last_value)
+        return delta > max(self.absolute.get(field, 0.0), self.relative * abs(last_value))
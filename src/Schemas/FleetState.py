@@ -0,0 +1,225 @@
+import collections
+import datetime
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class FleetState:
+    """
+    The latest known state of every unit, kept in memory by the writer.
+
+    Each unit is one record with __slots__ holding the "Units" telemetry columns and
+    the last location. Values are applied as soon as the writer accepts them (before
+    they reach the database), so readers see millisecond-fresh data without querying
+    PostgreSQL. Stale values are filtered out upstream by the UnitStateBuffer; late
+    locations are ignored here.
+
+    Every change bumps a global version and stamps it on the record. Records are kept
+    in change order, so changes(since) only walks the units changed after `since`.
+    The writer thread updates the state while HTTP threads read it, under one lock held
+    for in-memory copies only.
+
+    Attributes:
+    - version (int): Version of the last change.
+    - started_at (datetime.datetime): When this state was created; versions restart with the process.
+    - number_of (callable): Unit UUID -> unit number, set by the writer (optional).
+
+    Methods:
+    - load(db): Seed the state from the "Units" table and the last stored locations.
+    - update(unit_id, fields, timestamp): Apply accepted "Units" values.
+    - update_location(unit_id, latitude, longitude, timestamp): Apply a location fix.
+    - snapshot(): Return every unit.
+    - changes(since): Return the units changed after a version.
+    - routes(): Return the HttpEndpoint routes serving the state.
+    """
+    FIELDS = ('fuel_level', 'current_speed', 'panic_button_active', 'rpm', 'temperature')
+
+    class _Unit:
+        """Latest state of one unit"""
+        __slots__ = ('unit_id', 'fuel_level', 'current_speed', 'panic_button_active', 'rpm', 'temperature',
+                     'latitude', 'longitude', 'updated_at', 'located_at', 'version')
+
+        def __init__(self, unit_id):
+            self.unit_id = unit_id
+            self.fuel_level = self.current_speed = self.panic_button_active = self.rpm = self.temperature = None
+            self.latitude = self.longitude = None
+            self.updated_at = self.located_at = None
+            self.version = 0
+
+    def __init__(self):
+        """
+        Initialize an empty FleetState.
+        """
+        # unit_id -> _Unit, least recently changed first
+        self._units = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.version = 0
+        self.started_at = datetime.datetime.now()
+        self.number_of = None
+
+    def __len__(self):
+        return len(self._units)
+
+    def load(self, db, location_age: float = 86400) -> bool:
+        """
+        Seed the state from the "Units" table and the last stored location of each unit.
+
+        Parameters:
+        - db (DatabaseConnection): The database connection.
+        - location_age (float): Only look for locations recorded in the last this many seconds.
+
+        Returns:
+        - bool: True if the state was loaded, False if a query failed.
+        """
+        try:
+            units = db.fetch_frame(
+                'SELECT "unit_id", "fuel_level", "current_speed", "panic_button_active", "rpm", "temperature", '
+                '"updated_at" FROM "Units"'
+            )
+            locations = db.fetch_latest(
+                'LocationHistory', n=1, columns=['latitude', 'longitude'],
+                since=datetime.datetime.now() - datetime.timedelta(seconds=location_age)
+            )
+        except Exception as e:
+            logger.error("Error loading fleet state: %s", e)
+            return False
+
+        with self._lock:
+            for row in units.iter_rows(named=True):
+                record = self._record(str(row['unit_id']))
+                for field in self.FIELDS:
+                    setattr(record, field, self._plain(row[field]))
+                record.updated_at = self._timestamp(row['updated_at'])
+            for row in locations.iter_rows(named=True):
+                record = self._record(str(row['unit_id']))
+                record.latitude = self._plain(row['latitude'])
+                record.longitude = self._plain(row['longitude'])
+                record.located_at = self._timestamp(row['recorded_at'])
+        return True
+
+    def update(self, unit_id: str, fields: dict, timestamp: datetime.datetime):
+        """
+        Apply "Units" values accepted by the writer.
+
+        Parameters:
+        - unit_id (str): The unit UUID.
+        - fields (dict): "Units" column -> new value.
+        - timestamp (datetime.datetime): When the values were recorded.
+        """
+        with self._lock:
+            record = self._record(unit_id)
+            for field, value in fields.items():
+                setattr(record, field, value)
+            if record.updated_at is None or timestamp > record.updated_at:
+                record.updated_at = timestamp
+
+    def update_location(self, unit_id: str, latitude: float, longitude: float, timestamp: datetime.datetime):
+        """
+        Apply a location fix, unless a newer one is already known.
+
+        Parameters:
+        - unit_id (str): The unit UUID.
+        - latitude (float): The latitude, or None if only the longitude is known.
+        - longitude (float): The longitude, or None if only the latitude is known.
+        - timestamp (datetime.datetime): When the fix was recorded.
+        """
+        with self._lock:
+            record = self._units.get(unit_id)
+            if record is not None and record.located_at is not None and timestamp < record.located_at:
+                return
+            record = self._record(unit_id)
+            if latitude is not None:
+                record.latitude = latitude
+            if longitude is not None:
+                record.longitude = longitude
+            record.located_at = timestamp
+
+    def snapshot(self) -> dict:
+        """
+        Return every unit.
+
+        Returns:
+        - dict: {'version', 'started_at', 'units': [unit dicts]}.
+        """
+        return self.changes(0)
+
+    def changes(self, since: int) -> dict:
+        """
+        Return the units changed after a version.
+
+        A `since` greater than the current version comes from an earlier process (versions
+        restart with the writer), so every unit is returned.
+
+        Parameters:
+        - since (int): The version of the last response the client applied.
+
+        Returns:
+        - dict: {'version', 'started_at', 'units': [unit dicts changed after since]}.
+        """
+        with self._lock:
+            version = self.version
+            if since > version:
+                since = 0
+            changed = []
+            for record in reversed(self._units.values()):
+                if record.version <= since:
+                    break
+                changed.append(tuple(getattr(record, name) for name in self._Unit.__slots__))
+        number_of = self.number_of
+        units = []
+        for values in reversed(changed):
+            unit = dict(zip(self._Unit.__slots__, values))
+            unit['unit_number'] = number_of(unit['unit_id']) if number_of else None
+            for name in ('updated_at', 'located_at'):
+                if unit[name] is not None:
+                    unit[name] = unit[name].isoformat()
+            units.append(unit)
+        return {'version': version, 'started_at': self.started_at.isoformat(), 'units': units}
+
+    def routes(self) -> dict:
+        """
+        Return the HttpEndpoint routes serving the state.
+
+        GET /units returns every unit; GET /units?since=<version> only the units changed
+        after that version.
+
+        Returns:
+        - dict: Path -> handler.
+        """
+        def units(query):
+            since = query.get('since')
+            return self.changes(int(since)) if since else self.snapshot()
+        return {'/units': units}
+
+    def _record(self, unit_id):
+        """
+        Return the record of a unit, marked as the latest change; call with the lock held.
+        """
+        record = self._units.get(unit_id)
+        if record is None:
+            record = self._units[unit_id] = self._Unit(unit_id)
+        else:
+            self._units.move_to_end(unit_id)
+        self.version += 1
+        record.version = self.version
+        return record
+
+    @staticmethod
+    def _plain(value):
+        """
+        Convert a database value (e.g. a numeric Decimal) to a JSON friendly one.
+        """
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        return float(value)
+
+    @staticmethod
+    def _timestamp(value):
+        """
+        Convert a stored timestamp (a string on SQLite) to a datetime.
+        """
+        if isinstance(value, str):
+            return datetime.datetime.fromisoformat(value)
+        return value
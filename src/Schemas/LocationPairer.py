@@ -0,0 +1,134 @@
+import datetime
+import time
+
+
+class LocationPairer:
+    """
+    Join the latitude and longitude halves of a position fix into one location row.
+
+    Coordinates arrive on separate topics. The first half received for a unit waits
+    here until the opposite half arrives within `window` seconds, then both are
+    emitted together. Halves that never find a partner become orphans and are either
+    emitted on their own or dropped, according to `orphan_policy`. At most one half
+    is kept per unit, so memory is bounded by the number of active units.
+
+    Pairing compares the recorded (device) timestamps of the two halves, while expiry
+    counts how long a half has been waiting here, so replayed fixes with old
+    timestamps still get a chance to pair.
+
+    Attributes:
+    - window (datetime.timedelta): Maximum time between the two halves of a fix.
+    - wait (float): Seconds a half waits for its partner before it becomes an orphan.
+    - orphan_policy (str): 'flush' to write unpaired halves, 'drop' to discard them.
+    - pairs (int): Number of complete positions emitted.
+    - orphans_flushed (int): Number of unpaired halves emitted on their own.
+    - orphans_dropped (int): Number of unpaired halves discarded.
+
+    Methods:
+    - add(unit_id, coord_type, value, timestamp): Offer one coordinate, returning any rows ready to write.
+    - expire(now): Release the halves that have waited longer than the pairing window.
+    - stats(): Return the pairing counters.
+    """
+    ORPHAN_POLICIES = ('flush', 'drop')
+
+    def __init__(self, window: float = 2.0, orphan_policy: str = 'flush'):
+        """
+        Initialize the LocationPairer.
+
+        Parameters:
+        - window (float): Maximum time in seconds between the two halves of a fix.
+        - orphan_policy (str): 'flush' to write unpaired halves, 'drop' to discard them.
+        """
+        if orphan_policy not in self.ORPHAN_POLICIES:
+            raise ValueError(f"Unknown orphan policy: {orphan_policy}. Expected one of {self.ORPHAN_POLICIES}")
+        self.window = datetime.timedelta(seconds=window)
+        self.wait = window
+        self.orphan_policy = orphan_policy
+
+        # unit_id -> (coord_type, value, timestamp, time.monotonic() on arrival)
+        self._pending = {}
+
+        self.pairs = 0
+        self.orphans_flushed = 0
+        self.orphans_dropped = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, unit_id: str, coord_type: str, value, timestamp: datetime.datetime) -> list:
+        """
+        Offer one coordinate for a unit.
+
+        Parameters:
+        - unit_id (str): The unit UUID.
+        - coord_type (str): 'latitude' or 'longitude'.
+        - value (float): The coordinate value.
+        - timestamp (datetime.datetime): When the coordinate was recorded.
+
+        Returns:
+        - list: Tuples of (unit_id, latitude, longitude, recorded_at) ready to be written.
+        """
+        rows = []
+        pending = self._pending.pop(unit_id, None)
+        if pending is not None:
+            pending_type, pending_value, pending_time, _ = pending
+            if pending_type != coord_type and abs(timestamp - pending_time) <= self.window:
+                self.pairs += 1
+                if coord_type == 'latitude':
+                    rows.append((unit_id, value, pending_value, pending_time))
+                else:
+                    rows.append((unit_id, pending_value, value, pending_time))
+                return rows
+            # Same coordinate twice or a stale partner: the pending half is an orphan
+            self._release_orphan(unit_id, pending, rows)
+
+        self._pending[unit_id] = (coord_type, value, timestamp, time.monotonic())
+        return rows
+
+    def expire(self, now: float = None) -> list:
+        """
+        Release the halves that have waited longer than the pairing window.
+
+        Parameters:
+        - now (float): The current time.monotonic(); None releases every pending half.
+
+        Returns:
+        - list: Tuples of (unit_id, latitude, longitude, recorded_at) for orphans kept by the policy.
+        """
+        rows = []
+        if now is None:
+            expired = list(self._pending)
+        else:
+            cutoff = now - self.wait
+            expired = [unit_id for unit_id, (_, _, _, arrived) in self._pending.items() if arrived < cutoff]
+        for unit_id in expired:
+            self._release_orphan(unit_id, self._pending.pop(unit_id), rows)
+        return rows
+
+    def stats(self) -> dict:
+        """
+        Return the pairing counters.
+
+        Returns:
+        - dict: Counts of pairs, flushed and dropped orphans, and halves still waiting.
+        """
+        return {
+            'pairs': self.pairs,
+            'orphans_flushed': self.orphans_flushed,
+            'orphans_dropped': self.orphans_dropped,
+            'pending': len(self._pending),
+        }
+
+    def _release_orphan(self, unit_id, pending, rows):
+        """
+        Apply the orphan policy to an unpaired half.
+        """
+        coord_type, value, timestamp, _ = pending
+        if self.orphan_policy == 'drop':
+            self.orphans_dropped += 1
+            return
+        self.orphans_flushed += 1
+        if coord_type == 'latitude':
+            rows.append((unit_id, value, None, timestamp))
+        else:
+            rows.append((unit_id, None, value, timestamp))
@@ -0,0 +1,151 @@
+import datetime
+import heapq
+import itertools
+import time
+
+
+class ReorderBuffer:
+    """
+    Hold history rows for a bounded window so they are written in recorded-time order,
+    without duplicates.
+
+    Rows are kept per (table, unit) in a heap ordered by their recorded timestamp. A
+    row is released once the unit has produced a sample `window` seconds newer than it
+    (the unit's watermark), or once the unit has been quiet for `window` seconds of
+    wall-clock time. Watermarks follow each unit's own timestamps, so a vehicle
+    replaying hours of buffered data at full speed is sorted just like a live one.
+
+    A row with the same unit and recorded timestamp as one still held, or released
+    within the last window, is a duplicate (e.g. a redelivered message) and is dropped.
+    A row older than what its unit has already released is late: it is still written,
+    in the next release, and counted.
+
+    Attributes:
+    - window (datetime.timedelta): How far behind a unit's newest sample a row may arrive and still be sorted.
+    - hold (float): Seconds a quiet unit's rows are held before they are released anyway.
+    - reordered (int): Rows that arrived behind a newer row of the same unit.
+    - duplicates (int): Rows dropped as duplicates.
+    - late (int): Rows that arrived after their slot had been released.
+    - held (int): Rows currently held; safe to read from another thread.
+
+    Methods:
+    - add(table, unit_id, recorded_at, row): Hold a row until it can be released in order.
+    - release(now): Return the rows that are ready, per table, in recorded-time order.
+    - stats(): Return the reordering counters.
+    """
+    class _Stream:
+        """Rows held for one unit of one table"""
+        __slots__ = ('heap', 'held', 'recent', 'newest', 'released', 'arrived')
+
+        def __init__(self):
+            self.heap = []
+            # recorded timestamps held, and released within the last window
+            self.held = set()
+            self.recent = set()
+            self.newest = None
+            self.released = None
+            self.arrived = 0.0
+
+    def __init__(self, window: float = 2.0):
+        """
+        Initialize the ReorderBuffer.
+
+        Parameters:
+        - window (float): Seconds of reordering tolerance; 0 only sorts and deduplicates within a batch.
+        """
+        self.window = datetime.timedelta(seconds=window)
+        self.hold = window
+
+        # (table, unit_id) -> _Stream
+        self._streams = {}
+        self._sequence = itertools.count()
+
+        self.reordered = 0
+        self.duplicates = 0
+        self.late = 0
+        # Kept by add() and release() so readers on other threads never iterate _streams
+        self.held = 0
+
+    def __len__(self):
+        return self.held
+
+    def add(self, table: str, unit_id: str, recorded_at: datetime.datetime, row: tuple) -> bool:
+        """
+        Hold a row until it can be released in order.
+
+        Parameters:
+        - table (str): The history table the row belongs to.
+        - unit_id (str): The unit UUID.
+        - recorded_at (datetime.datetime): When the sample was recorded.
+        - row (tuple): The row to write.
+
+        Returns:
+        - bool: False if the row was dropped as a duplicate.
+        """
+        key = (table, unit_id)
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = self._streams[key] = self._Stream()
+        if recorded_at in stream.held or recorded_at in stream.recent:
+            self.duplicates += 1
+            return False
+        if stream.released is not None and recorded_at <= stream.released:
+            self.late += 1
+        if stream.newest is None or recorded_at >= stream.newest:
+            stream.newest = recorded_at
+        else:
+            self.reordered += 1
+        # The sequence number keeps equal-time rows from comparing their tuples
+        heapq.heappush(stream.heap, (recorded_at, next(self._sequence), row))
+        stream.held.add(recorded_at)
+        stream.arrived = time.monotonic()
+        self.held += 1
+        return True
+
+    def release(self, now: float = None) -> dict:
+        """
+        Return the rows that are ready to be written.
+
+        Parameters:
+        - now (float): The current time.monotonic(); None releases every row held.
+
+        Returns:
+        - dict: Table name -> rows, sorted by recorded time within each unit.
+        """
+        released = {}
+        for key, stream in list(self._streams.items()):
+            quiet = now is None or now - stream.arrived >= self.hold
+            heap = stream.heap
+            if heap:
+                watermark = None if quiet else stream.newest - self.window
+                if watermark is None or heap[0][0] <= watermark:
+                    rows = released.setdefault(key[0], [])
+                    while heap and (watermark is None or heap[0][0] <= watermark):
+                        recorded_at, _, row = heapq.heappop(heap)
+                        stream.held.discard(recorded_at)
+                        stream.recent.add(recorded_at)
+                        rows.append(row)
+                        self.held -= 1
+                    if stream.released is None or recorded_at > stream.released:
+                        stream.released = recorded_at
+                    # Only remember released timestamps for one window
+                    horizon = stream.released - self.window
+                    stream.recent = {ts for ts in stream.recent if ts >= horizon}
+            elif quiet:
+                # Nothing held and nothing received for a window: forget the unit
+                del self._streams[key]
+        return released
+
+    def stats(self) -> dict:
+        """
+        Return the reordering counters.
+
+        Returns:
+        - dict: Counts of reordered, duplicate and late rows, and rows still held.
+        """
+        return {
+            'reordered': self.reordered,
+            'duplicates': self.duplicates,
+            'late': self.late,
+            'held': len(self),
+        }
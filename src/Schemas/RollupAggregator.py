@@ -0,0 +1,202 @@
+import datetime
+import time
+
+
+class RollupAggregator:
+    """
+    Downsample the numeric telemetry of every unit into minute and hour rollups.
+
+    Each (unit, parameter) keeps one tumbling window, the minute being filled, with
+    min/max/sum/count and the last value. A sample of a later minute closes the window,
+    so the per-sample cost is a dict lookup and a few comparisons. Samples not newer
+    than the last one seen for their unit and parameter are ignored.
+
+    Every `flush_interval` seconds the windows filled since the previous flush are handed
+    out as "MinuteRollup" rows, and folded by hour into "HourRollup" rows. The rows are
+    deltas: the writer upserts them with MERGE_COLUMNS, which combine them with the
+    stored row of the same bucket (min of mins, sum of sums...). A bucket can thus be
+    flushed in several parts, and a restarted writer adds to the buckets stored before
+    (samples replayed across a restart are counted again). The average is
+    "sum_value" / "sample_count".
+
+    Attributes:
+    - flush_interval (float): Seconds between two flushes.
+    - samples (int): Samples folded into the windows.
+    - late (int): Samples ignored because they were not newer than the last one seen.
+    - rows_written (int): Rollup rows handed out for writing.
+
+    Methods:
+    - add(unit_id, parameter, value, timestamp): Fold one sample into its window.
+    - add_many(unit_id, values, timestamp): Fold the samples of a packed message.
+    - take_rows(now): Return the rollup rows due for an upsert.
+    - stats(): Return the aggregation counters.
+    """
+    # "Units" columns rolled up; the panic button is not numeric
+    PARAMETERS = frozenset(('fuel_level', 'current_speed', 'rpm', 'temperature'))
+
+    TABLES = ('MinuteRollup', 'HourRollup')
+    CONFLICT_COLUMNS = ['unit_id', 'parameter', 'bucket']
+
+    # How a flushed delta combines with the stored row of its bucket
+    MERGE_COLUMNS = {
+        'min_value': 'CASE WHEN EXCLUDED."min_value" < {table}."min_value" '
+                     'THEN EXCLUDED."min_value" ELSE {table}."min_value" END',
+        'max_value': 'CASE WHEN EXCLUDED."max_value" > {table}."max_value" '
+                     'THEN EXCLUDED."max_value" ELSE {table}."max_value" END',
+        'sum_value': '{table}."sum_value" + EXCLUDED."sum_value"',
+        'sample_count': '{table}."sample_count" + EXCLUDED."sample_count"',
+        'last_value': 'CASE WHEN EXCLUDED."last_at" >= {table}."last_at" '
+                      'THEN EXCLUDED."last_value" ELSE {table}."last_value" END',
+        'last_at': 'CASE WHEN EXCLUDED."last_at" >= {table}."last_at" '
+                   'THEN EXCLUDED."last_at" ELSE {table}."last_at" END',
+    }
+
+    class _Window:
+        """Samples of one unit and parameter in one minute, since the last flush"""
+        __slots__ = ('bucket', 'min', 'max', 'sum', 'count', 'last', 'last_at')
+
+        def __init__(self, bucket):
+            self.bucket = bucket
+            self.min = self.max = self.last = self.last_at = None
+            self.sum = 0.0
+            self.count = 0
+
+    def __init__(self, flush_interval: float = 60.0):
+        """
+        Initialize the RollupAggregator.
+
+        Parameters:
+        - flush_interval (float): Seconds between two flushes.
+        """
+        self.flush_interval = flush_interval
+
+        # (unit_id, parameter) -> _Window of the minute being filled
+        self._windows = {}
+        # (unit_id, parameter) -> recorded time of the last sample folded in
+        self._seen = {}
+        # Minute rows of windows closed since the last flush
+        self._closed = []
+        self._next_flush = time.monotonic() + flush_interval
+
+        self.samples = 0
+        self.late = 0
+        self.rows_written = 0
+
+    def add(self, unit_id: str, parameter: str, value, timestamp: datetime.datetime):
+        """
+        Fold one sample into the window of its unit and parameter.
+
+        Parameters:
+        - unit_id (str): The unit UUID.
+        - parameter (str): The "Units" column of the value; others are ignored.
+        - value (float): The sampled value.
+        - timestamp (datetime.datetime): When the value was recorded.
+        """
+        if value is None or parameter not in self.PARAMETERS:
+            return
+        key = (unit_id, parameter)
+        seen = self._seen.get(key)
+        if seen is not None and timestamp <= seen:
+            self.late += 1
+            return
+        self._seen[key] = timestamp
+
+        bucket = timestamp.replace(second=0, microsecond=0)
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = self._Window(bucket)
+        elif window.bucket != bucket:
+            if window.count:
+                self._closed.append(self._row(unit_id, parameter, window))
+            window.__init__(bucket)
+
+        value = float(value)
+        if window.count == 0 or value < window.min:
+            window.min = value
+        if window.count == 0 or value > window.max:
+            window.max = value
+        window.sum += value
+        window.count += 1
+        window.last, window.last_at = value, timestamp
+        self.samples += 1
+
+    def add_many(self, unit_id: str, values: dict, timestamp: datetime.datetime):
+        """
+        Fold the samples of a packed message, all recorded at the same time.
+
+        Parameters:
+        - unit_id (str): The unit UUID.
+        - values (dict): "Units" column -> value.
+        - timestamp (datetime.datetime): When the values were recorded.
+        """
+        for parameter, value in values.items():
+            self.add(unit_id, parameter, value, timestamp)
+
+    def take_rows(self, now: float = None) -> list:
+        """
+        Return the rollup rows filled since the last flush, if the flush interval elapsed.
+
+        Parameters:
+        - now (float): time.monotonic(), or None to flush regardless of the interval.
+
+        Returns:
+        - list: ("MinuteRollup", rows) and ("HourRollup", rows) pairs, rows as column dicts.
+        """
+        if now is not None and now < self._next_flush:
+            return []
+        self._next_flush = (now or time.monotonic()) + self.flush_interval
+
+        minutes, self._closed = self._closed, []
+        for (unit_id, parameter), window in self._windows.items():
+            if window.count:
+                minutes.append(self._row(unit_id, parameter, window))
+                window.__init__(window.bucket)
+        if not minutes:
+            return []
+
+        hours = {}
+        for row in minutes:
+            key = (row['unit_id'], row['parameter'], row['bucket'].replace(minute=0))
+            hour = hours.get(key)
+            if hour is None:
+                hours[key] = dict(row, bucket=key[2])
+                continue
+            hour['min_value'] = min(hour['min_value'], row['min_value'])
+            hour['max_value'] = max(hour['max_value'], row['max_value'])
+            hour['sum_value'] += row['sum_value']
+            hour['sample_count'] += row['sample_count']
+            if row['last_at'] >= hour['last_at']:
+                hour['last_value'], hour['last_at'] = row['last_value'], row['last_at']
+        self.rows_written += len(minutes) + len(hours)
+        return [('MinuteRollup', minutes), ('HourRollup', list(hours.values()))]
+
+    def stats(self) -> dict:
+        """
+        Return the aggregation counters.
+
+        Returns:
+        - dict: samples, late, rows_written and the number of open windows.
+        """
+        return {
+            'samples': self.samples,
+            'late': self.late,
+            'rows_written': self.rows_written,
+            'windows': len(self._windows),
+        }
+
+    @staticmethod
+    def _row(unit_id, parameter, window):
+        """
+        Return the rollup row of a window.
+        """
+        return {
+            'unit_id': unit_id,
+            'parameter': parameter,
+            'bucket': window.bucket,
+            'min_value': window.min,
+            'max_value': window.max,
+            'sum_value': window.sum,
+            'sample_count': window.count,
+            'last_value': window.last,
+            'last_at': window.last_at,
+        }
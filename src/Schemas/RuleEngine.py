@@ -0,0 +1,220 @@
+import datetime
+import functools
+import operator
+import uuid
+
+from Schemas.IdGenerator import IdGenerator
+
+
+class RuleEngine:
+    """
+    Detect alert conditions per unit in memory as telemetry values are applied.
+
+    Rules are compiled once into a field -> rules table of comparison callables, so
+    evaluating a message costs one dict lookup and a few comparisons (the callables are
+    operator partials, which keeps the engine picklable for sharded workers). Built-in rules,
+    each one a "NotificationTypes" row:
+    - panic: the panic button turns on (rising edge).
+    - overspeed: current_speed above speed_limit for `hold` seconds.
+    - overheating: temperature above temperature_limit for `hold` seconds.
+    - high_rpm: rpm above rpm_limit for `rpm_hold` seconds.
+
+    Debounce: a threshold rule fires once when its condition has held long enough and
+    re-arms only after the value drops below the limit minus `hysteresis` (a fraction
+    of the limit); a rule does not fire again for the same unit within `cooldown`
+    seconds. The panic rule re-arms when the button is released, so a chattering input
+    is held back by `panic_hold` (seconds the button must stay pressed) and
+    `panic_cooldown` instead. Times are the samples' recorded times; samples older than the last one
+    seen for a unit and field, and missing (None) values, are ignored.
+
+    Every firing becomes a "Notifications" row and an alert taken by the writer, which
+    publishes it on `alert_topic` (if set) for events at most `alert_max_age` seconds old,
+    so replayed history does not raise live alerts.
+
+    Attributes:
+    - alert_topic (str): Topic template for alerts, e.g. "alerts/{unit}/{rule}"; None to not publish.
+    - alert_max_age (float): Events older than this many seconds are stored but not published.
+    - fired (dict): Rule name -> number of notifications raised.
+
+    Methods:
+    - notification_types(): Return the "NotificationTypes" rows of the rules.
+    - evaluate(unit_id, field, value, timestamp): Run the rules of one field.
+    - evaluate_many(unit_id, fields, timestamp): Run the rules of several fields at once.
+    - take(): Return and clear the pending notification rows and alerts.
+    - stats(): Return the number of notifications raised per rule.
+    """
+    NAMESPACE = uuid.UUID('6ba7b810-9dad-11d1-80b4-00c04fd430c8')
+
+    # "Notifications" columns, in the order of the rows returned by take()
+    COLUMNS = ['notification_id', 'notification_type', 'unit', 'detail', 'created_at']
+
+    class _Rule:
+        """A compiled rule"""
+        __slots__ = ('index', 'name', 'type_id', 'trigger', 'clear', 'hold', 'cooldown', 'detail')
+
+        def __init__(self, index, name, trigger, clear, hold, cooldown, detail):
+            self.index = index
+            self.name = name
+            self.type_id = RuleEngine.type_id(name)
+            self.trigger = trigger
+            self.clear = clear
+            self.hold = hold
+            self.cooldown = cooldown
+            self.detail = detail
+
+    def __init__(self, speed_limit: float = 80.0, temperature_limit: float = 110.0, rpm_limit: float = 4500.0,
+                 hold: float = 3.0, rpm_hold: float = 30.0, hysteresis: float = 0.05, cooldown: float = 300.0,
+                 panic_hold: float = 0.0, panic_cooldown: float = 30.0,
+                 alert_topic: str = None, alert_max_age: float = 60.0):
+        """
+        Initialize the RuleEngine and compile its rules.
+
+        Parameters:
+        - speed_limit (float): Speed in km/h that raises overspeed.
+        - temperature_limit (float): Temperature that raises overheating.
+        - rpm_limit (float): RPM that raises high_rpm.
+        - hold (float): Seconds overspeed and overheating must last before firing.
+        - rpm_hold (float): Seconds the RPM must stay high before firing.
+        - hysteresis (float): Fraction of the limit the value must drop below it to re-arm a rule.
+        - cooldown (float): Minimum seconds between two notifications of a rule for a unit.
+        - panic_hold (float): Seconds the panic button must stay pressed before firing.
+        - panic_cooldown (float): Minimum seconds between two panic notifications for a unit.
+        - alert_topic (str): Topic template for alerts with {unit} and {rule}; None to not publish.
+        - alert_max_age (float): Events older than this many seconds are stored but not published.
+        """
+        self.alert_topic = alert_topic
+        self.alert_max_age = alert_max_age
+
+        def above(limit):
+            # (value > limit, value <= limit re-armed)
+            return functools.partial(operator.lt, limit), functools.partial(operator.ge, limit * (1 - hysteresis))
+
+        rules = [
+            ('panic', 'panic_button_active', operator.truth, operator.not_, panic_hold, panic_cooldown,
+             "Panic button pressed"),
+            ('overspeed', 'current_speed', *above(speed_limit), hold, cooldown,
+             f"Speed {{value}} km/h over the {speed_limit:g} km/h limit"),
+            ('overheating', 'temperature', *above(temperature_limit), hold, cooldown,
+             f"Temperature {{value}} over the {temperature_limit:g} limit"),
+            ('high_rpm', 'rpm', *above(rpm_limit), rpm_hold, cooldown,
+             f"RPM {{value}} over {rpm_limit:g} for {rpm_hold:g} s"),
+        ]
+        self._rules = []
+        self._by_field = {}
+        for index, (name, field, trigger, clear, rule_hold, rule_cooldown, detail) in enumerate(rules):
+            rule = self._Rule(index, name, trigger, clear, rule_hold, rule_cooldown, detail)
+            self._rules.append(rule)
+            self._by_field[field] = self._by_field.get(field, ()) + (rule,)
+
+        # (unit_id, field) -> recorded time of the last sample evaluated
+        self._seen = {}
+        # (unit_id, rule index) -> [condition start, active, last fired]
+        self._state = {}
+
+        self._notifications = []
+        self._alerts = []
+        self.fired = dict.fromkeys((rule.name for rule in self._rules), 0)
+
+    @classmethod
+    def type_id(cls, name: str) -> str:
+        """
+        Return the deterministic "NotificationTypes" ID of a rule.
+
+        Parameters:
+        - name (str): The rule name.
+
+        Returns:
+        - str: The notification_type_id.
+        """
+        return str(uuid.uuid5(cls.NAMESPACE, f"notification_type:{name}"))
+
+    def notification_types(self) -> list:
+        """
+        Return the "NotificationTypes" rows of the rules, to be inserted if missing.
+
+        Returns:
+        - list: Dicts with notification_type_id, notification_value and created_at.
+        """
+        now = datetime.datetime.now()
+        return [{'notification_type_id': rule.type_id, 'notification_value': rule.name, 'created_at': now}
+                for rule in self._rules]
+
+    def evaluate(self, unit_id: str, field: str, value, timestamp: datetime.datetime):
+        """
+        Run the rules of one field on a new value.
+
+        Parameters:
+        - unit_id (str): The unit UUID.
+        - field (str): The "Units" column the value belongs to.
+        - value: The new value.
+        - timestamp (datetime.datetime): When the value was recorded.
+        """
+        rules = self._by_field.get(field)
+        if rules is None or value is None:
+            return
+        key = (unit_id, field)
+        last = self._seen.get(key)
+        if last is not None and timestamp < last:
+            return
+        self._seen[key] = timestamp
+        for rule in rules:
+            state = self._state.get((unit_id, rule.index))
+            if state is None:
+                state = self._state[(unit_id, rule.index)] = [None, False, None]
+            if rule.trigger(value):
+                if state[0] is None:
+                    state[0] = timestamp
+                if (not state[1] and (timestamp - state[0]).total_seconds() >= rule.hold
+                        and (state[2] is None or (timestamp - state[2]).total_seconds() >= rule.cooldown)):
+                    state[1] = True
+                    state[2] = timestamp
+                    self._fire(rule, unit_id, value, timestamp)
+            elif rule.clear(value):
+                state[0] = None
+                state[1] = False
+
+    def evaluate_many(self, unit_id: str, fields: dict, timestamp: datetime.datetime):
+        """
+        Run the rules of several fields, e.g. from a packed message.
+
+        Parameters:
+        - unit_id (str): The unit UUID.
+        - fields (dict): "Units" column -> new value.
+        - timestamp (datetime.datetime): When the values were recorded.
+        """
+        for field, value in fields.items():
+            if field in self._by_field:
+                self.evaluate(unit_id, field, value, timestamp)
+
+    def take(self) -> tuple:
+        """
+        Return and clear the pending notifications.
+
+        Returns:
+        - tuple: ("Notifications" rows ordered like COLUMNS,
+          alerts as (unit_id, rule, value, detail, recorded_at) tuples to publish).
+        """
+        notifications, self._notifications = self._notifications, []
+        alerts, self._alerts = self._alerts, []
+        return notifications, alerts
+
+    def stats(self) -> dict:
+        """
+        Return the number of notifications raised per rule.
+
+        Returns:
+        - dict: Rule name -> notifications raised.
+        """
+        return dict(self.fired)
+
+    def _fire(self, rule, unit_id, value, timestamp):
+        """
+        Queue the notification row, and the alert if the event is recent enough to publish.
+        """
+        detail = rule.detail.format(value=value)
+        self.fired[rule.name] += 1
+        # The same event evaluated again (a replayed sample) gets the same ID
+        notification_id = IdGenerator.for_sample(unit_id, f"notification:{rule.name}", timestamp)
+        self._notifications.append((notification_id, rule.type_id, unit_id, detail, timestamp))
+        if self.alert_topic and (datetime.datetime.now() - timestamp).total_seconds() <= self.alert_max_age:
+            self._alerts.append((unit_id, rule.name, value, detail, timestamp))
@@ -0,0 +1,312 @@
+import datetime
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+import zlib
+
+import paho.mqtt.client as mqtt
+
+from Services import LogPipeline
+from Schemas.Writer import MQTTToDatabaseWriter
+from Schemas.TopicRouter import TopicRouter
+
+logger = logging.getLogger(__name__)
+
+# Counters reported by every worker and summed by the supervisor
+WORKER_COUNTERS = ('ingested', 'submitted', 'dropped', 'flushed', 'batches')
+
+
+def run_worker(index: int, inbox, stats, writer_options: dict, stats_interval: float, log_options: dict = None):
+    """
+    Entry point of a shard worker process.
+
+    Builds a MQTTToDatabaseWriter without an MQTT connection and feeds it the messages
+    the supervisor routes to this shard, until it receives the None sentinel.
+
+    Parameters:
+    - index (int): The shard number.
+    - inbox (multiprocessing.Queue): (topic, payload, received_at) tuples for this shard.
+    - stats (multiprocessing.Queue): Where the worker reports its counters.
+    - writer_options (dict): Keyword arguments for MQTTToDatabaseWriter.
+    - stats_interval (float): Seconds between counter reports.
+    - log_options (dict): Keyword arguments for the worker's LogPipeline (optional; spawned
+      processes do not inherit the supervisor's logging setup).
+    """
+    # Ctrl+C reaches the whole process group; the supervisor decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    log_pipeline = LogPipeline(**log_options) if log_options is not None else None
+    if log_pipeline is not None:
+        log_pipeline.start()
+    writer = MQTTToDatabaseWriter(**writer_options)
+    writer.batch_writer.start()
+    counters = dict.fromkeys(WORKER_COUNTERS, 0)
+
+    def report():
+        counters.update(
+            submitted=writer.batch_writer.submitted,
+            dropped=writer.batch_writer.dropped,
+            flushed=writer.batch_writer.flushed,
+            batches=writer.batch_writer.batches,
+        )
+        stats.put((index, multiprocessing.current_process().pid, dict(counters)))
+
+    next_report = time.monotonic() + stats_interval
+    try:
+        while True:
+            try:
+                item = inbox.get(timeout=stats_interval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                topic, payload, received_at = item
+                counters['ingested'] += 1
+                writer.ingest(topic, payload, received_at)
+            if time.monotonic() >= next_report:
+                report()
+                next_report = time.monotonic() + stats_interval
+    finally:
+        writer.close()
+        report()
+        if log_pipeline is not None:
+            log_pipeline.stop()
+
+
+class ShardedWriter:
+    """
+    Spread ingest over several worker processes, each owning a hash range of unit numbers.
+
+    A supervisor process keeps the single MQTT connection and forwards every message to
+    the worker that owns its unit: shard = crc32(unit_number) % workers. Each worker
+    runs its own MQTTToDatabaseWriter with its own database connection, so routing,
+    buffering and writes scale with the number of cores. All messages of a unit go
+    through the same FIFO queue and writer thread, so per-unit ordering of "Units"
+    updates and history rows is preserved. (MQTT v5 shared subscriptions balance per
+    message rather than per unit, which would break that ordering.)
+
+    A monitor thread restarts workers that exit unexpectedly and sums the counters
+    they report. A restarted worker gets a new queue; messages still queued for the
+    crashed worker are lost.
+
+    Attributes:
+    - workers (int): Number of worker processes.
+    - writer_options (dict): Keyword arguments for each worker's MQTTToDatabaseWriter.
+    - queue_size (int): Maximum number of messages waiting per worker.
+    - stats_interval (float): Seconds between worker counter reports and supervisor summaries.
+    - restart_delay (float): Seconds to wait before restarting a crashed worker.
+    - log_options (dict): Keyword arguments for each worker's LogPipeline (optional).
+    - forwarded (int): Messages forwarded to a worker.
+    - dropped (int): Messages dropped because the worker's queue was full.
+    - unroutable (int): Messages whose topic has no unit number.
+    - restarts (int): Number of worker restarts.
+
+    Methods:
+    - shard_of(unit_number): Return the worker index that owns a unit.
+    - start(endpoint, port, keep_alive): Start the workers and forward messages until interrupted.
+    - stats(): Return the supervisor counters and the summed worker counters.
+    - close(): Stop the workers after they flush their queues.
+    """
+    def __init__(self, workers: int, writer_options: dict, queue_size: int = 10000,
+                 stats_interval: float = 10.0, restart_delay: float = 1.0, log_options: dict = None):
+        """
+        Initialize the ShardedWriter.
+
+        Parameters:
+        - workers (int): Number of worker processes.
+        - writer_options (dict): Keyword arguments for each worker's MQTTToDatabaseWriter.
+        - queue_size (int): Maximum number of messages waiting per worker.
+        - stats_interval (float): Seconds between worker counter reports and supervisor summaries.
+        - restart_delay (float): Seconds to wait before restarting a crashed worker.
+        - log_options (dict): Keyword arguments for each worker's LogPipeline (optional).
+        """
+        self.workers = max(1, workers)
+        self.writer_options = writer_options
+        self.queue_size = queue_size
+        self.stats_interval = stats_interval
+        self.restart_delay = restart_delay
+        self.log_options = log_options
+
+        # spawn: workers must not inherit the supervisor's MQTT network thread
+        self._context = multiprocessing.get_context('spawn')
+        self._inboxes = [self._context.Queue(maxsize=queue_size) for _ in range(self.workers)]
+        self._stats = self._context.Queue()
+        self._processes = [None] * self.workers
+        self._stopping = threading.Event()
+        self._monitor = None
+
+        # (worker, pid) -> last counters reported by that worker process
+        self._worker_stats = {}
+        self._shards = {}
+
+        self.forwarded = 0
+        self.dropped = 0
+        self.unroutable = 0
+        self.restarts = 0
+
+        self.mqtt_client = mqtt.Client()
+        self.mqtt_client.on_connect = self.on_connect
+        self.mqtt_client.on_message = self.on_message
+
+    def shard_of(self, unit_number: str) -> int:
+        """
+        Return the worker index that owns a unit.
+
+        Parameters:
+        - unit_number (str): The unit number from the MQTT topic.
+
+        Returns:
+        - int: The shard index, stable across restarts.
+        """
+        shard = self._shards.get(unit_number)
+        if shard is None:
+            shard = self._shards[unit_number] = zlib.crc32(unit_number.encode()) % self.workers
+        return shard
+
+    def start(self, endpoint: str, port: int, keep_alive: int = 60):
+        """
+        Start the workers, connect to the broker and forward messages until interrupted.
+
+        Parameters:
+        - endpoint (str): The MQTT broker endpoint to connect to.
+        - port (int): The port number of the MQTT broker.
+        - keep_alive (int): MQTT keep alive in seconds.
+
+        Returns:
+        - None
+        """
+        for index in range(self.workers):
+            self._spawn(index)
+        self._monitor = threading.Thread(target=self._supervise, name="shard-supervisor", daemon=True)
+        self._monitor.start()
+        logger.info("🧩 Started %d shard workers", self.workers)
+        logger.info("Connecting to MQTT broker at %s:%s", endpoint, port)
+        self.mqtt_client.connect(endpoint, port, keep_alive)
+        self.mqtt_client.loop_forever()
+
+    def on_connect(self, client, userdata, flags, rc):
+        """
+        Callback for when the MQTT client connects to the broker.
+        """
+        if rc == 0:
+            topics = MQTTToDatabaseWriter.subscription_topics(
+                self.writer_options.get('subscribed_units'), self.writer_options.get('legacy_topics', True)
+            )
+            client.subscribe([(topic, 0) for topic in topics])
+            logger.info("🚐 Subscribed to %d topic filters for %d shards", len(topics), self.workers)
+        else:
+            logger.warning("Failed to connect: %s. loop_forever() will retry connection", rc)
+
+    def on_message(self, client, userdata, msg):
+        """
+        Forward a message to the worker that owns its unit, without blocking the network thread.
+        """
+        for pattern in TopicRouter.TOPIC_PATTERNS:
+            match = pattern.match(msg.topic)
+            if match:
+                break
+        else:
+            self.unroutable += 1
+            return
+        try:
+            self._inboxes[self.shard_of(match.group(1))].put_nowait(
+                (msg.topic, msg.payload, datetime.datetime.now())
+            )
+            self.forwarded += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self) -> dict:
+        """
+        Return the supervisor counters and the worker counters summed over all processes.
+
+        Returns:
+        - dict: Forwarded, dropped, unroutable and restart counts, plus one total per worker counter.
+        """
+        self._collect_stats()
+        totals = dict.fromkeys(WORKER_COUNTERS, 0)
+        for counters in self._worker_stats.values():
+            for name in WORKER_COUNTERS:
+                totals[name] += counters.get(name, 0)
+        return {
+            'forwarded': self.forwarded,
+            'dropped_by_supervisor': self.dropped,
+            'unroutable_topics': self.unroutable,
+            'restarts': self.restarts,
+            'workers': {name: totals[name] for name in WORKER_COUNTERS},
+        }
+
+    def close(self):
+        """
+        Disconnect from the broker and stop the workers once their queues are flushed.
+
+        Returns:
+        - None
+        """
+        self._stopping.set()
+        self.mqtt_client.disconnect()
+        if self._monitor is not None:
+            self._monitor.join()
+        for inbox, process in zip(self._inboxes, self._processes):
+            if process is not None and process.is_alive():
+                inbox.put(None)
+            else:
+                # Nobody will read what is left in a dead worker's queue
+                inbox.cancel_join_thread()
+        for process in self._processes:
+            if process is not None:
+                process.join()
+        logger.info("🧩 Sharded ingest: %s", self.stats())
+
+    def _spawn(self, index: int):
+        """
+        Start the worker process of a shard.
+        """
+        writer_options = self.writer_options
+        if index > 0:
+            # Shard 0 maintains the history partitions for every shard
+            writer_options = dict(writer_options, partition_options=None)
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, self._inboxes[index], self._stats, writer_options, self.stats_interval,
+                  self.log_options),
+            name=f"shard-{index}",
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _supervise(self):
+        """
+        Monitor thread: restart crashed workers and print the summed counters periodically.
+        """
+        next_summary = time.monotonic() + self.stats_interval
+        while not self._stopping.wait(0.5):
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive():
+                    logger.error("💥 Shard worker %d (pid %s) exited with code %s, restarting in %ss",
+                                 index, process.pid, process.exitcode, self.restart_delay)
+                    self.restarts += 1
+                    if self._stopping.wait(self.restart_delay):
+                        return
+                    # A worker killed inside get() leaves the queue's read lock held: start on a new queue
+                    self._inboxes[index].cancel_join_thread()
+                    self._inboxes[index] = self._context.Queue(maxsize=self.queue_size)
+                    self._spawn(index)
+            if time.monotonic() >= next_summary:
+                logger.info("🧩 Sharded ingest: %s", self.stats())
+                next_summary = time.monotonic() + self.stats_interval
+
+    def _collect_stats(self):
+        """
+        Drain the counter reports sent by the workers.
+        """
+        while True:
+            try:
+                index, pid, counters = self._stats.get_nowait()
+            except queue.Empty:
+                return
+            self._worker_stats[(index, pid)] = counters
@@ -0,0 +1,151 @@
+import datetime
+import json
+import struct
+
+
+class TelemetryFrame:
+    """
+    Codec for packed telemetry: every metric of one unit in a single MQTT message.
+
+    Two encodings are accepted on the unit's topics:
+    - fleet/{unit}/packed: a JSON object such as
+      {"ts": 1718000000.5, "fuel": 71.5, "speed": 80.1, "rpm": 2000, "temperature": 90,
+       "panic": 0, "lat": 19.45, "lon": -99.15}; every key is optional.
+    - fleet/{unit}/frame: a 47-byte little-endian struct (LAYOUT):
+      version (B), presence mask (B), device timestamp in epoch ms (q), fuel (d),
+      speed (d), rpm (H), temperature (h), panic (B), latitude (d), longitude (d).
+      Bit i of the presence mask marks FIELDS[i] as present.
+
+    Device timestamps are epoch times converted to naive local datetimes, like the
+    receive timestamps the writer uses when a message carries none.
+
+    Attributes:
+    - LAYOUT (struct.Struct): The binary frame layout.
+    - FIELDS (tuple): Decoded field names, in presence-mask bit order.
+
+    Methods:
+    - encode(timestamp, values): Build a binary frame.
+    - decode(payload): Decode a binary frame without copying the payload.
+    - encode_json(timestamp, values): Build a JSON payload.
+    - decode_json(payload): Decode a JSON payload.
+    """
+    VERSION = 1
+    LAYOUT = struct.Struct('<BBqddHhBdd')
+    FIELDS = ('fuel_level', 'current_speed', 'rpm', 'temperature', 'panic_button_active', 'latitude', 'longitude')
+    ALL_FIELDS = (1 << len(FIELDS)) - 1
+
+    # JSON key -> field name
+    JSON_KEYS = {
+        'fuel': 'fuel_level',
+        'speed': 'current_speed',
+        'rpm': 'rpm',
+        'temperature': 'temperature',
+        'panic': 'panic_button_active',
+        'lat': 'latitude',
+        'lon': 'longitude',
+    }
+
+    # Field name -> type the writer stores
+    FIELD_TYPES = {
+        'fuel_level': float,
+        'current_speed': float,
+        'rpm': int,
+        'temperature': int,
+        'panic_button_active': bool,
+        'latitude': float,
+        'longitude': float,
+    }
+
+    @classmethod
+    def encode(cls, timestamp: float, values: dict) -> bytes:
+        """
+        Build a binary frame.
+
+        Parameters:
+        - timestamp (float): Device time in epoch seconds.
+        - values (dict): Field name -> value for the fields present.
+
+        Returns:
+        - bytes: The packed frame.
+        """
+        mask = 0
+        packed = []
+        for bit, field in enumerate(cls.FIELDS):
+            value = values.get(field)
+            if value is not None:
+                mask |= 1 << bit
+            packed.append(cls.FIELD_TYPES[field](value or 0))
+        return cls.LAYOUT.pack(cls.VERSION, mask, int(timestamp * 1000), *packed)
+
+    @classmethod
+    def decode(cls, payload) -> tuple:
+        """
+        Decode a binary frame straight from the payload buffer.
+
+        Parameters:
+        - payload (bytes | memoryview): The raw MQTT payload.
+
+        Returns:
+        - tuple: (device timestamp as datetime.datetime, dict of the fields present).
+
+        Raises:
+        - ValueError: If the frame has the wrong size or version.
+        """
+        view = memoryview(payload)
+        if len(view) != cls.LAYOUT.size:
+            raise ValueError(f"Telemetry frame must be {cls.LAYOUT.size} bytes, got {len(view)}")
+        (version, mask, timestamp_ms, fuel_level, current_speed, rpm, temperature, panic,
+         latitude, longitude) = cls.LAYOUT.unpack_from(view)
+        if version != cls.VERSION:
+            raise ValueError(f"Unsupported telemetry frame version: {version}")
+        # struct already yields float/int; only the panic byte needs converting
+        values = {
+            'fuel_level': fuel_level,
+            'current_speed': current_speed,
+            'rpm': rpm,
+            'temperature': temperature,
+            'panic_button_active': panic != 0,
+            'latitude': latitude,
+            'longitude': longitude,
+        }
+        if mask != cls.ALL_FIELDS:
+            values = {field: value for bit, (field, value) in enumerate(values.items()) if mask & (1 << bit)}
+        return datetime.datetime.fromtimestamp(timestamp_ms / 1000), values
+
+    @classmethod
+    def encode_json(cls, timestamp: float, values: dict) -> str:
+        """
+        Build a JSON payload.
+
+        Parameters:
+        - timestamp (float): Device time in epoch seconds.
+        - values (dict): Field name -> value for the fields present.
+
+        Returns:
+        - str: The JSON payload.
+        """
+        document = {'ts': timestamp}
+        for key, field in cls.JSON_KEYS.items():
+            if values.get(field) is not None:
+                document[key] = values[field]
+        return json.dumps(document)
+
+    @classmethod
+    def decode_json(cls, payload) -> tuple:
+        """
+        Decode a JSON payload.
+
+        Parameters:
+        - payload (str | bytes): The MQTT payload.
+
+        Returns:
+        - tuple: (device timestamp as datetime.datetime or None, dict of the fields present).
+        """
+        document = json.loads(payload)
+        values = {}
+        for key, field in cls.JSON_KEYS.items():
+            value = document.get(key)
+            if value is not None:
+                values[field] = cls.FIELD_TYPES[field](value)
+        timestamp = document.get('ts')
+        return (datetime.datetime.fromtimestamp(timestamp) if timestamp is not None else None), values
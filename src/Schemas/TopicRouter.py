@@ -0,0 +1,169 @@
+import re
+import functools
+from collections import namedtuple
+
+
+# A resolved topic: everything on_message needs to dispatch without parsing again.
+# binary routes receive the raw payload bytes instead of the decoded text.
+Route = namedtuple('Route', ['unit_number', 'unit_uuid', 'parameter', 'handler', 'binary'], defaults=(False,))
+
+
+class TopicRouter:
+    """
+    Resolve MQTT topics to the handler of their parameter.
+
+    Topic patterns are compiled once and every distinct topic string is resolved only
+    once: the resulting Route is memoized in a bounded LRU cache, so after the first
+    message on a topic neither the regex nor the parameter lookup runs again. Since
+    there are only units x parameters distinct topics, the cache hit rate is ~100%.
+
+    Supported topic formats:
+    - fleet/{unit_number}/{parameter} (e.g., fleet/1/Combustible, fleet/3/Velocidad)
+    - U{unit_number}_{parameter} (legacy, e.g., U1_Combustible, U3_Velocidad, U2_Panic)
+    - U{unit_number}/{parameter} (legacy, e.g., U1/Combustible, U3/Velocidad, U2/Panic)
+
+    Attributes:
+    - unit_resolver (callable): Maps a unit number string to the unit UUID, or None to reject the unit.
+    - cache_size (int): Maximum number of topics kept in the route cache.
+
+    Methods:
+    - register(names, handler, binary): Route one or more parameter names to a handler.
+    - resolve(topic): Return the Route for a topic, or None if it cannot be routed.
+    - clear_cache(): Forget every memoized route.
+    - subscriptions(units, legacy_parameters): Build the topic filters for a set of units.
+    - parse_units(spec): Expand a unit list such as "1-3,7" from configuration.
+    """
+    # Root of the topic hierarchy: fleet/<unit>/<parameter>
+    FLEET_PREFIX = 'fleet'
+
+    TOPIC_PATTERNS = (
+        re.compile(r'fleet/(\d+)/([^/]+)'),
+        re.compile(r'U(\d+)_(.+)'),
+        re.compile(r'U(\d+)/(.+)'),
+    )
+
+    def __init__(self, unit_resolver, cache_size: int = 65536):
+        """
+        Initialize the TopicRouter.
+
+        Parameters:
+        - unit_resolver (callable): Maps a unit number string to the unit UUID, or None to reject the unit.
+        - cache_size (int): Maximum number of topics kept in the route cache.
+        """
+        self.unit_resolver = unit_resolver
+        self.cache_size = cache_size
+        self._handlers = {}
+        self.resolve = functools.lru_cache(maxsize=cache_size)(self._resolve)
+
+    def register(self, names, handler, binary: bool = False):
+        """
+        Route one or more parameter names to a handler.
+
+        Parameters:
+        - names (str | list): Parameter name or aliases (case-insensitive), e.g. ['velocidad', 'speed'].
+        - handler (callable): Called as handler(unit_uuid, payload, timestamp).
+        - binary (bool): Pass the raw payload bytes to the handler instead of the decoded text.
+        """
+        if isinstance(names, str):
+            names = [names]
+        for name in names:
+            self._handlers[name.lower()] = (handler, binary)
+        self.clear_cache()
+
+    def parameters(self) -> list:
+        """
+        Return the registered parameter names.
+
+        Returns:
+        - list: Lowercase parameter names.
+        """
+        return list(self._handlers)
+
+    def clear_cache(self):
+        """
+        Forget every memoized route, e.g. after handlers or unit IDs change.
+        """
+        self.resolve.cache_clear()
+
+    def cache_info(self):
+        """
+        Return the hit/miss statistics of the route cache.
+
+        Returns:
+        - functools._CacheInfo: hits, misses, maxsize and currsize of the cache.
+        """
+        return self.resolve.cache_info()
+
+    @classmethod
+    def subscriptions(cls, units: list = None, legacy_parameters: list = ()) -> list:
+        """
+        Build the MQTT topic filters that cover a set of units.
+
+        The fleet hierarchy needs one wildcard filter per unit, or a single one for
+        every unit. Legacy topics cannot be matched by MQTT wildcards ('+' must fill a
+        whole level), so they are listed per unit and parameter, and only for an
+        explicit list of units.
+
+        Parameters:
+        - units (list): Unit numbers to subscribe to; None subscribes to every unit.
+        - legacy_parameters (list): Parameter names to subscribe to as U{unit}_{parameter}.
+
+        Returns:
+        - list: Topic filters, to be sent in a single SUBSCRIBE.
+        """
+        if units is None:
+            return [f'{cls.FLEET_PREFIX}/+/+']
+        topics = [f'{cls.FLEET_PREFIX}/{unit}/+' for unit in units]
+        topics.extend(f'U{unit}_{parameter}' for unit in units for parameter in legacy_parameters)
+        return topics
+
+    @staticmethod
+    def parse_units(spec: str):
+        """
+        Expand a unit list from configuration.
+
+        Parameters:
+        - spec (str): Comma separated unit numbers and ranges, e.g. "1-3,7"; empty or "*" for every unit.
+
+        Returns:
+        - list: Unit number strings, or None for every unit.
+        """
+        spec = (spec or '').strip()
+        if spec in ('', '*'):
+            return None
+        units = []
+        for part in spec.split(','):
+            part = part.strip()
+            if '-' in part:
+                first, last = part.split('-', 1)
+                units.extend(str(unit) for unit in range(int(first), int(last) + 1))
+            elif part:
+                units.append(str(int(part)))
+        return units
+
+    def _resolve(self, topic: str):
+        """
+        Parse a topic and build its Route; memoized through self.resolve.
+
+        Parameters:
+        - topic (str): The MQTT topic.
+
+        Returns:
+        - Route: The resolved route, or None if the topic, unit or parameter is unknown.
+        """
+        for pattern in self.TOPIC_PATTERNS:
+            match = pattern.match(topic)
+            if match:
+                break
+        else:
+            return None
+
+        unit_number, parameter = match.group(1), match.group(2).lower()
+        registration = self._handlers.get(parameter)
+        if registration is None:
+            return None
+        unit_uuid = self.unit_resolver(unit_number)
+        if unit_uuid is None:
+            return None
+        handler, binary = registration
+        return Route(unit_number, unit_uuid, parameter, handler, binary)
@@ -0,0 +1,195 @@
+import math
+import time
+
+
+class TrajectoryCompressor:
+    """
+    Online simplification of each unit's LocationHistory track within a tolerance in meters.
+
+    A streaming form of Douglas-Peucker (the "opening window" algorithm): the last
+    written point of a unit is its anchor, and the points received since are buffered.
+    A new point extends the window as long as every buffered point lies within
+    `tolerance` meters of the segment from the anchor to the new point. When one does
+    not, the previous point is written and becomes the new anchor. Every dropped point
+    is therefore within `tolerance` of the path drawn through the written points.
+
+    The buffer holds at most `max_points` points, so each point costs O(max_points)
+    distance checks at worst and memory stays bounded per unit. A point is also written
+    when `max_interval` seconds (of recorded time) have passed since the anchor, so a
+    stopped vehicle still leaves a trace, and the last buffered point of a unit is
+    written once the unit has been quiet for `idle` seconds.
+
+    Rows must arrive in recorded-time order per unit (the writer feeds it from the
+    ReorderBuffer). Rows older than the anchor and rows missing a coordinate are passed
+    through unchanged.
+
+    Attributes:
+    - tolerance (float): Maximum distance in meters between a dropped point and the simplified path.
+    - max_points (int): Maximum number of points buffered per unit.
+    - max_interval (float): Seconds of recorded time after which a point is written anyway.
+    - idle (float): Seconds without points after which a unit's last buffered point is written.
+    - points_in (int): Points offered.
+    - points_out (int): Points written.
+
+    Methods:
+    - add(row): Offer a location row, returning the rows to write.
+    - expire(now): Write the last buffered point of quiet units.
+    - distance_to_segment(point, start, end): Distance in meters from a point to a segment.
+    - stats(): Return the compression counters.
+    """
+    # Mean Earth radius in meters
+    EARTH_RADIUS = 6371008.8
+
+    class _Track:
+        """Compression state of one unit"""
+        __slots__ = ('anchor', 'scale', 'buffer', 'arrived')
+
+        def __init__(self, anchor):
+            self.anchor = anchor
+            # Meters per degree of longitude at the anchor's latitude
+            self.scale = math.cos(math.radians(anchor[2]))
+            # (row, x, y): buffered rows with their offset from the anchor in meters
+            self.buffer = []
+            self.arrived = time.monotonic()
+
+    def __init__(self, tolerance: float = 10.0, max_points: int = 32, max_interval: float = 60.0, idle: float = 5.0):
+        """
+        Initialize the TrajectoryCompressor.
+
+        Parameters:
+        - tolerance (float): Maximum distance in meters between a dropped point and the simplified path.
+        - max_points (int): Maximum number of points buffered per unit.
+        - max_interval (float): Seconds of recorded time after which a point is written anyway.
+        - idle (float): Seconds without points after which a unit's last buffered point is written.
+        """
+        self.tolerance = tolerance
+        self.max_points = max(1, max_points)
+        self.max_interval = max_interval
+        self.idle = idle
+
+        # unit_id -> _Track
+        self._tracks = {}
+
+        self.points_in = 0
+        self.points_out = 0
+
+    def add(self, row: tuple) -> list:
+        """
+        Offer a location row.
+
+        Parameters:
+        - row (tuple): (location_id, unit_id, latitude, longitude, recorded_at).
+
+        Returns:
+        - list: The rows to write, in recorded-time order.
+        """
+        self.points_in += 1
+        _, unit_id, latitude, longitude, recorded_at = row
+        track = self._tracks.get(unit_id)
+        if latitude is None or longitude is None or (track is not None and recorded_at < track.anchor[4]):
+            self.points_out += 1
+            return [row]
+        if track is None:
+            self._tracks[unit_id] = self._Track(row)
+            self.points_out += 1
+            return [row]
+
+        track.arrived = time.monotonic()
+        written = []
+        x, y = self._offset(track, latitude, longitude)
+        if track.buffer and not self._fits(track.buffer, x, y):
+            # The window cannot reach the new point: close it at the previous one
+            written.append(self._reanchor(track, track.buffer[-1][0]))
+            x, y = self._offset(track, latitude, longitude)
+        if (recorded_at - track.anchor[4]).total_seconds() >= self.max_interval or len(track.buffer) >= self.max_points:
+            written.append(self._reanchor(track, row))
+        else:
+            track.buffer.append((row, x, y))
+        return written
+
+    def expire(self, now: float = None) -> list:
+        """
+        Write the last buffered point of units that have been quiet for `idle` seconds.
+
+        Parameters:
+        - now (float): The current time.monotonic(); None writes the last point of every unit.
+
+        Returns:
+        - list: The rows to write.
+        """
+        written = []
+        for track in self._tracks.values():
+            if track.buffer and (now is None or now - track.arrived >= self.idle):
+                written.append(self._reanchor(track, track.buffer[-1][0]))
+        return written
+
+    @classmethod
+    def distance_to_segment(cls, point: tuple, start: tuple, end: tuple) -> float:
+        """
+        Distance in meters from a point to a segment, on a local flat projection.
+
+        Parameters:
+        - point (tuple): (latitude, longitude) of the point.
+        - start (tuple): (latitude, longitude) of the segment start.
+        - end (tuple): (latitude, longitude) of the segment end.
+
+        Returns:
+        - float: The distance in meters.
+        """
+        scale = math.cos(math.radians(start[0]))
+        meters = math.radians(1) * cls.EARTH_RADIUS
+        px, py = (point[1] - start[1]) * scale * meters, (point[0] - start[0]) * meters
+        ex, ey = (end[1] - start[1]) * scale * meters, (end[0] - start[0]) * meters
+        return cls._segment_distance(px, py, ex, ey)
+
+    def stats(self) -> dict:
+        """
+        Return the compression counters.
+
+        Returns:
+        - dict: Points offered and written, the compression ratio and points still buffered.
+        """
+        return {
+            'points_in': self.points_in,
+            'points_out': self.points_out,
+            'ratio': round(self.points_in / self.points_out, 2) if self.points_out else None,
+            'buffered': sum(len(track.buffer) for track in self._tracks.values()),
+        }
+
+    def _offset(self, track, latitude, longitude):
+        """
+        Offset of a coordinate from the track's anchor, in meters (x east, y north).
+        """
+        meters = math.radians(1) * self.EARTH_RADIUS
+        return (longitude - track.anchor[3]) * track.scale * meters, (latitude - track.anchor[2]) * meters
+
+    def _fits(self, buffer, x, y):
+        """
+        Check that every buffered point is within tolerance of the segment from the anchor to (x, y).
+        """
+        tolerance = self.tolerance
+        for _, px, py in buffer:
+            if self._segment_distance(px, py, x, y) > tolerance:
+                return False
+        return True
+
+    @staticmethod
+    def _segment_distance(px, py, ex, ey):
+        """
+        Distance from (px, py) to the segment from the origin to (ex, ey).
+        """
+        length = ex * ex + ey * ey
+        if length == 0:
+            return math.hypot(px, py)
+        t = max(0.0, min(1.0, (px * ex + py * ey) / length))
+        return math.hypot(px - t * ex, py - t * ey)
+
+    def _reanchor(self, track, row):
+        """
+        Write a row and make it the track's anchor; it is always the newest point, so the buffer empties.
+        """
+        track.anchor = row
+        track.scale = math.cos(math.radians(row[2]))
+        track.buffer = []
+        self.points_out += 1
+        return row
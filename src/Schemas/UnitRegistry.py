@@ -0,0 +1,132 @@
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class UnitRegistry:
+    """
+    A cached mapping from the unit numbers used in MQTT topics to "Units" UUIDs.
+
+    Unit UUIDs are derived from the unit number (the same deterministic UUID5 used by
+    create_sample_data.py) once per unit and kept in memory. The IDs present in the
+    "Units" table are preloaded at startup and refreshed periodically from the writer
+    thread, so the MQTT thread never waits on the database to resolve a unit.
+
+    Units missing from the table are handled by `unknown_policy`:
+    - 'register': accept the unit; its row is created by the next "Units" upsert.
+    - 'reject': drop its messages until the unit appears in the table.
+
+    Attributes:
+    - db (DatabaseConnection): The database connection used to load the known units.
+    - unknown_policy (str): 'register' or 'reject'.
+    - refresh_interval (float): Seconds between reloads of the known units (0 disables them).
+    - registered (int): Number of unknown units accepted under the 'register' policy.
+    - rejected (int): Number of lookups rejected under the 'reject' policy.
+
+    Methods:
+    - load(): Reload the unit IDs present in the "Units" table.
+    - refresh_if_due(): Reload the known units if the refresh interval has elapsed.
+    - resolve(unit_number): Return the UUID of a unit, or None if it is rejected.
+    - number_of(unit_id): Return the unit number a UUID was resolved from.
+    """
+    NAMESPACE = uuid.UUID('6ba7b810-9dad-11d1-80b4-00c04fd430c8')
+    UNKNOWN_POLICIES = ('register', 'reject')
+
+    def __init__(self, db, unknown_policy: str = 'register', refresh_interval: float = 300, on_change=None):
+        """
+        Initialize the UnitRegistry.
+
+        Parameters:
+        - db (DatabaseConnection): The database connection used to load the known units.
+        - unknown_policy (str): 'register' to accept unknown units, 'reject' to drop them.
+        - refresh_interval (float): Seconds between reloads of the known units (0 disables them).
+        - on_change (callable): Called without arguments when the set of known units changes (optional).
+        """
+        if unknown_policy not in self.UNKNOWN_POLICIES:
+            raise ValueError(f"Unknown unit policy: {unknown_policy}. Expected one of {self.UNKNOWN_POLICIES}")
+        self.db = db
+        self.unknown_policy = unknown_policy
+        self.refresh_interval = refresh_interval
+        self.on_change = on_change
+
+        self._uuids = {}
+        self._numbers = {}
+        self._known = frozenset()
+        self._next_refresh = 0.0
+
+        self.registered = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self._known)
+
+    def load(self) -> bool:
+        """
+        Reload the unit IDs present in the "Units" table.
+
+        Returns:
+        - bool: True if the units were loaded, False if the query failed.
+        """
+        self._next_refresh = time.monotonic() + self.refresh_interval
+        try:
+            df = self.db.fetch_all('Units', ['unit_id'])
+        except Exception as e:
+            logger.error("Error loading units: %s", e)
+            return False
+
+        known = frozenset(str(unit_id) for unit_id in df['unit_id'].to_list())
+        if known != self._known:
+            self._known = known
+            if self.on_change:
+                self.on_change()
+        return True
+
+    def refresh_if_due(self) -> bool:
+        """
+        Reload the known units if the refresh interval has elapsed.
+
+        Returns:
+        - bool: True if a reload was attempted, False otherwise.
+        """
+        if self.refresh_interval <= 0 or time.monotonic() < self._next_refresh:
+            return False
+        self.load()
+        return True
+
+    def resolve(self, unit_number: str):
+        """
+        Return the UUID of a unit number.
+
+        Parameters:
+        - unit_number (str): The unit number from the MQTT topic.
+
+        Returns:
+        - str: The unit UUID, or None if the unit is unknown and the policy is 'reject'.
+        """
+        unit_uuid = self._uuids.get(unit_number)
+        if unit_uuid is None:
+            unit_uuid = self._uuids[unit_number] = str(uuid.uuid5(self.NAMESPACE, f"unit_{unit_number}"))
+            self._numbers[unit_uuid] = unit_number
+
+        if unit_uuid in self._known:
+            return unit_uuid
+        if self.unknown_policy == 'reject':
+            self.rejected += 1
+            return None
+        self._known = self._known | {unit_uuid}
+        self.registered += 1
+        return unit_uuid
+
+    def number_of(self, unit_id: str):
+        """
+        Return the unit number a UUID was resolved from.
+
+        Parameters:
+        - unit_id (str): The unit UUID.
+
+        Returns:
+        - str: The unit number, or None if the UUID was never resolved by this registry.
+        """
+        return self._numbers.get(unit_id)
@@ -0,0 +1,164 @@
+import datetime
+
+
+class UnitStateBuffer:
+    """
+    A last-value-wins buffer of pending "Units" column updates, keyed by unit UUID.
+
+    Every scalar update received during a flush window is merged into a single pending
+    row per unit, so five telemetry messages for the same unit become one row write.
+
+    Values only move forward in time: the timestamp of the last value taken for each
+    unit and field is remembered across drains, and an update older than it (a late or
+    replayed sample) is ignored instead of overwriting fresher state.
+
+    With `field_timestamps`, every row also carries "<field>_at", the time of each field
+    it holds, so the database can keep the newest value per column (see migration 003).
+
+    Attributes:
+    - field_timestamps (bool): Add a "<field>_at" time for every field in the rows.
+    - updates (int): Number of field updates merged into the buffer.
+    - stale (int): Number of field updates ignored because a newer value was already taken.
+    - rows_flushed (int): Number of unit rows handed out by drain().
+
+    Methods:
+    - update(unit_id, field, value, timestamp): Merge one field update for a unit.
+    - update_many(unit_id, fields, timestamp): Merge several field updates for a unit.
+    - drain(): Return the pending rows and empty the buffer.
+    - clear(): Discard the pending rows.
+    - stats(): Return the buffer counters.
+    """
+    # "Units" columns that carry their own "<field>_at" time with field_timestamps
+    FIELDS = ('fuel_level', 'current_speed', 'panic_button_active', 'rpm', 'temperature')
+
+    # How a row with field times combines with the stored one: each column keeps the
+    # newer of the two values, fields absent from the row (no time) keep the stored one
+    MERGE_COLUMNS = {
+        column: f'CASE WHEN EXCLUDED."{field}_at" IS NOT NULL AND ({{table}}."{field}_at" IS NULL '
+                f'OR EXCLUDED."{field}_at" >= {{table}}."{field}_at") '
+                f'THEN EXCLUDED."{column}" ELSE {{table}}."{column}" END'
+        for field in FIELDS for column in (field, f'{field}_at')
+    }
+    MERGE_COLUMNS['updated_at'] = ('CASE WHEN {table}."updated_at" IS NULL '
+                                   'OR EXCLUDED."updated_at" > {table}."updated_at" '
+                                   'THEN EXCLUDED."updated_at" ELSE {table}."updated_at" END')
+
+    def __init__(self, field_timestamps: bool = False):
+        """
+        Initialize an empty UnitStateBuffer.
+
+        Parameters:
+        - field_timestamps (bool): Add a "<field>_at" time for every field in the rows.
+        """
+        self.field_timestamps = field_timestamps
+        self._pending = {}
+        # (unit_id, field) -> timestamp of the value last taken
+        self._applied = {}
+        self.updates = 0
+        self.stale = 0
+        self.rows_flushed = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def update(self, unit_id: str, field: str, value, timestamp: datetime.datetime = None):
+        """
+        Merge one field update for a unit; newer values replace older ones.
+
+        Parameters:
+        - unit_id (str): The unit UUID.
+        - field (str): The "Units" column to update.
+        - value: The new value for the column.
+        - timestamp (datetime.datetime): When the value was recorded (defaults to now).
+
+        Returns:
+        - bool: False if the update was older than the value already taken and was ignored.
+        """
+        timestamp = timestamp or datetime.datetime.now()
+        key = (unit_id, field)
+        last = self._applied.get(key)
+        if last is not None and timestamp < last:
+            self.stale += 1
+            return False
+        self._applied[key] = timestamp
+        row = self._pending.get(unit_id)
+        if row is None:
+            row = self._pending[unit_id] = {'unit_id': unit_id, 'updated_at': timestamp}
+        elif timestamp > row['updated_at']:
+            row['updated_at'] = timestamp
+        row[field] = value
+        if self.field_timestamps:
+            row[f'{field}_at'] = timestamp
+        self.updates += 1
+        return True
+
+    def update_many(self, unit_id: str, fields: dict, timestamp: datetime.datetime = None):
+        """
+        Merge several field updates for a unit at once, e.g. from a packed message.
+
+        Parameters:
+        - unit_id (str): The unit UUID.
+        - fields (dict): "Units" column -> new value.
+        - timestamp (datetime.datetime): When the values were recorded (defaults to now).
+
+        Returns:
+        - dict: The fields taken; fields older than the value already taken are left out.
+        """
+        timestamp = timestamp or datetime.datetime.now()
+        applied = self._applied
+        for field in fields:
+            last = applied.get((unit_id, field))
+            if last is not None and timestamp < last:
+                # Rare: rebuild without the stale fields
+                fresh = {}
+                for name, value in fields.items():
+                    last = applied.get((unit_id, name))
+                    if last is not None and timestamp < last:
+                        self.stale += 1
+                    else:
+                        fresh[name] = value
+                fields = fresh
+                break
+        if not fields:
+            return fields
+        for field in fields:
+            applied[(unit_id, field)] = timestamp
+        row = self._pending.get(unit_id)
+        if row is None:
+            row = self._pending[unit_id] = {'unit_id': unit_id, 'updated_at': timestamp}
+        elif timestamp > row['updated_at']:
+            row['updated_at'] = timestamp
+        row.update(fields)
+        if self.field_timestamps:
+            for field in fields:
+                row[f'{field}_at'] = timestamp
+        self.updates += len(fields)
+        return fields
+
+    def drain(self) -> list:
+        """
+        Return the pending rows and empty the buffer.
+
+        Returns:
+        - list: One dict per unit with 'unit_id', 'updated_at' and every field received
+          (and its "<field>_at" time with field_timestamps).
+        """
+        rows = list(self._pending.values())
+        self._pending = {}
+        self.rows_flushed += len(rows)
+        return rows
+
+    def clear(self):
+        """
+        Discard the pending rows without writing them.
+        """
+        self._pending = {}
+
+    def stats(self) -> dict:
+        """
+        Return the buffer counters.
+
+        Returns:
+        - dict: Counts of merged and stale field updates, and unit rows flushed.
+        """
+        return {'updates': self.updates, 'stale': self.stale, 'rows_flushed': self.rows_flushed}
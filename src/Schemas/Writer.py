@@ -1,9 +1,26 @@
-from Services import DatabaseConnection
+from Services import DatabaseConnection, BatchWriter, CommitPolicy, PartitionManager, Metrics
+from Schemas.UnitStateBuffer import UnitStateBuffer
+from Schemas.LocationPairer import LocationPairer
+from Schemas.ReorderBuffer import ReorderBuffer
+from Schemas.DeadbandFilter import DeadbandFilter
+from Schemas.TrajectoryCompressor import TrajectoryCompressor
+from Schemas.DailyReportAggregator import DailyReportAggregator
+from Schemas.RollupAggregator import RollupAggregator
+from Schemas.RuleEngine import RuleEngine
+from Schemas.FleetState import FleetState
+from Schemas.IdGenerator import IdGenerator
+from Schemas.TopicRouter import TopicRouter
+from Schemas.UnitRegistry import UnitRegistry
+from Schemas.TelemetryFrame import TelemetryFrame
 import paho.mqtt.client as mqtt
 import datetime
 import json
-import uuid
-import re
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+# Per-message records of the traced units, enabled by the writer that traces them
+tracer = logging.getLogger(f"{__name__}.trace")
 
 
 class MQTTToDatabaseWriter:
@@ -11,7 +28,21 @@ class MQTTToDatabaseWriter:
     A class to write data from an MQTT topic to a database.
     
     This class waits for messages on a specified MQTT topic and writes the received data
-    to a database using a provided DatabaseConnection instance.
+    to a database using a provided DatabaseConnection instance. Messages are parsed on
+    the MQTT network thread and queued; a BatchWriter thread writes them to the database
+    in batches, one transaction per batch.
+    
+    Text payloads may carry the device timestamp of the sample as "<value>@<epoch seconds>"
+    (packed messages carry their own); without one the receive time is used. History
+    rows are sorted and deduplicated per unit within a reorder window, and "Units" only
+    moves forward in time, so buffered data replayed by a vehicle that was offline
+    never overwrites fresher state.
+    
+    History and "Notifications" IDs are time-ordered UUIDs derived from the unit, the
+    table and the recorded time (see IdGenerator), and rows whose ID is already stored
+    are skipped, so writing the same sample twice stores it once.
+    
+    Nothing is logged per message, except debug records for the units in `trace_units`.
     
     Attributes:
     - mqtt_client (mqtt.Client): The MQTT client instance.
@@ -20,13 +51,55 @@ class MQTTToDatabaseWriter:
     - table_name (str): The name of the database table to write data to.
     - columns (list): The list of columns in the database table.
     - last_message_time (datetime.datetime): The timestamp of the last received message.
+    - batch_writer (BatchWriter): The queue between the MQTT thread and the database writer thread.
+    - unit_state (UnitStateBuffer): Pending "Units" updates, written once per unit per batch.
+    - reorder (ReorderBuffer): Pending history rows, released in recorded-time order.
+    - location_pairer (LocationPairer): Joins latitude and longitude messages into one location row.
+    - router (TopicRouter): Resolves topics to the unit UUID and parameter handler.
+    - units (UnitRegistry): Cached unit number to UUID mapping, preloaded from the "Units" table.
+    - commit_policy (CommitPolicy): When the statements sent to the database are committed.
+    - history_async_commit (bool): Commit history rows with synchronous_commit=off.
+    - deadband (DeadbandFilter): Skips unchanged "Units" values and speed samples (None writes everything).
+    - trajectory (TrajectoryCompressor): Simplifies LocationHistory tracks (None writes every fix).
+    - daily_reports (DailyReportAggregator): Maintains "DailyReport" from the history rows (optional).
+    - rollups (RollupAggregator): Maintains the minute and hour rollups of the numeric values (optional).
+    - rules (RuleEngine): Raises "Notifications" and alerts from the incoming values (optional).
+    - fleet_state (FleetState): Latest state of every unit, updated as values are accepted (optional).
+    - partitions (PartitionManager): Creates and detaches the daily history partitions (optional).
+    - metrics (Metrics): Message counters and per-stage latency histograms (optional).
+    - trace_units (frozenset): Unit numbers whose messages are traced at debug level.
     
     Methods:
     - on_connect(client, userdata, flags, rc): Callback for when the MQTT client connects to the broker.
     - on_message(client, userdata, msg): Callback for when a message is received on the subscribed topic.
     - write_to_database(data): Writes the received data to the database.
+    - ingest(topic, payload, received_at): Route a received message and queue it for the writer thread.
+    - register_parameter(names, handler, binary): Route a new telemetry parameter to a handler.
+    - subscription_topics(subscribed_units, legacy_topics): Return the MQTT topic filters to subscribe to.
+    - close(): Flush pending messages and release the MQTT and database connections.
     """
-    def __init__(self, topic: str, url: str, table_name: str, columns: list):
+    # "Units" columns maintained from telemetry
+    UNIT_STATE_COLUMNS = ['fuel_level', 'current_speed', 'panic_button_active', 'rpm', 'temperature', 'updated_at']
+    
+    # Parameter names as published on the legacy U{unit}_{parameter} topics
+    LEGACY_PARAMETERS = ['Combustible', 'Velocidad', 'Panic', 'RPM', 'Temperatura', 'Latitud', 'Longitud']
+    
+    # History tables appended in bulk at the end of every batch
+    HISTORY_COLUMNS = {
+        'SpeedHistory': ['speed_id', 'unit_id', 'speed', 'recorded_at'],
+        'LocationHistory': ['location_id', 'unit_id', 'latitude', 'longitude', 'recorded_at'],
+    }
+    
+    def __init__(self, topic: str, url: str, table_name: str, columns: list,
+                 queue_size: int = 10000, flush_size: int = 500, flush_interval: float = 0.5,
+                 location_pair_window: float = 2.0, location_orphan_policy: str = 'flush',
+                 unknown_unit_policy: str = 'register', unit_refresh_interval: float = 300,
+                 db_options: dict = None, commit_policy: CommitPolicy = None, history_async_commit: bool = False,
+                 subscribed_units: list = None, legacy_topics: bool = True, reorder_window: float = 2.0,
+                 deadband: DeadbandFilter = None, trajectory: TrajectoryCompressor = None,
+                 daily_reports: DailyReportAggregator = None, rules: RuleEngine = None,
+                 fleet_state: FleetState = None, partition_options: dict = None, rollups: RollupAggregator = None,
+                 metrics: Metrics = None, trace_units: list = None):
         """
         Initialize the MQTTToDatabaseWriter with a topic and database connection.
         
@@ -35,20 +108,187 @@ class MQTTToDatabaseWriter:
         - url (str): The database URL to connect to.
         - table_name (str): The name of the database table to write data to.
         - columns (list): The list of columns in the database table.
+        - queue_size (int): Maximum number of messages waiting to be written.
+        - flush_size (int): Number of queued messages that triggers a database write.
+        - flush_interval (float): Maximum time in seconds a message waits before being written.
+        - location_pair_window (float): Maximum seconds between the latitude and longitude of a fix.
+        - location_orphan_policy (str): 'flush' to write unpaired coordinates alone, 'drop' to discard them.
+        - unknown_unit_policy (str): 'register' to create units missing from "Units", 'reject' to drop their messages.
+        - unit_refresh_interval (float): Seconds between reloads of the known units.
+        - db_options (dict): Connection pool and retry options passed to DatabaseConnection (optional).
+        - commit_policy (CommitPolicy): When to commit; defaults to one commit per batch.
+        - history_async_commit (bool): Write history rows in their own synchronous_commit=off
+          transaction, accepting the loss of the last few samples on a database crash.
+        - subscribed_units (list): Unit numbers to subscribe to; None subscribes to fleet/+/+ (every unit).
+        - legacy_topics (bool): Also subscribe to the legacy U{unit}_{parameter} topics of subscribed_units.
+        - reorder_window (float): Seconds history rows are held to sort late samples; 0 disables the wait.
+        - deadband (DeadbandFilter): Skip values that have not meaningfully changed (optional).
+        - trajectory (TrajectoryCompressor): Keep only the fixes needed to redraw each track within
+          tolerance (optional).
+        - daily_reports (DailyReportAggregator): Aggregate the history rows into "DailyReport" (optional).
+        - rules (RuleEngine): Detect alert conditions and write them to "Notifications" (optional).
+        - fleet_state (FleetState): Keep the latest state of every unit in memory for readers (optional).
+        - partition_options (dict): PartitionManager options to maintain the daily history partitions
+          (optional; tables that are not partitioned are left alone).
+        - rollups (RollupAggregator): Maintain "MinuteRollup" and "HourRollup" from the incoming values (optional).
+        - metrics (Metrics): Registry to record the writer metrics in (optional).
+        - trace_units (list): Unit numbers whose messages are logged at debug level, whatever
+          the log level, as they are queued and applied (optional).
         """
         self.mqtt_client = mqtt.Client()
-        self.db = DatabaseConnection(url)
+        self.db = DatabaseConnection(url, **(db_options or {}))
         self.topic = topic
         self.table_name = table_name
         self.columns = columns
+        self.subscribed_units = subscribed_units
+        self.legacy_topics = legacy_topics
+        self.trace_units = frozenset(trace_units or ())
+        if self.trace_units:
+            tracer.setLevel(logging.DEBUG)
+        
+        # Decouple the MQTT network thread from the database round trips
+        self.batch_writer = BatchWriter(
+            self._write_batch,
+            max_queue_size=queue_size,
+            flush_size=flush_size,
+            flush_interval=flush_interval,
+            tick_handler=self._housekeeping
+        )
+        
+        # Unit of work: statements sent but not committed yet, replayed if the connection drops
+        self.commit_policy = commit_policy or CommitPolicy()
+        self.history_async_commit = history_async_commit
+        self._uncommitted = []
+        self._deferred_history = []
+        self._transaction_opened_at = 0.0
+        
+        # Coalesce the per-field "Units" updates of a batch into one row per unit
+        self.unit_state = UnitStateBuffer()
+        self.reorder = ReorderBuffer(window=reorder_window)
+        self.deadband = deadband
+        self.trajectory = trajectory
+        self.daily_reports = daily_reports
+        self.rollups = rollups
+        self.rules = rules
+        self.fleet_state = fleet_state
+        self.partitions = PartitionManager(self.db, **partition_options) if partition_options is not None else None
+        self.location_pairer = LocationPairer(window=location_pair_window, orphan_policy=location_orphan_policy)
 
         # Define the last message time as None initially
         self.last_message_time = None
         
+        # Batches applied since the last commit, for the receive-to-commit latency
+        self._applied_batches = []
+        self.metrics = metrics
+        if self.metrics is not None:
+            self.__setup_metrics()
+        
+        # Resolve each distinct topic once and dispatch straight to its handler
+        self.router = TopicRouter(self._get_or_create_unit_id)
+        self.__setup_topic_routes()
+        
+        # Resolve unit numbers from memory; routes are re-resolved when the known units change
+        self.units = UnitRegistry(
+            self.db,
+            unknown_policy=unknown_unit_policy,
+            refresh_interval=unit_refresh_interval,
+            on_change=self.router.clear_cache
+        )
+        if self.units.load():
+            logger.info("🚐 Loaded %d units", len(self.units))
+        # Keep the newest value of each "Units" column once it has its own time (migration 003)
+        unit_columns = self.db.column_names('Units')
+        self.unit_state.field_timestamps = all(f'{field}_at' in unit_columns for field in UnitStateBuffer.FIELDS)
+        if unit_columns and not self.unit_state.field_timestamps:
+            logger.warning("⚠️ \"Units\" has no per-field times, a late value may be dropped when another "
+                           "field is newer: run migrate.py (migration 003)")
+        # Today's partitions must exist before the first rows arrive; later runs happen
+        # on the maintenance thread, never on the thread writing batches
+        if self.partitions is not None:
+            self.partitions.start()
+        # Serve the current state of every unit, not only the ones heard from since startup
+        if self.fleet_state is not None:
+            self.fleet_state.number_of = self.units.number_of
+            self.fleet_state.load(self.db)
+        # Continue today's reports from the counts already stored
+        if self.daily_reports is not None:
+            self.daily_reports.load(self.db)
+        # Notifications reference their type, so make sure every rule has one
+        if self.rules is not None:
+            self.db.upsert_rows('NotificationTypes', self.rules.notification_types(),
+                                conflict_columns=['notification_type_id'], update_columns=[])
+        
         # Set up MQTT callbacks
         self.__setup_mqtt_callbacks()
         
         
+    def __setup_topic_routes(self):
+        """
+        Register the handler of every supported telemetry parameter.
+        
+        Parameters:
+        - None
+        
+        Returns:
+        - None
+        """
+        self.register_parameter(['combustible', 'fuel'], self._handle_fuel)
+        self.register_parameter(['velocidad', 'speed'], self._handle_speed)
+        self.register_parameter('panic', self._handle_panic)
+        self.register_parameter('rpm', self._handle_rpm)
+        self.register_parameter(['temperatura', 'temperature'], self._handle_temperature)
+        self.register_parameter(['latitud', 'latitude'], self._handle_latitude)
+        self.register_parameter(['longitud', 'longitude'], self._handle_longitude)
+        # Every metric of a unit in one message (see TelemetryFrame)
+        self.register_parameter('packed', self._handle_packed)
+        self.register_parameter('frame', self._handle_frame, binary=True)
+    
+    def register_parameter(self, names, handler, binary=False):
+        """
+        Route a telemetry parameter to a handler.
+        
+        Parameters:
+        - names (str | list): Parameter name or aliases as they appear in topics (case-insensitive).
+        - handler (callable): Called on the writer thread as handler(unit_uuid, payload, timestamp).
+        - binary (bool): Pass the raw payload bytes instead of the decoded text.
+        
+        Returns:
+        - None
+        """
+        self.router.register(names, handler, binary)
+        
+    def __setup_metrics(self):
+        """
+        Register the writer metrics.
+        
+        Receive counters are updated on the thread receiving messages, the others on the
+        thread writing batches; each family has a single writer thread.
+        """
+        metrics = self.metrics
+        self._messages_received = metrics.counter('messages_received_total', 'Messages received from the broker')
+        self._messages_parsed = metrics.counter(
+            'messages_parsed_total', 'Messages routed to a unit and parameter', labels=('parameter',))
+        self._messages_dropped = metrics.counter(
+            'messages_dropped_total', 'Messages discarded before the write queue', labels=('parameter', 'reason'))
+        self._messages_failed = metrics.counter(
+            'messages_failed_total', 'Messages whose value could not be applied', labels=('parameter',))
+        self._unit_messages = metrics.counter(
+            'unit_messages_total', 'Messages routed per unit number', labels=('unit',))
+        self._batch_messages = metrics.histogram(
+            'batch_messages', 'Messages per written batch', buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000))
+        self._receive_to_commit = metrics.histogram(
+            'receive_to_commit_seconds', 'Time from receiving a message to committing its batch')
+        self._statement_seconds = metrics.histogram(
+            'db_statement_seconds', 'Time to send the rows of a batch to one table', labels=('table',))
+        self._commit_seconds = metrics.histogram('db_commit_seconds', 'Time to commit a transaction')
+        metrics.gauge('queue_depth', 'Messages waiting in the write queue', self._queue_depth)
+        metrics.gauge('history_rows_held', 'History rows held in the reorder window', lambda: self.reorder.held)
+        metrics.counter_view(
+            'location_pairing_total', 'Positions paired from two halves, and unpaired halves flushed or dropped',
+            self._location_pairing, labels=('outcome',))
+        metrics.gauge(
+            'location_halves_waiting', 'Coordinate halves waiting for their partner', lambda: len(self.location_pairer))
+    
     def __setup_mqtt_callbacks(self):
         """
         Set up the MQTT client callbacks for connection and message handling.
@@ -78,11 +318,41 @@ class MQTTToDatabaseWriter:
         Returns:
         - None
         """
-        print(f"Connecting to MQTT broker at {endpoint}:{port}")
+        self.batch_writer.start()
+        logger.info("Connecting to MQTT broker at %s:%s", endpoint, port)
         self.mqtt_client.connect(endpoint, port, keep_alive)
-        print("Connected to MQTT broker, subscribing to vehicle telemetry topics...")
+        logger.info("Connected to MQTT broker, subscribing to vehicle telemetry topics...")
         self.mqtt_client.loop_forever()
     
+    def close(self):
+        """
+        Flush the queued messages and release the MQTT and database connections.
+        
+        Returns:
+        - None
+        """
+        self.mqtt_client.disconnect()
+        self.batch_writer.stop()
+        # Coordinates still waiting for their partner are handled by the orphan policy
+        self._queue_location_rows(self.location_pairer.expire())
+        logger.info("📍 Location pairing: %s", self.location_pairer.stats())
+        self._write_pending(self._take_pending(final=True))
+        logger.info("🕒 Reordering: %s, units: %s", self.reorder.stats(), self.unit_state.stats())
+        if self.deadband is not None:
+            logger.info("🔇 Deadband: %s", self.deadband.stats())
+        if self.trajectory is not None:
+            logger.info("🗺️ Trajectory compression: %s", self.trajectory.stats())
+        if self.daily_reports is not None:
+            logger.info("📊 Daily reports: %s", self.daily_reports.stats())
+        if self.rollups is not None:
+            logger.info("📈 Rollups: %s", self.rollups.stats())
+        if self.rules is not None:
+            logger.info("🚨 Notifications: %s", self.rules.stats())
+        if self.partitions is not None:
+            self.partitions.stop()
+        logger.info("🐘 Database pool: %s", self.db.pool_stats())
+        self.db.close()
+    
     
     def on_connect(self, client, userdata, flags, rc):
         """
@@ -95,32 +365,32 @@ class MQTTToDatabaseWriter:
         - rc: The connection result code (0 = success)
         """
         if rc == 0:
-            print("Connected to MQTT Service!")
-            # Subscribe to specific topics for units 1, 2, 3 (no wildcards to avoid issues)
-            topics = [
-                "U1_Combustible", "U2_Combustible", "U3_Combustible",
-                "U1_Velocidad", "U2_Velocidad", "U3_Velocidad",
-                "U1_Panic", "U2_Panic", "U3_Panic",
-                "U1_RPM", "U2_RPM", "U3_RPM",
-                "U1_Temperatura", "U2_Temperatura", "U3_Temperatura",
-                "U1_Latitud", "U2_Latitud", "U3_Latitud",
-                "U1_Longitud", "U2_Longitud", "U3_Longitud"
-            ]
-            
-            success_count = 0
-            for topic in topics:
-                result = client.subscribe(topic)
-                if result[0] == 0:
-                    success_count += 1
-                    print(f"✅ Subscribed to {topic}")
-                else:
-                    print(f"❌ Failed to subscribe to {topic}: {result}")
-            
-            print(f"🚐 Successfully subscribed to {success_count}/{len(topics)} topics!")
-            if success_count > 0:
-                print("Ready to receive vehicle telemetry data!")
+            logger.info("Connected to MQTT Service!")
+            # One SUBSCRIBE for every topic, so reconnecting costs a single round trip
+            topics = self.subscription_topics(self.subscribed_units, self.legacy_topics)
+            result, _ = client.subscribe([(topic, 0) for topic in topics])
+            if result == mqtt.MQTT_ERR_SUCCESS:
+                logger.info("🚐 Subscribed to %d topic filters: %s%s", len(topics), ', '.join(topics[:5]),
+                            ' ...' if len(topics) > 5 else '')
+                logger.info("Ready to receive vehicle telemetry data!")
+            else:
+                logger.error("❌ Failed to subscribe: %s", mqtt.error_string(result))
         else:
-            print(f"Failed to connect: {rc}. loop_forever() will retry connection")
+            logger.warning("Failed to connect: %s. loop_forever() will retry connection", rc)
+    
+    @classmethod
+    def subscription_topics(cls, subscribed_units=None, legacy_topics=True):
+        """
+        Return the MQTT topic filters the writer subscribes to.
+        
+        Parameters:
+        - subscribed_units (list): Unit numbers to subscribe to; None subscribes to every unit
+        - legacy_topics (bool): Include the legacy U{unit}_{parameter} topics of subscribed_units
+        
+        Returns:
+        - list: Topic filters
+        """
+        return TopicRouter.subscriptions(subscribed_units, cls.LEGACY_PARAMETERS if legacy_topics else ())
     
     def on_message(self, client, userdata, msg):
         """
@@ -132,197 +402,538 @@ class MQTTToDatabaseWriter:
         - msg: The message received
         """
         try:
-            topic = msg.topic
-            payload = msg.payload.decode('utf-8')
-            
-            print(f"📨 Received: {topic} = {payload}")
-            
-            # Parse the topic to extract unit and parameter
-            unit_info = self._parse_topic(topic)
-            if unit_info:
-                print(f"🔍 Parsed: Unit {unit_info['unit_number']}, Parameter: {unit_info['parameter']}")
-                self._write_to_database(unit_info, payload)
-                self.last_message_time = datetime.datetime.now()
-                print(f"✅ Data written to database")
-            else:
-                print(f"❌ Could not parse topic: {topic}")
-                
+            self.ingest(msg.topic, msg.payload)
         except Exception as e:
-            print(f"💥 Error processing message: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("💥 Error processing message: %s", e)
     
-    def _parse_topic(self, topic):
+    def ingest(self, topic, payload, received_at=None):
         """
-        Parse MQTT topic to extract unit ID and parameter type.
-        
-        Expected formats: 
-        - U{unit_number}_{parameter} (e.g., U1_Combustible, U3_Velocidad, U2_Panic)
-        - U{unit_number}/{parameter} (e.g., U1/Combustible, U3/Velocidad, U2/Panic)
+        Route a received message and queue it for the writer thread.
         
         Parameters:
         - topic (str): The MQTT topic
+        - payload (bytes | str): The message payload; decoded as UTF-8 unless the route is binary
+        - received_at (datetime.datetime): When the message was received (defaults to now)
         
         Returns:
-        - dict: Dictionary with unit_id and parameter type, or None if parsing fails
+        - bool: True if the message was queued, False if it could not be routed or the queue was full
+        """
+        metrics = self.metrics
+        if metrics is not None:
+            self._messages_received.inc()
+        # Resolve the topic to its unit and parameter handler (memoized per topic)
+        route = self.router.resolve(topic)
+        if not route:
+            if metrics is not None:
+                self._messages_dropped.inc(('', 'unroutable'))
+            logger.warning("❌ Could not route topic (unknown format, unit or parameter): %s", topic)
+            return False
+        if metrics is not None:
+            self._messages_parsed.inc(route.parameter)
+            self._unit_messages.inc(route.unit_number)
+        if not route.binary and isinstance(payload, bytes):
+            payload = payload.decode('utf-8')
+        received_at = received_at or datetime.datetime.now()
+        if route.unit_number in self.trace_units:
+            tracer.debug("📨 Received %s: %r", topic, payload,
+                         extra={'unit': route.unit_number, 'parameter': route.parameter})
+        # Hand off to the writer thread; never wait on the database here
+        if not self.batch_writer.submit((route, payload, received_at)):
+            if metrics is not None:
+                self._messages_dropped.inc((route.parameter, 'queue_full'))
+            logger.warning("❌ Write queue full, dropped: %s = %r", topic, payload)
+            return False
+        self.last_message_time = received_at
+        return True
+    
+    def _write_batch(self, batch):
         """
-        # Try format with underscore first: U1_Combustible
-        pattern1 = r'U(\d+)_(.+)'
-        match = re.match(pattern1, topic)
+        Write a batch of queued messages to the database.
         
-        if match:
-            unit_number = match.group(1)
-            parameter = match.group(2)
-            return {
-                'unit_number': unit_number,
-                'parameter': parameter.lower()
-            }
+        Messages are first applied to the in-memory buffers, then the coalesced rows
+        are sent in the open transaction, which is committed according to the commit
+        policy (by default once per batch).
         
-        # Try format with slash: U1/Combustible  
-        pattern2 = r'U(\d+)/(.+)'
-        match = re.match(pattern2, topic)
+        Parameters:
+        - batch (list): Tuples of (route, payload, received_at) queued by on_message
+        """
+        if self.metrics is not None:
+            self._batch_messages.observe(len(batch))
+        if self.commit_policy.per_message:
+            for item in batch:
+                self._apply([item])
+                self._send(self._take_pending())
+                self._commit()
+        else:
+            self._apply(batch)
+            self._send(self._take_pending())
+            if self.commit_policy.due(self._pending_statements(), self._transaction_opened_at):
+                self._commit()
+        # Nothing left to commit (e.g. every value filtered out): the batch is done
+        if not self._pending_statements():
+            self._observe_committed()
+        logger.debug("✅ Data written to database (%d messages)", len(batch))
+    
+    def _apply(self, batch):
+        """
+        Apply messages to the in-memory buffers without touching the database.
         
-        if match:
-            unit_number = match.group(1)
-            parameter = match.group(2)
-            return {
-                'unit_number': unit_number,
-                'parameter': parameter.lower()
-            }
+        Parameters:
+        - batch (list): Tuples of (route, payload, received_at) queued by on_message
+        """
+        for route, payload, received_at in batch:
+            self._write_to_database(route, payload, received_at)
+        self._queue_location_rows(self.location_pairer.expire(time.monotonic()))
+        if self.metrics is not None:
+            self._applied_batches.append(batch)
+    
+    def _housekeeping(self, idle):
+        """
+        Periodic work run on the writer thread between batches.
         
-        return None
+        Parameters:
+        - idle (bool): True if no message arrived for a whole flush interval
+        """
+        # History rows whose reorder window elapsed since the last batch
+        self._send(self._take_pending())
+        pending = self._pending_statements()
+        if pending and (idle or self.commit_policy.due(pending, self._transaction_opened_at)):
+            self._commit()
+        self.units.refresh_if_due()
     
-    def _write_to_database(self, unit_info, value):
+    def _pending_statements(self):
+        """Return the number of statements waiting for a commit"""
+        return len(self._uncommitted) + len(self._deferred_history)
+    
+    def _send(self, writes):
         """
-        Write the received data to the appropriate database table.
+        Send drained rows in the open transaction, opening one if needed.
+        
+        With history_async_commit, history rows are held back and written at commit
+        time in their own synchronous_commit=off transaction.
         
         Parameters:
-        - unit_info (dict): Dictionary with unit_number and parameter
-        - value (str): The value received from MQTT
+        - writes (list): (table, rows) pairs returned by _take_pending
         """
-        try:
-            # Convert value to appropriate type
+        for table, rows in writes:
+            if self.history_async_commit and table in self.HISTORY_COLUMNS:
+                if not self._pending_statements():
+                    self._transaction_opened_at = time.monotonic()
+                self._deferred_history.append((table, rows))
+                continue
+            if not self._uncommitted:
+                self.db.begin()
+                if not self._deferred_history:
+                    self._transaction_opened_at = time.monotonic()
+            self._uncommitted.append((table, rows))
+            try:
+                self._write_rows([(table, rows)])
+            except Exception as e:
+                self._replay_uncommitted(e)
+    
+    def _commit(self):
+        """
+        Commit the open transaction, then write the held back history rows.
+        """
+        if self._uncommitted:
             try:
-                numeric_value = float(value)
-            except ValueError:
-                numeric_value = None
-            
-            unit_number = unit_info['unit_number']
-            parameter = unit_info['parameter']
-            
-            # Find the unit_id based on unit_number (assuming some naming convention)
-            # For now, we'll generate a UUID based on unit number for demo purposes
-            unit_uuid = self._get_or_create_unit_id(unit_number)
-            
-            current_time = datetime.datetime.now()
-            
-            if parameter in ['combustible', 'fuel']:
-                self._update_unit_fuel_level(unit_uuid, numeric_value)
-            elif parameter in ['velocidad', 'speed']:
-                self._update_unit_speed(unit_uuid, numeric_value)
-                self._record_speed_history(unit_uuid, numeric_value, current_time)
-            elif parameter == 'panic':
-                self._update_unit_panic(unit_uuid, bool(int(value)) if value.isdigit() else False)
-            elif parameter == 'rpm':
-                self._update_unit_rpm(unit_uuid, int(numeric_value) if numeric_value else 0)
-            elif parameter in ['temperatura', 'temperature']:
-                self._update_unit_temperature(unit_uuid, int(numeric_value) if numeric_value else 0)
-            elif parameter in ['latitud', 'latitude']:
-                # Store in a temporary location for pairing with longitude
-                self._store_temp_location(unit_uuid, 'latitude', numeric_value, current_time)
-            elif parameter in ['longitud', 'longitude']:
-                # Store in a temporary location for pairing with latitude
-                self._store_temp_location(unit_uuid, 'longitude', numeric_value, current_time)
+                started = time.perf_counter()
+                self.db.commit()
+                if self.metrics is not None:
+                    self._commit_seconds.observe(time.perf_counter() - started)
+                self._uncommitted = []
+            except Exception as e:
+                self._replay_uncommitted(e)
+        if self._deferred_history:
+            writes, self._deferred_history = self._deferred_history, []
+            self._write_pending(writes, synchronous_commit=False)
+        self._observe_committed()
+    
+    def _observe_committed(self):
+        """Record the receive-to-commit latency of the messages applied since the last commit"""
+        if not self._applied_batches:
+            return
+        now = datetime.datetime.now()
+        for batch in self._applied_batches:
+            for _, _, received_at in batch:
+                self._receive_to_commit.observe((now - received_at).total_seconds())
+        self._applied_batches = []
+    
+    def _queue_depth(self):
+        """Return the number of messages waiting to be written"""
+        return self.batch_writer.queue_depth()
+    
+    def _location_pairing(self):
+        """Return the LocationPairer counters by outcome"""
+        pairer = self.location_pairer
+        return {'paired': pairer.pairs,
+                'orphan_flushed': pairer.orphans_flushed,
+                'orphan_dropped': pairer.orphans_dropped}
+    
+    def _replay_uncommitted(self, error):
+        """
+        Roll back the open transaction and write its rows again in a fresh one.
+        
+        Parameters:
+        - error (Exception): The error that aborted the open transaction
+        """
+        logger.warning("⚠️ Transaction with %d statements failed (%s), replaying it", len(self._uncommitted), error)
+        self.db.rollback(error)
+        writes, self._uncommitted = self._uncommitted, []
+        self._write_pending(writes)
+    
+    def _take_pending(self, final=False):
+        """
+        Drain the "Units" updates buffered during the batch and the history rows
+        whose reorder window has elapsed.
+        
+        "Units" comes first so notifications, history rows and daily reports of newly
+        created units satisfy their foreign keys. Alerts raised during the batch are
+        published here, without waiting for the write.
+        
+        Parameters:
+        - final (bool): Release every history row still held, e.g. on shutdown
+        
+        Returns:
+        - list: (table, rows) pairs in write order
+        """
+        writes = []
+        unit_rows = self.unit_state.drain()
+        if unit_rows:
+            writes.append(('Units', unit_rows))
+        if self.rules is not None:
+            notifications, alerts = self.rules.take()
+            if notifications:
+                writes.append(('Notifications', notifications))
+            for alert in alerts:
+                self._publish_alert(*alert)
+        now = None if final else time.monotonic()
+        released = self.reorder.release(now)
+        # Daily reports see every sample, before the track is simplified
+        if self.daily_reports is not None:
+            self.daily_reports.add_speeds(released.get('SpeedHistory', ()))
+            self.daily_reports.add_locations(released.get('LocationHistory', ()))
+        if self.trajectory is not None:
+            released['LocationHistory'] = self._compress_locations(released.get('LocationHistory', ()), now)
+        for table in self.HISTORY_COLUMNS:
+            rows = released.get(table)
+            if rows:
+                writes.append((table, rows))
+        if self.daily_reports is not None:
+            report_rows = self.daily_reports.take_rows(now)
+            if report_rows:
+                writes.append(('DailyReport', report_rows))
+        if self.rollups is not None:
+            writes.extend(self.rollups.take_rows(now))
+        return writes
+    
+    def _compress_locations(self, rows, now):
+        """
+        Simplify released LocationHistory rows, adding the last buffered fix of quiet tracks.
+        
+        Parameters:
+        - rows (list): LocationHistory rows released in recorded-time order
+        - now (float): time.monotonic(), or None to flush every track
+        
+        Returns:
+        - list: The rows to write
+        """
+        kept = []
+        for row in rows:
+            kept.extend(self.trajectory.add(row))
+        kept.extend(self.trajectory.expire(now))
+        return kept
+    
+    def _write_pending(self, writes, synchronous_commit=True):
+        """
+        Write drained rows in one transaction, falling back to one row per transaction.
+        
+        Parameters:
+        - writes (list): (table, rows) pairs returned by _take_pending
+        - synchronous_commit (bool): False to commit with synchronous_commit=off
+        
+        Returns:
+        - bool: True if everything was written in one transaction
+        """
+        if not writes:
+            return True
+        try:
+            self.db.run_transaction(lambda: self._write_rows(writes), synchronous_commit)
+            return True
+        except Exception as e:
+            logger.warning("⚠️ Batch write failed (%s), retrying row by row", e)
+        
+        for table, rows in writes:
+            for row in rows:
+                try:
+                    self.db.run_transaction(lambda: self._write_rows([(table, [row])]), synchronous_commit)
+                except Exception as e:
+                    logger.error("❌ Dropped %s row: %s", table, e)
+        return False
+    
+    def _write_rows(self, writes):
+        """
+        Issue the statements for drained rows: one upsert for "Units", "DailyReport" and
+        each rollup table, one bulk copy per history table and for "Notifications", skipping rows already stored.
+        
+        Parameters:
+        - writes (list): (table, rows) pairs returned by _take_pending
+        """
+        for table, rows in writes:
+            started = time.perf_counter()
+            if table == 'Units':
+                self._upsert_units(rows)
+            elif table == 'DailyReport':
+                self.db.upsert_rows('DailyReport', rows, conflict_columns=['daily_report_id'],
+                                    update_columns=DailyReportAggregator.UPDATE_COLUMNS)
+            elif table in RollupAggregator.TABLES:
+                self.db.upsert_rows(table, rows, conflict_columns=RollupAggregator.CONFLICT_COLUMNS, update_columns=[],
+                                    merge_columns=RollupAggregator.MERGE_COLUMNS)
+            elif table == 'Notifications':
+                self.db.copy_rows(table, RuleEngine.COLUMNS, rows, skip_duplicates=True)
             else:
-                print(f"Unknown parameter: {parameter}")
-                
+                self.db.copy_rows(table, self.HISTORY_COLUMNS[table], rows, skip_duplicates=True)
+            if self.metrics is not None:
+                self._statement_seconds.observe(time.perf_counter() - started, table)
+    
+    def _upsert_units(self, rows):
+        """
+        Write coalesced "Units" updates with one multi-row upsert.
+        
+        Units that do not exist yet are created instead of being silently ignored.
+        Fields not received during the batch keep their stored values. Each field keeps
+        the newer of its stored and incoming value by its "<field>_at" time; without
+        those columns, rows older than the stored updated_at are left alone.
+        """
+        self.db.upsert_rows('Units', rows, conflict_columns=['unit_id'], **self._prepare_unit_rows(rows))
+    
+    def _prepare_unit_rows(self, rows):
+        """
+        Stamp created_at on coalesced "Units" rows and return the upsert options for them.
+        """
+        for row in rows:
+            row['created_at'] = row['updated_at']
+        if self.unit_state.field_timestamps:
+            return {'update_columns': [], 'merge_columns': UnitStateBuffer.MERGE_COLUMNS}
+        return {
+            'update_columns': [col for col in self.UNIT_STATE_COLUMNS if any(col in row for row in rows)],
+            'newer_column': 'updated_at',
+        }
+    
+    def _write_to_database(self, route, value, received_at=None):
+        """
+        Write the received data to the appropriate database table.
+        
+        Parameters:
+        - route (Route): The resolved topic with the unit UUID and parameter handler
+        - value (str): The value received from MQTT, optionally suffixed with "@<epoch seconds>"
+        - received_at (datetime.datetime): When the message was received (defaults to now)
+        """
+        try:
+            timestamp = received_at or datetime.datetime.now()
+            if not route.binary and '@' in value:
+                value, recorded_at = self._split_timestamp(value)
+                timestamp = recorded_at or timestamp
+            route.handler(route.unit_uuid, value, timestamp)
+            if route.unit_number in self.trace_units:
+                tracer.debug("🔍 Applied %s = %r recorded at %s", route.parameter, value, timestamp,
+                             extra={'unit': route.unit_number, 'parameter': route.parameter})
         except Exception as e:
-            print(f"Error writing to database: {e}")
+            if self.metrics is not None:
+                self._messages_failed.inc(route.parameter)
+            logger.error("Error writing to database: %s", e,
+                         extra={'unit': route.unit_number, 'parameter': route.parameter})
+    
+    @staticmethod
+    def _split_timestamp(value):
+        """
+        Split the device timestamp off a "<value>@<epoch seconds>" payload.
+        
+        Returns:
+        - tuple: (value, recorded_at as datetime.datetime, or None if the suffix is empty)
+        """
+        value, _, epoch = value.rpartition('@')
+        return value, (datetime.datetime.fromtimestamp(float(epoch)) if epoch else None)
+    
+    @staticmethod
+    def _to_float(value):
+        """Convert a payload to float, or None if it is not numeric"""
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    
+    def _worth_writing(self, unit_id, field, value, timestamp):
+        """Run the alert rules and rollups on a value, then check it against the deadband filter, if any"""
+        if self.rules is not None:
+            self.rules.evaluate(unit_id, field, value, timestamp)
+        if self.rollups is not None:
+            self.rollups.add(unit_id, field, value, timestamp)
+        return self.deadband is None or self.deadband.accept(unit_id, field, value, timestamp)
+    
+    def _publish_alert(self, unit_id, rule, value, detail, recorded_at):
+        """
+        Publish an alert on the rules' alert topic, if connected to the broker.
+        
+        Parameters:
+        - unit_id (str): The unit UUID
+        - rule (str): The rule that fired
+        - value: The value that fired it
+        - detail (str): The notification detail
+        - recorded_at (datetime.datetime): When the value was recorded
+        """
+        if not self.mqtt_client.is_connected():
+            return
+        topic, payload = self._alert_message(unit_id, rule, value, detail, recorded_at)
+        self.mqtt_client.publish(topic, payload, qos=1)
+    
+    def _alert_message(self, unit_id, rule, value, detail, recorded_at):
+        """
+        Build the topic and JSON payload of an alert.
+        
+        Returns:
+        - tuple: (topic, payload)
+        """
+        unit_number = self.units.number_of(unit_id)
+        topic = self.rules.alert_topic.format(unit=unit_number or unit_id, rule=rule)
+        payload = json.dumps({
+            'unit': unit_number,
+            'unit_id': unit_id,
+            'rule': rule,
+            'value': value,
+            'detail': detail,
+            'recorded_at': recorded_at.isoformat(),
+        })
+        return topic, payload
+    
+    def _handle_fuel(self, unit_uuid, value, timestamp):
+        """Handle a Combustible message"""
+        fuel_level = self._to_float(value)
+        if self._worth_writing(unit_uuid, 'fuel_level', fuel_level, timestamp):
+            self._update_unit_fuel_level(unit_uuid, fuel_level, timestamp)
+    
+    def _handle_speed(self, unit_uuid, value, timestamp):
+        """Handle a Velocidad message"""
+        speed = self._to_float(value)
+        # A skipped speed is skipped for "Units" and SpeedHistory alike
+        if self._worth_writing(unit_uuid, 'current_speed', speed, timestamp):
+            self._update_unit_speed(unit_uuid, speed, timestamp)
+            self._record_speed_history(unit_uuid, speed, timestamp)
+    
+    def _handle_panic(self, unit_uuid, value, timestamp):
+        """Handle a Panic message"""
+        panic_active = bool(int(value)) if value.isdigit() else False
+        if self._worth_writing(unit_uuid, 'panic_button_active', panic_active, timestamp):
+            self._update_unit_panic(unit_uuid, panic_active, timestamp)
+    
+    def _handle_rpm(self, unit_uuid, value, timestamp):
+        """Handle an RPM message"""
+        numeric_value = self._to_float(value)
+        rpm = int(numeric_value) if numeric_value else 0
+        if self._worth_writing(unit_uuid, 'rpm', rpm, timestamp):
+            self._update_unit_rpm(unit_uuid, rpm, timestamp)
+    
+    def _handle_temperature(self, unit_uuid, value, timestamp):
+        """Handle a Temperatura message"""
+        numeric_value = self._to_float(value)
+        temperature = int(numeric_value) if numeric_value else 0
+        if self._worth_writing(unit_uuid, 'temperature', temperature, timestamp):
+            self._update_unit_temperature(unit_uuid, temperature, timestamp)
+    
+    def _handle_latitude(self, unit_uuid, value, timestamp):
+        """Handle a Latitud message"""
+        self._store_temp_location(unit_uuid, 'latitude', self._to_float(value), timestamp)
+    
+    def _handle_longitude(self, unit_uuid, value, timestamp):
+        """Handle a Longitud message"""
+        self._store_temp_location(unit_uuid, 'longitude', self._to_float(value), timestamp)
+    
+    def _handle_packed(self, unit_uuid, value, timestamp):
+        """Handle a packed JSON message carrying several metrics"""
+        recorded_at, values = TelemetryFrame.decode_json(value)
+        self._apply_packed(unit_uuid, values, recorded_at or timestamp)
+    
+    def _handle_frame(self, unit_uuid, value, timestamp):
+        """Handle a packed binary frame carrying several metrics"""
+        recorded_at, values = TelemetryFrame.decode(value)
+        self._apply_packed(unit_uuid, values, recorded_at)
+    
+    def _apply_packed(self, unit_id, values, timestamp):
+        """
+        Apply every metric of a packed message: one coalesced "Units" update, plus the
+        speed sample and location that the metrics carry
+        """
+        latitude, longitude = values.pop('latitude', None), values.pop('longitude', None)
+        # What is left are "Units" columns
+        if values and self.rules is not None:
+            self.rules.evaluate_many(unit_id, values, timestamp)
+        if values and self.rollups is not None:
+            self.rollups.add_many(unit_id, values, timestamp)
+        if values and self.deadband is not None:
+            values = self.deadband.accept_many(unit_id, values, timestamp)
+        if values:
+            accepted = self.unit_state.update_many(unit_id, values, timestamp)
+            if accepted and self.fleet_state is not None:
+                self.fleet_state.update(unit_id, accepted, timestamp)
+        if 'current_speed' in values:
+            self._record_speed_history(unit_id, values['current_speed'], timestamp)
+        if latitude is not None and longitude is not None:
+            # Both halves arrived together: no pairing needed
+            self._queue_location_rows([(unit_id, latitude, longitude, timestamp)])
+        elif latitude is not None:
+            self._store_temp_location(unit_id, 'latitude', latitude, timestamp)
+        elif longitude is not None:
+            self._store_temp_location(unit_id, 'longitude', longitude, timestamp)
     
     def _get_or_create_unit_id(self, unit_number):
         """
-        Get or create a unit ID based on unit number.
-        For demo purposes, this creates a deterministic UUID.
+        Get the unit ID of a unit number from the cached unit registry.
+        Returns None if the unit is unknown and the registry rejects unknown units.
         """
-        # Create a deterministic UUID based on unit number
-        namespace = uuid.UUID('6ba7b810-9dad-11d1-80b4-00c04fd430c8')
-        return str(uuid.uuid5(namespace, f"unit_{unit_number}"))
+        return self.units.resolve(unit_number)
     
-    def _update_unit_fuel_level(self, unit_id, fuel_level):
-        """Update fuel level in Units table"""
-        data = {
-            'fuel_level': fuel_level,
-            'updated_at': datetime.datetime.now()
-        }
-        where_clause = 'unit_id = :unit_id'
-        where_params = {'unit_id': unit_id}
-        self.db.update_data('Units', data, where_clause, where_params)
-    
-    def _update_unit_speed(self, unit_id, speed):
-        """Update current speed in Units table"""
-        data = {
-            'current_speed': speed,
-            'updated_at': datetime.datetime.now()
-        }
-        where_clause = 'unit_id = :unit_id'
-        where_params = {'unit_id': unit_id}
-        self.db.update_data('Units', data, where_clause, where_params)
-    
-    def _update_unit_panic(self, unit_id, panic_active):
-        """Update panic button status in Units table"""
-        data = {
-            'panic_button_active': panic_active,
-            'updated_at': datetime.datetime.now()
-        }
-        where_clause = 'unit_id = :unit_id'
-        where_params = {'unit_id': unit_id}
-        self.db.update_data('Units', data, where_clause, where_params)
-    
-    def _update_unit_rpm(self, unit_id, rpm):
-        """Update RPM in Units table"""
-        data = {
-            'rpm': rpm,
-            'updated_at': datetime.datetime.now()
-        }
-        where_clause = 'unit_id = :unit_id'
-        where_params = {'unit_id': unit_id}
-        self.db.update_data('Units', data, where_clause, where_params)
-    
-    def _update_unit_temperature(self, unit_id, temperature):
-        """Update temperature in Units table"""
-        data = {
-            'temperature': temperature,
-            'updated_at': datetime.datetime.now()
-        }
-        where_clause = 'unit_id = :unit_id'
-        where_params = {'unit_id': unit_id}
-        self.db.update_data('Units', data, where_clause, where_params)
+    def _update_unit_field(self, unit_id, field, value, timestamp):
+        """Queue a field update for the Units table and mirror it in the fleet state"""
+        if self.unit_state.update(unit_id, field, value, timestamp) and self.fleet_state is not None:
+            self.fleet_state.update(unit_id, {field: value}, timestamp or datetime.datetime.now())
+    
+    def _update_unit_fuel_level(self, unit_id, fuel_level, timestamp=None):
+        """Queue a fuel level update for the Units table"""
+        self._update_unit_field(unit_id, 'fuel_level', fuel_level, timestamp)
+    
+    def _update_unit_speed(self, unit_id, speed, timestamp=None):
+        """Queue a current speed update for the Units table"""
+        self._update_unit_field(unit_id, 'current_speed', speed, timestamp)
+    
+    def _update_unit_panic(self, unit_id, panic_active, timestamp=None):
+        """Queue a panic button status update for the Units table"""
+        self._update_unit_field(unit_id, 'panic_button_active', panic_active, timestamp)
+    
+    def _update_unit_rpm(self, unit_id, rpm, timestamp=None):
+        """Queue an RPM update for the Units table"""
+        self._update_unit_field(unit_id, 'rpm', rpm, timestamp)
+    
+    def _update_unit_temperature(self, unit_id, temperature, timestamp=None):
+        """Queue a temperature update for the Units table"""
+        self._update_unit_field(unit_id, 'temperature', temperature, timestamp)
     
     def _record_speed_history(self, unit_id, speed, timestamp):
-        """Record speed in SpeedHistory table"""
-        data = {
-            'speed_id': str(uuid.uuid4()),
-            'unit_id': unit_id,
-            'speed': speed,
-            'recorded_at': timestamp
-        }
-        self.db.insert_data('SpeedHistory', data)
+        """Queue a speed sample for the SpeedHistory table"""
+        speed_id = IdGenerator.for_sample(unit_id, 'SpeedHistory', timestamp)
+        self.reorder.add('SpeedHistory', unit_id, timestamp, (speed_id, unit_id, speed, timestamp))
     
     def _store_temp_location(self, unit_id, coord_type, value, timestamp):
         """
-        Store location data in LocationHistory table
+        Hold one coordinate until its partner arrives, then queue the paired
+        location for the LocationHistory table
         """
-        data = {
-            'location_id': str(uuid.uuid4()),
-            'unit_id': unit_id,
-            'recorded_at': timestamp
-        }
-        
-        if coord_type == 'latitude':
-            data['latitude'] = value
-            data['longitude'] = None
-        else:  # longitude
-            data['longitude'] = value
-            data['latitude'] = None
-        
-        self.db.insert_data('LocationHistory', data)
\ No newline at end of file
+        self._queue_location_rows(self.location_pairer.add(unit_id, coord_type, value, timestamp))
+    
+    def _queue_location_rows(self, rows):
+        """Queue (unit_id, latitude, longitude, recorded_at) rows for the LocationHistory table"""
+        for unit_id, latitude, longitude, recorded_at in rows:
+            if self.fleet_state is not None:
+                self.fleet_state.update_location(unit_id, latitude, longitude, recorded_at)
+            location_id = IdGenerator.for_sample(unit_id, 'LocationHistory', recorded_at)
+            self.reorder.add('LocationHistory', unit_id, recorded_at,
+                             (location_id, unit_id, latitude, longitude, recorded_at))
\ No newline at end of file
@@ -1 +1,16 @@
-from Schemas.Writer import MQTTToDatabaseWriter
\ No newline at end of file
+from Schemas.Writer import MQTTToDatabaseWriter
+from Schemas.UnitStateBuffer import UnitStateBuffer
+from Schemas.LocationPairer import LocationPairer
+from Schemas.TopicRouter import TopicRouter, Route
+from Schemas.UnitRegistry import UnitRegistry
+from Schemas.AsyncWriter import AsyncMQTTToDatabaseWriter
+from Schemas.ShardedWriter import ShardedWriter
+from Schemas.TelemetryFrame import TelemetryFrame
+from Schemas.ReorderBuffer import ReorderBuffer
+from Schemas.DeadbandFilter import DeadbandFilter
+from Schemas.TrajectoryCompressor import TrajectoryCompressor
+from Schemas.DailyReportAggregator import DailyReportAggregator
+from Schemas.RuleEngine import RuleEngine
+from Schemas.FleetState import FleetState
+from Schemas.IdGenerator import IdGenerator
+from Schemas.RollupAggregator import RollupAggregator
\ No newline at end of file
@@ -0,0 +1,194 @@
+import decimal
+import re
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+import sqlalchemy as db
+
+from Services.DatabaseConnection import DatabaseConnection
+
+
+class AsyncDatabaseConnection:
+    # Bound on the number of distinct upsert shapes kept in the statement cache
+    STATEMENT_CACHE_SIZE = 1024
+
+    # asyncpg rejects queries with more bind arguments than this
+    MAX_BIND_PARAMS = 32767
+
+    # :p{row}_{column} placeholders produced by DatabaseConnection._upsert_sql
+    UPSERT_PARAM = re.compile(r':p(\d+)_(\d+)')
+
+    # Initialize the asynchronous database connection
+    def __init__(self, db_url: str, pool_size: int = 5, statement_cache: bool = True):
+        """
+        Initialize the AsyncDatabaseConnection with a database URL.
+
+        The asyncpg pool is created by open(), which must be awaited on the event loop
+        that uses the connection. Only PostgreSQL is supported.
+
+        Parameters:
+        db_url (str): The database URL, in the same form as for DatabaseConnection.
+        pool_size (int): Maximum number of connections in the asyncpg pool.
+        statement_cache (bool): Let asyncpg prepare and reuse the statements it runs.
+        """
+        url = db.engine.make_url(db_url)
+        if url.get_backend_name() != 'postgresql':
+            raise ValueError(f"The asyncio writer requires PostgreSQL, got {url.get_backend_name()}")
+        # asyncpg takes a plain libpq DSN without the SQLAlchemy driver suffix
+        self.dsn = url.set(drivername='postgresql').render_as_string(hide_password=False)
+        self.pool_size = pool_size
+        self.statement_cache = statement_cache
+        self.pool = None
+        self._statements = OrderedDict()
+
+    # Open the connection pool
+    async def open(self):
+        """
+        Create the asyncpg connection pool.
+
+        asyncpg is imported here so the synchronous writer does not depend on it.
+        """
+        import asyncpg
+        self.pool = await asyncpg.create_pool(
+            self.dsn,
+            min_size=1,
+            max_size=self.pool_size,
+            statement_cache_size=self.STATEMENT_CACHE_SIZE if self.statement_cache else 0
+        )
+
+    # Close the connection pool
+    async def close(self):
+        """
+        Close the connection pool, waiting for the connections in use to be released.
+        """
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    # Run several statements in a single transaction
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Check out a pooled connection and run the block in one transaction.
+
+        The transaction is committed when the block exits normally and rolled back
+        if it raises.
+
+        Usage:
+            async with db.transaction() as conn:
+                await db.upsert_rows(conn, ...)
+                await db.copy_rows(conn, ...)
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                yield conn
+
+    # Insert or update several rows in a single statement
+    async def upsert_rows(self, conn, table_name: str, rows: list, conflict_columns: list,
+                          update_columns: list = None, keep_existing_on_null: bool = True,
+                          newer_column: str = None, merge_columns: dict = None):
+        """
+        Insert several rows with one multi-row INSERT ... ON CONFLICT DO UPDATE statement.
+
+        Builds the same statement as DatabaseConnection.upsert_rows with asyncpg's
+        positional placeholders. Errors are raised to the caller.
+
+        Parameters:
+        conn (asyncpg.Connection): The connection of the open transaction.
+        table_name (str): The name of the table to upsert into.
+        rows (list): Dictionaries mapping column names to values.
+        conflict_columns (list): Columns of the unique constraint that detects existing rows.
+        update_columns (list): Columns to overwrite on conflict (defaults to every non-conflict column).
+        keep_existing_on_null (bool): Keep the stored value when the new value is NULL.
+        newer_column (str): Only update rows whose stored value of this column is not newer than the incoming one.
+        merge_columns (dict): Columns combined with the stored value on conflict, mapped to an SQL expression.
+        """
+        if not rows:
+            return
+        columns = []
+        for row in rows:
+            for col in row:
+                if col not in columns:
+                    columns.append(col)
+        merge_columns = merge_columns or {}
+        if update_columns is None:
+            update_columns = [col for col in columns if col not in conflict_columns and col not in merge_columns]
+
+        chunk_size = max(1, self.MAX_BIND_PARAMS // len(columns))
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            key = (table_name, tuple(columns), tuple(conflict_columns), tuple(update_columns),
+                   keep_existing_on_null, newer_column, tuple(merge_columns.items()), len(chunk))
+            sql = self._statements.get(key)
+            if sql is not None:
+                self._statements.move_to_end(key)
+            else:
+                sql = self._positional(
+                    DatabaseConnection._upsert_sql(table_name, columns, conflict_columns, update_columns,
+                                                   keep_existing_on_null, len(chunk), newer_column, merge_columns),
+                    len(columns)
+                )
+                self._statements[key] = sql
+                if len(self._statements) > self.STATEMENT_CACHE_SIZE:
+                    self._statements.popitem(last=False)
+            args = [self._adapt(row.get(col)) for row in chunk for col in columns]
+            await conn.execute(sql, *args)
+
+    # Append many rows to a table with COPY
+    async def copy_rows(self, conn, table_name: str, columns: list, rows: list, skip_duplicates: bool = False):
+        """
+        Bulk append rows to a table with asyncpg's binary COPY.
+
+        With skip_duplicates, rows whose key is already stored are skipped. The rows are
+        still copied straight into the table inside a savepoint; only when that COPY hits
+        a stored key are they copied into a temporary staging table and moved with
+        INSERT ... ON CONFLICT DO NOTHING. Errors are raised to the caller.
+
+        Parameters:
+        conn (asyncpg.Connection): The connection of the open transaction.
+        table_name (str): The name of the table to append to.
+        columns (list): The column names, in the order used by each row.
+        rows (list): Sequences of values, one per row, ordered like columns.
+        skip_duplicates (bool): Skip rows that conflict with a stored key.
+        """
+        if not rows:
+            return
+        records = [tuple(self._adapt(value) for value in row) for row in rows]
+        if not skip_duplicates:
+            await conn.copy_records_to_table(table_name, records=records, columns=columns)
+            return
+        try:
+            async with conn.transaction():
+                await conn.copy_records_to_table(table_name, records=records, columns=columns)
+            return
+        except Exception as e:
+            if getattr(e, 'sqlstate', None) != DatabaseConnection.UNIQUE_VIOLATION:
+                raise
+        staging = f"{table_name}_staging"
+        column_list = ', '.join([f'"{col}"' for col in columns])
+        await conn.execute(f'CREATE TEMPORARY TABLE IF NOT EXISTS "{staging}" (LIKE "{table_name}" INCLUDING DEFAULTS)')
+        await conn.copy_records_to_table(staging, records=records, columns=columns)
+        await conn.execute(f'INSERT INTO "{table_name}" ({column_list}) SELECT {column_list} FROM "{staging}" '
+                           'ON CONFLICT DO NOTHING')
+        await conn.execute(f'TRUNCATE "{staging}"')
+
+    @classmethod
+    def _positional(cls, sql: str, column_count: int) -> str:
+        """
+        Rewrite :p{row}_{column} placeholders as asyncpg's $n placeholders.
+        """
+        return cls.UPSERT_PARAM.sub(
+            lambda match: f'${int(match.group(1)) * column_count + int(match.group(2)) + 1}', sql
+        )
+
+    @staticmethod
+    def _adapt(value):
+        """
+        Send floats as exact decimals so numeric columns store the value psycopg2 would.
+
+        asyncpg encodes a float bound to numeric through Decimal(float), which keeps
+        the full binary expansion (80.1 -> 80.0999999999999943...).
+        """
+        if type(value) is float:
+            return decimal.Decimal(repr(value))
+        return value
@@ -0,0 +1,205 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """
+    A bounded in-memory queue drained by a background writer thread.
+
+    Producers (e.g. the MQTT network thread) call `submit` and return immediately.
+    The writer thread collects the queued items into batches and hands each batch to
+    `flush_handler` once either `flush_size` items are pending or `flush_interval`
+    seconds have passed since the first item of the batch was queued.
+
+    Attributes:
+    - flush_handler (callable): Function called with a list of items to persist.
+    - max_queue_size (int): Maximum number of items waiting in the queue.
+    - flush_size (int): Number of items that triggers an immediate flush.
+    - flush_interval (float): Maximum time in seconds an item waits before being flushed.
+    - tick_handler (callable): Housekeeping function run on the writer thread after every
+      batch and every flush_interval while the queue is idle, called as tick_handler(idle).
+      A final idle tick runs before the thread exits (optional).
+    - submitted (int): Number of items accepted into the queue.
+    - dropped (int): Number of items rejected because the queue was full.
+    - flushed (int): Number of items handed to the flush handler.
+    - batches (int): Number of batches handed to the flush handler.
+
+    Methods:
+    - start(): Start the background writer thread.
+    - submit(item): Queue an item for the next batch.
+    - stop(timeout): Flush pending items and stop the writer thread.
+    """
+    _STOP = object()
+
+    def __init__(self, flush_handler, max_queue_size: int = 10000, flush_size: int = 500, flush_interval: float = 0.5,
+                 tick_handler=None):
+        """
+        Initialize the BatchWriter.
+
+        Parameters:
+        - flush_handler (callable): Function called with a list of items to persist.
+        - max_queue_size (int): Maximum number of items waiting in the queue.
+        - flush_size (int): Number of items that triggers an immediate flush.
+        - flush_interval (float): Maximum time in seconds an item waits before being flushed.
+        - tick_handler (callable): Housekeeping function run on the writer thread (optional).
+        """
+        self.flush_handler = flush_handler
+        self.max_queue_size = max_queue_size
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval
+        self.tick_handler = tick_handler
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+
+        self.submitted = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.batches = 0
+
+    def start(self):
+        """
+        Start the background writer thread.
+
+        Returns:
+        - None
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="batch-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> bool:
+        """
+        Queue an item for the next batch without blocking the caller.
+
+        Parameters:
+        - item: The item to persist.
+
+        Returns:
+        - bool: True if the item was queued, False if the queue was full and it was dropped.
+        """
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def queue_depth(self) -> int:
+        """
+        Return the approximate number of items waiting in the queue.
+
+        Returns:
+        - int: The current queue depth.
+        """
+        return self._queue.qsize()
+
+    def stop(self, timeout: float = None):
+        """
+        Flush the pending items and stop the writer thread.
+
+        Parameters:
+        - timeout (float): Maximum time in seconds to wait for the thread to finish (optional).
+
+        Returns:
+        - None
+        """
+        if self._thread is None:
+            return
+        # The sentinel bypasses maxsize so shutdown never blocks on a full queue
+        with self._queue.mutex:
+            self._queue.queue.append(self._STOP)
+            self._queue.not_empty.notify()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        """
+        Writer thread loop: collect items into batches and flush them.
+
+        Returns:
+        - None
+        """
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._tick(idle=True)
+                continue
+            if item is self._STOP:
+                break
+            batch.append(item)
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(batch) < self.flush_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._flush(batch)
+            self._tick(idle=False)
+
+        # Drain whatever is still queued so a clean shutdown loses nothing
+        remaining_items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not self._STOP:
+                remaining_items.append(item)
+        for start in range(0, len(remaining_items), self.flush_size):
+            self._flush(remaining_items[start:start + self.flush_size])
+        self._tick(idle=True)
+
+    def _flush(self, batch):
+        """
+        Hand a batch to the flush handler, keeping the thread alive on errors.
+
+        Parameters:
+        - batch (list): The items to persist.
+
+        Returns:
+        - None
+        """
+        if not batch:
+            return
+        try:
+            self.flush_handler(batch)
+        except Exception as e:
+            logger.exception("💥 Error flushing batch of %d messages: %s", len(batch), e)
+        self.flushed += len(batch)
+        self.batches += 1
+
+    def _tick(self, idle: bool):
+        """
+        Run the housekeeping handler, keeping the thread alive on errors.
+
+        Parameters:
+        - idle (bool): True if no item arrived for a whole flush interval (or the thread is stopping).
+
+        Returns:
+        - None
+        """
+        if self.tick_handler is None:
+            return
+        try:
+            self.tick_handler(idle)
+        except Exception as e:
+            logger.exception("💥 Error in writer housekeeping: %s", e)
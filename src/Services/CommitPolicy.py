@@ -0,0 +1,70 @@
+import time
+
+
+class CommitPolicy:
+    """
+    Decide when the writer commits the statements it has sent to the database.
+
+    Modes:
+    - 'message': commit after every message.
+    - 'batch': commit after every batch flushed by the BatchWriter (default).
+    - 'statements': commit once `every` statements are pending.
+    - 'interval': commit once the open transaction is `interval` seconds old.
+
+    Whatever the mode, pending work is also committed when the writer goes idle.
+
+    Attributes:
+    - mode (str): One of MODES.
+    - every (int): Pending statements that trigger a commit in 'statements' mode.
+    - interval (float): Transaction age in seconds that triggers a commit in 'interval' mode.
+
+    Methods:
+    - due(statements, opened_at): Check whether the open transaction should be committed.
+    """
+    MODES = ('message', 'batch', 'statements', 'interval')
+
+    def __init__(self, mode: str = 'batch', every: int = 100, interval: float = 1.0):
+        """
+        Initialize the CommitPolicy.
+
+        Parameters:
+        - mode (str): 'message', 'batch', 'statements' or 'interval'.
+        - every (int): Pending statements that trigger a commit in 'statements' mode.
+        - interval (float): Transaction age in seconds that triggers a commit in 'interval' mode.
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown commit policy: {mode}. Expected one of {self.MODES}")
+        self.mode = mode
+        self.every = max(1, every)
+        self.interval = interval
+
+    def __repr__(self):
+        if self.mode == 'statements':
+            return f"CommitPolicy(every {self.every} statements)"
+        if self.mode == 'interval':
+            return f"CommitPolicy(every {self.interval * 1000:.0f} ms)"
+        return f"CommitPolicy(per {self.mode})"
+
+    @property
+    def per_message(self) -> bool:
+        """True if every message is committed on its own"""
+        return self.mode == 'message'
+
+    def due(self, statements: int, opened_at: float) -> bool:
+        """
+        Check whether the open transaction should be committed.
+
+        Parameters:
+        - statements (int): Statements sent since the last commit.
+        - opened_at (float): time.monotonic() when the transaction was opened.
+
+        Returns:
+        - bool: True if the transaction should be committed now.
+        """
+        if statements <= 0:
+            return False
+        if self.mode == 'statements':
+            return statements >= self.every
+        if self.mode == 'interval':
+            return time.monotonic() - opened_at >= self.interval
+        return True
@@ -1,17 +1,98 @@
 import sqlalchemy as db
 import polars as pl
+import csv
+import io
+import itertools
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
 
 class DatabaseConnection:
+    # Bound on the number of distinct statement shapes kept in the statement cache
+    STATEMENT_CACHE_SIZE = 1024
+    
+    # SQLSTATE of a unique constraint violation
+    UNIQUE_VIOLATION = '23505'
+    
+    # Named bind parameters (:name) as recognized by sqlalchemy.text()
+    BIND_PARAM = re.compile(r'(?<![:\w\\]):(\w+)(?!:)')
+    
     # Initialize the database connection
-    def __init__(self, db_url: str):
+    def __init__(self, db_url: str, pool_size: int = 5, max_overflow: int = 10, pool_timeout: float = 30,
+                 pool_pre_ping: bool = True, pool_recycle: int = 1800, retries: int = 3, retry_backoff: float = 0.5,
+                 statement_cache: bool = True, prepared_statements: bool = True):
         """
         Initialize the DatabaseConnection with a database URL.
         
+        Connections come from a SQLAlchemy pool. Each thread uses its own connection,
+        so the object can be shared by several threads; `connection()` checks out an
+        extra one for the duration of a block.
+        
         Parameters:
         db_url (str): The database URL to connect to.
+        pool_size (int): Number of connections kept open in the pool.
+        max_overflow (int): Extra connections allowed above pool_size under load.
+        pool_timeout (float): Seconds to wait for a free connection before failing.
+        pool_pre_ping (bool): Test connections on checkout and replace dead ones.
+        pool_recycle (int): Seconds after which a connection is replaced (-1 disables it).
+        retries (int): Reconnect attempts after a lost connection or failed connect.
+        retry_backoff (float): Seconds before the first retry; doubles on every attempt.
+        statement_cache (bool): Build each insert/update/upsert statement shape once and reuse it.
+        prepared_statements (bool): On PostgreSQL, run insert_data and update_data as server-side
+            prepared statements (requires statement_cache).
+        """
+        pool_options = {'pool_pre_ping': pool_pre_ping, 'pool_recycle': pool_recycle}
+        if db.engine.make_url(db_url).get_backend_name() != 'sqlite':
+            # SQLite uses a single-connection pool that rejects sizing options
+            pool_options.update(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
+        self.engine = db.create_engine(db_url, **pool_options)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        
+        # Statement shapes built once and reused; see _statement()
+        self.statement_cache = statement_cache
+        self.prepared_statements = statement_cache and prepared_statements and self.engine.dialect.name == 'postgresql'
+        self._statements = OrderedDict()
+        self._statements_lock = threading.Lock()
+        self._prepared_names = itertools.count()
+        # Cache key -> name of the prepared statements still cached, and how many were evicted
+        self._prepared_keys = {}
+        self._prepared_evictions = 0
+        
+        # Per-thread connection and transaction() depth
+        self._local = threading.local()
+        self._connections = set()
+        self._lock = threading.Lock()
+        
+        # Pool metrics
+        self.checkouts = 0
+        self.reconnects = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        
+        # Open the calling thread's connection now so connection errors surface at startup
+        self.conn
+        
+    # The connection used by the calling thread
+    @property
+    def conn(self):
+        """
+        Return the calling thread's connection, checking one out of the pool if needed.
+        
+        Returns:
+        Connection: The SQLAlchemy connection bound to the calling thread.
         """
-        self.engine = db.create_engine(db_url)
-        self.conn = self.engine.connect()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or conn.closed:
+            conn = self._local.conn = self._checkout()
+            with self._lock:
+                self._connections.add(conn)
+        return conn
         
     # Close the database connection
     def close(self):
@@ -20,9 +101,326 @@ class DatabaseConnection:
         
         This method should be called when the connection is no longer needed.
         """
-        if self.conn:
-            self.conn.close()
-            self.engine.dispose()
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self.engine.dispose()
+            
+    # Check out a dedicated connection for a block
+    @contextmanager
+    def connection(self):
+        """
+        Check out a pooled connection for the duration of the block.
+        
+        Inside the block, every method called from this thread uses the checked out
+        connection; it is returned to the pool when the block exits.
+        
+        Usage:
+            with db.connection():
+                db.insert_data(...)
+        """
+        previous = getattr(self._local, 'conn', None)
+        previous_depth = self._depth()
+        conn = self._local.conn = self._checkout()
+        self._local.depth = 0
+        try:
+            yield conn
+        finally:
+            conn.close()
+            self._local.conn = previous
+            self._local.depth = previous_depth
+    
+    # Report pool usage
+    def pool_stats(self) -> dict:
+        """
+        Return connection pool metrics for sizing the pool against ingest concurrency.
+        
+        Returns:
+        dict: Pool status, checkout count, reconnects and time spent waiting for connections.
+        """
+        pool = self.engine.pool
+        stats = {
+            'checkouts': self.checkouts,
+            'reconnects': self.reconnects,
+            'wait_time_total': self.wait_time_total,
+            'wait_time_max': self.wait_time_max,
+            'wait_time_avg': self.wait_time_total / self.checkouts if self.checkouts else 0.0,
+        }
+        if isinstance(pool, db.pool.QueuePool):
+            stats.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+        return stats
+            
+    # Run several statements in a single transaction
+    @contextmanager
+    def transaction(self, synchronous_commit: bool = True):
+        """
+        Group every statement executed inside the block into one transaction.
+        
+        Statements issued through execute_query, insert_data and update_data inside the
+        block are not committed individually. The transaction is committed when the
+        outermost block exits and rolled back if an exception escapes it. Inside the
+        block, statement errors are raised instead of being swallowed so the caller can
+        decide how to recover.
+        
+        Parameters:
+        synchronous_commit (bool): False to commit without waiting for the WAL flush on
+            PostgreSQL (a crash may lose the last few transactions, never corrupt them).
+        
+        Usage:
+            with db.transaction():
+                db.insert_data(...)
+                db.update_data(...)
+        """
+        self.begin(synchronous_commit)
+        try:
+            yield self
+        except Exception as e:
+            self.rollback(e)
+            raise
+        self.commit()
+    
+    # Open a unit of work that spans several calls
+    def begin(self, synchronous_commit: bool = True):
+        """
+        Start (or nest into) a transaction on the calling thread's connection.
+        
+        Every begin() must be matched by commit() or rollback(); only the outermost
+        pair actually ends the transaction. transaction() is the block form of this.
+        
+        Parameters:
+        synchronous_commit (bool): False to use synchronous_commit=off for this transaction on PostgreSQL.
+        """
+        depth = self._local.depth = self._depth() + 1
+        if depth == 1 and not synchronous_commit and self.engine.dialect.name == 'postgresql':
+            self._execute('SET LOCAL synchronous_commit TO OFF')
+    
+    # Commit the unit of work opened by begin()
+    def commit(self):
+        """
+        End one begin() level, committing the transaction at the outermost level.
+        """
+        depth = self._depth()
+        self._local.depth = max(depth - 1, 0)
+        if depth <= 1:
+            try:
+                self.conn.commit()
+            except Exception as e:
+                self._recover(e)
+                raise
+    
+    # Roll back the unit of work opened by begin()
+    def rollback(self, error: Exception = None):
+        """
+        End one begin() level, rolling the transaction back at the outermost level.
+        
+        Parameters:
+        error (Exception): The error that caused the rollback; a lost connection is discarded (optional).
+        """
+        depth = self._depth()
+        self._local.depth = max(depth - 1, 0)
+        if depth <= 1:
+            self._recover(error)
+    
+    # Run a unit of work in a transaction, retrying it after a lost connection
+    def run_transaction(self, work, synchronous_commit: bool = True):
+        """
+        Call `work()` inside transaction(), retrying with backoff if the connection is lost.
+        
+        `work` must be safe to call again: a failed attempt is rolled back entirely.
+        
+        Parameters:
+        work (callable): Function issuing the statements of the transaction.
+        synchronous_commit (bool): False to use synchronous_commit=off on PostgreSQL.
+        
+        Returns:
+        The value returned by work().
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                with self.transaction(synchronous_commit):
+                    return work()
+            except Exception as e:
+                if attempt == self.retries or not self.is_disconnect(e):
+                    raise
+                self._backoff(attempt, e)
+    
+    # Check whether a transaction() block is active
+    def in_transaction(self) -> bool:
+        """
+        Check whether statements are currently grouped by a transaction() block.
+        
+        Returns:
+        bool: True if a transaction() block is active, False otherwise.
+        """
+        return self._depth() > 0
+    
+    # Check whether an error means the connection to the database was lost
+    @staticmethod
+    def is_disconnect(error: Exception) -> bool:
+        """
+        Check whether an error was caused by a lost or refused database connection.
+        
+        Parameters:
+        error (Exception): The error raised by a statement or checkout.
+        
+        Returns:
+        bool: True if retrying on a new connection may succeed.
+        """
+        if isinstance(error, db.exc.DBAPIError) and error.connection_invalidated:
+            return True
+        return isinstance(error, (db.exc.OperationalError, db.exc.InterfaceError, db.exc.PendingRollbackError))
+    
+    def _depth(self) -> int:
+        """Return the transaction() nesting depth of the calling thread"""
+        return getattr(self._local, 'depth', 0)
+    
+    def _checkout(self):
+        """
+        Check a connection out of the pool, retrying with backoff while the database is unreachable.
+        """
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                conn = self.engine.connect()
+            except Exception as e:
+                if attempt == self.retries or not self.is_disconnect(e):
+                    raise
+                self._backoff(attempt, e)
+                continue
+            waited = time.perf_counter() - start
+            with self._lock:
+                self.checkouts += 1
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+            return conn
+    
+    def _recover(self, error: Exception = None):
+        """
+        Roll back the calling thread's connection after an error, discarding it if it was lost.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        if error is not None and self.is_disconnect(error):
+            # A fresh connection is checked out on next use
+            with self._lock:
+                self._connections.discard(conn)
+            try:
+                conn.close()
+            except Exception:
+                pass
+            self._local.conn = None
+    
+    def _backoff(self, attempt: int, error: Exception):
+        """Wait before retrying after a lost connection"""
+        delay = min(self.retry_backoff * (2 ** attempt), 30)
+        self.reconnects += 1
+        logger.warning("Database connection failed (%s), retrying in %.2fs", error.__class__.__name__, delay)
+        time.sleep(delay)
+    
+    # Execute a statement on the calling thread's connection
+    def _execute(self, query, params=None, prepared=None):
+        """
+        Execute a statement, reconnecting and retrying if the connection is lost.
+        
+        Inside a transaction() block the error is raised instead, since the statements
+        already sent in the transaction are gone with the connection.
+        
+        Parameters:
+        query (str | TextClause): The statement to execute.
+        params (dict | list): Parameters, or a list of them for executemany (optional).
+        prepared (tuple): (name, PREPARE statement) that must exist on the connection first (optional).
+        """
+        statement = db.text(query) if isinstance(query, str) else query
+        for attempt in range(self.retries + 1):
+            try:
+                if prepared is not None:
+                    self._ensure_prepared(*prepared)
+                if params is None:
+                    return self.conn.execute(statement)
+                return self.conn.execute(statement, params)
+            except Exception as e:
+                if self.in_transaction() or attempt == self.retries or not self.is_disconnect(e):
+                    raise
+                self._recover(e)
+                self._backoff(attempt, e)
+    
+    # Look up or build a cached statement
+    def _statement(self, key: tuple, build):
+        """
+        Return the statement cached under `key`, building it with `build()` on first use.
+        
+        The cache keeps the STATEMENT_CACHE_SIZE most recently used shapes; the least
+        recently used one is evicted to make room, so shapes in steady use stay cached.
+        
+        Parameters:
+        key (tuple): Identifies the statement shape, e.g. ('insert', table, columns).
+        build (callable): Returns the value to cache (usually a TextClause).
+        """
+        if not self.statement_cache:
+            return build()
+        with self._statements_lock:
+            statement = self._statements.get(key)
+            if statement is None:
+                statement = self._statements[key] = build()
+                if len(self._statements) > self.STATEMENT_CACHE_SIZE:
+                    evicted, _ = self._statements.popitem(last=False)
+                    if self._prepared_keys.pop(evicted, None) is not None:
+                        # Connections DEALLOCATE it the next time they prepare; see _ensure_prepared()
+                        self._prepared_evictions += 1
+            else:
+                self._statements.move_to_end(key)
+        return statement
+    
+    def _prepared_statement(self, key: tuple, sql: str, param_names: list):
+        """
+        Build the PostgreSQL prepared form of a statement with named parameters.
+        
+        Parameters:
+        key (tuple): The statement cache key, used to derive a stable statement name.
+        sql (str): The statement with :name placeholders.
+        param_names (list): Parameter names in the order they are passed to EXECUTE.
+        
+        Returns:
+        tuple: (EXECUTE TextClause, (statement name, PREPARE statement))
+        """
+        name = self._prepared_keys[key] = f"mqtt_writer_{next(self._prepared_names)}"
+        positions = {param: f'${i}' for i, param in enumerate(param_names, start=1)}
+        prepare_sql = f'PREPARE {name} AS ' + self.BIND_PARAM.sub(lambda m: positions[m.group(1)], sql)
+        execute = db.text(f"EXECUTE {name}({', '.join([f':{param}' for param in param_names])})")
+        return execute, (name, prepare_sql)
+    
+    def _ensure_prepared(self, name: str, prepare_sql: str):
+        """
+        PREPARE a statement on the calling thread's connection unless it already was.
+        
+        The set of prepared names lives in the pool's per-connection info dictionary,
+        which SQLAlchemy clears when the DBAPI connection is replaced. After statements
+        were evicted from the cache, the ones this connection prepared are deallocated
+        so the server does not keep them for the life of the connection.
+        """
+        info = self.conn.connection.info
+        prepared = info.setdefault('prepared_statements', set())
+        if info.get('prepared_evictions', 0) != self._prepared_evictions:
+            with self._statements_lock:
+                cached = set(self._prepared_keys.values())
+                evictions = self._prepared_evictions
+            for stale in prepared - cached:
+                self.conn.exec_driver_sql(f'DEALLOCATE {stale}')
+                prepared.discard(stale)
+            info['prepared_evictions'] = evictions
+        if name not in prepared:
+            self.conn.exec_driver_sql(prepare_sql)
+            prepared.add(name)
             
     # Execute a query and return the result
     def execute_query(self, query: str, params=None):
@@ -37,15 +435,14 @@ class DatabaseConnection:
         Result: The result of the query execution.
         """
         try:
-            if params:
-                result = self.conn.execute(db.text(query), params)
-            else:
-                result = self.conn.execute(db.text(query))
-            self.conn.commit()
+            result = self._execute(query, params or None)
+            if not self.in_transaction():
+                self.conn.commit()
             return result
         except Exception as e:
-            print(f"Database error: {e}")
-            self.conn.rollback()
+            logger.error("Database error: %s", e)
+            if not self.in_transaction():
+                self._recover(e)
             raise e
     
     # Insert data into a specified table
@@ -58,19 +455,30 @@ class DatabaseConnection:
         data (dict): A dictionary containing column names as keys and values to insert.
         
         Returns:
-        bool: True if the insertion was successful, False otherwise.
+        bool: True if the insertion was successful, False otherwise. Inside a
+        transaction() block errors are raised instead.
         """
         try:
-            columns = ', '.join([f'"{col}"' for col in data.keys()])
-            placeholders = ', '.join([f':{col}' for col in data.keys()])
-            query = f'INSERT INTO "{table_name}" ({columns}) VALUES ({placeholders})'
+            key = ('insert', table_name, tuple(data.keys()))
             
-            self.conn.execute(db.text(query), data)
-            self.conn.commit()
+            def build():
+                columns = ', '.join([f'"{col}"' for col in key[2]])
+                placeholders = ', '.join([f':{col}' for col in key[2]])
+                query = f'INSERT INTO "{table_name}" ({columns}) VALUES ({placeholders})'
+                if self.prepared_statements:
+                    return self._prepared_statement(key, query, list(key[2]))
+                return db.text(query), None
+            
+            statement, prepared = self._statement(key, build)
+            self._execute(statement, data, prepared)
+            if not self.in_transaction():
+                self.conn.commit()
             return True
         except Exception as e:
-            print(f"Error inserting data: {e}")
-            self.conn.rollback()
+            logger.error("Error inserting data: %s", e)
+            if self.in_transaction():
+                raise
+            self._recover(e)
             return False
     
     # Update data in a specified table
@@ -85,66 +493,467 @@ class DatabaseConnection:
         where_params (dict): Parameters for the WHERE clause.
         
         Returns:
-        bool: True if the update was successful, False otherwise.
+        bool: True if the update was successful, False otherwise. Inside a
+        transaction() block errors are raised instead.
         """
         try:
-            set_clause = ', '.join([f'"{col}" = :{col}' for col in data.keys()])
-            query = f'UPDATE "{table_name}" SET {set_clause} WHERE {where_clause}'
+            key = ('update', table_name, tuple(data.keys()), where_clause)
+            
+            def build():
+                set_clause = ', '.join([f'"{col}" = :{col}' for col in key[2]])
+                query = f'UPDATE "{table_name}" SET {set_clause} WHERE {where_clause}'
+                if self.prepared_statements:
+                    param_names = list(key[2])
+                    for param in self.BIND_PARAM.findall(where_clause):
+                        if param not in param_names:
+                            param_names.append(param)
+                    return self._prepared_statement(key, query, param_names)
+                return db.text(query), None
             
             params = data.copy()
             if where_params:
                 params.update(where_params)
             
-            self.conn.execute(db.text(query), params)
-            self.conn.commit()
+            statement, prepared = self._statement(key, build)
+            self._execute(statement, params, prepared)
+            if not self.in_transaction():
+                self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error("Error updating data: %s", e)
+            if self.in_transaction():
+                raise
+            self._recover(e)
+            return False
+    
+    # Insert or update several rows in a single statement
+    def upsert_rows(self, table_name: str, rows: list, conflict_columns: list,
+                    update_columns: list = None, keep_existing_on_null: bool = True, newer_column: str = None,
+                    merge_columns: dict = None):
+        """
+        Insert several rows with one multi-row INSERT ... ON CONFLICT DO UPDATE statement.
+        
+        Rows may carry different subsets of columns; missing columns are sent as NULL.
+        
+        Parameters:
+        table_name (str): The name of the table to upsert into.
+        rows (list): Dictionaries mapping column names to values.
+        conflict_columns (list): Columns of the unique constraint that detects existing rows.
+        update_columns (list): Columns to overwrite on conflict (defaults to every non-conflict column).
+        keep_existing_on_null (bool): Keep the stored value when the new value is NULL.
+        newer_column (str): Only update rows whose stored value of this column is NULL or not newer
+        than the incoming one (e.g. a timestamp), so late rows never overwrite fresher ones.
+        merge_columns (dict): Columns combined with the stored value on conflict instead of
+        overwritten, mapped to an SQL expression over EXCLUDED and {table} (the stored row),
+        e.g. {'total': '{table}."total" + EXCLUDED."total"'}.
+        
+        Returns:
+        bool: True if the upsert was successful, False otherwise. Inside a
+        transaction() block errors are raised instead.
+        """
+        if not rows:
+            return True
+        try:
+            columns = []
+            for row in rows:
+                for col in row:
+                    if col not in columns:
+                        columns.append(col)
+            merge_columns = merge_columns or {}
+            if update_columns is None:
+                update_columns = [col for col in columns if col not in conflict_columns and col not in merge_columns]
+            
+            # Stay below the 65535 bind parameter limit of the PostgreSQL protocol
+            chunk_size = max(1, 65535 // len(columns))
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                key = ('upsert', table_name, tuple(columns), tuple(conflict_columns),
+                       tuple(update_columns), keep_existing_on_null, newer_column, tuple(merge_columns.items()),
+                       len(chunk))
+                statement = self._statement(key, lambda: db.text(
+                    self._upsert_sql(table_name, columns, conflict_columns, update_columns, keep_existing_on_null,
+                                     len(chunk), newer_column, merge_columns)
+                ))
+                params = {}
+                for i, row in enumerate(chunk):
+                    for j, col in enumerate(columns):
+                        params[f'p{i}_{j}'] = row.get(col)
+                self._execute(statement, params)
+            if not self.in_transaction():
+                self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error("Error upserting data: %s", e)
+            if self.in_transaction():
+                raise
+            self._recover(e)
+            return False
+    
+    @staticmethod
+    def _upsert_sql(table_name: str, columns: list, conflict_columns: list, update_columns: list,
+                    keep_existing_on_null: bool, row_count: int, newer_column: str = None,
+                    merge_columns: dict = None) -> str:
+        """
+        Build a multi-row INSERT ... ON CONFLICT statement with :p{row}_{column} placeholders.
+        """
+        if keep_existing_on_null:
+            assignments = [f'"{col}" = COALESCE(EXCLUDED."{col}", "{table_name}"."{col}")' for col in update_columns]
+        else:
+            assignments = [f'"{col}" = EXCLUDED."{col}"' for col in update_columns]
+        for col, expression in (merge_columns or {}).items():
+            assignments.append(f'"{col}" = ' + expression.format(table=f'"{table_name}"'))
+        column_list = ', '.join([f'"{col}"' for col in columns])
+        conflict_list = ', '.join([f'"{col}"' for col in conflict_columns])
+        action = f'DO UPDATE SET {", ".join(assignments)}' if assignments else 'DO NOTHING'
+        if assignments and newer_column:
+            action += (f' WHERE "{table_name}"."{newer_column}" IS NULL'
+                       f' OR EXCLUDED."{newer_column}" >= "{table_name}"."{newer_column}"')
+        values = [
+            '(' + ', '.join([f':p{i}_{j}' for j in range(len(columns))]) + ')'
+            for i in range(row_count)
+        ]
+        return (f'INSERT INTO "{table_name}" ({column_list}) VALUES {", ".join(values)} '
+                f'ON CONFLICT ({conflict_list}) {action}')
+    
+    # Append many rows to a table using the fastest path the database supports
+    def copy_rows(self, table_name: str, columns: list, rows: list, skip_duplicates: bool = False):
+        """
+        Bulk append rows to a table.
+        
+        On PostgreSQL with psycopg2 the rows are streamed with COPY FROM STDIN; on other
+        databases they are sent as a single multi-row executemany INSERT.
+        
+        With skip_duplicates, rows whose key is already stored are skipped instead of
+        failing the whole copy. The rows are still copied straight into the table; only
+        a batch whose COPY hits a stored key is copied again through a staging table.
+        
+        Parameters:
+        table_name (str): The name of the table to append to.
+        columns (list): The column names, in the order used by each row.
+        rows (list): Sequences of values, one per row, ordered like columns.
+        skip_duplicates (bool): Skip rows that conflict with a stored key.
+        
+        Returns:
+        bool: True if the rows were written, False otherwise. Inside a
+        transaction() block errors are raised instead.
+        """
+        if not rows:
+            return True
+        try:
+            if self.engine.dialect.name == 'postgresql' and self.engine.dialect.driver == 'psycopg2':
+                if skip_duplicates:
+                    self._copy_skipping_duplicates(table_name, columns, rows)
+                else:
+                    self._copy_from_stdin(table_name, columns, rows)
+            else:
+                def build():
+                    column_list = ', '.join([f'"{col}"' for col in columns])
+                    placeholders = ', '.join([f':{col}' for col in columns])
+                    on_conflict = ' ON CONFLICT DO NOTHING' if skip_duplicates else ''
+                    return db.text(f'INSERT INTO "{table_name}" ({column_list}) VALUES ({placeholders}){on_conflict}')
+                
+                statement = self._statement(('insert_many', table_name, tuple(columns), skip_duplicates), build)
+                self._execute(statement, [dict(zip(columns, row)) for row in rows])
+            if not self.in_transaction():
+                self.conn.commit()
             return True
         except Exception as e:
-            print(f"Error updating data: {e}")
-            self.conn.rollback()
+            logger.error("Error copying data: %s", e)
+            if self.in_transaction():
+                raise
+            self._recover(e)
             return False
     
+    def _copy_skipping_duplicates(self, table_name: str, columns: list, rows: list):
+        """
+        COPY rows into the table, going through the staging table only if a key is already stored.
+        
+        Duplicates are rare (a redelivered message, a replayed backlog), so a batch costs
+        one COPY inside a savepoint. When that COPY hits a unique violation, the savepoint
+        is rolled back and the batch is written by _copy_through_staging() instead.
+        """
+        savepoint = self.conn.begin_nested()
+        try:
+            self._copy_from_stdin(table_name, columns, rows)
+        except Exception as e:
+            savepoint.rollback()
+            if getattr(e, 'pgcode', None) != self.UNIQUE_VIOLATION:
+                raise
+            logger.debug("COPY into %s hit a stored key, skipping the duplicates through staging", table_name)
+            self._copy_through_staging(table_name, columns, rows)
+        else:
+            savepoint.commit()
+    
+    def _copy_through_staging(self, table_name: str, columns: list, rows: list):
+        """
+        COPY rows into a session-local staging table, then move them to the table
+        with INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+        
+        The staging table lives as long as the connection and is emptied after each use;
+        it is created again if a rollback or a reconnect discarded it.
+        """
+        staging = f"{table_name}_staging"
+        column_list = ', '.join([f'"{col}"' for col in columns])
+        self.conn.execute(db.text(
+            f'CREATE TEMPORARY TABLE IF NOT EXISTS "{staging}" (LIKE "{table_name}" INCLUDING DEFAULTS)'
+        ))
+        self._copy_from_stdin(staging, columns, rows)
+        self.conn.execute(db.text(
+            f'INSERT INTO "{table_name}" ({column_list}) SELECT {column_list} FROM "{staging}" ON CONFLICT DO NOTHING'
+        ))
+        self.conn.execute(db.text(f'TRUNCATE "{staging}"'))
+    
+    def _copy_from_stdin(self, table_name: str, columns: list, rows: list):
+        """
+        Stream rows into a table with PostgreSQL COPY through the psycopg2 connection.
+        
+        Rows are encoded as CSV with None written as the \\N marker, which COPY reads
+        back as NULL.
+        """
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            [['\\N' if value is None else value for value in row] for row in rows]
+        )
+        buffer.seek(0)
+        
+        # COPY runs on the raw DBAPI connection; make sure SQLAlchemy owns the transaction
+        if not self.conn.in_transaction():
+            self.conn.begin()
+        column_list = ', '.join([f'"{col}"' for col in columns])
+        cursor = self.conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(
+                f'COPY "{table_name}" ({column_list}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')', buffer)
+        finally:
+            cursor.close()
+    
     # Fetch one record from a table
     def fetch_one(self, table_name: str, columns: list = None):
         """
         Fetch one record from a specified table.
         
         Parameters:
-        table_name (str): The name of the table to fetch a record from.
+        table_name (str): The name of the table to fetch a record from (quoted for you).
+        columns (list): The columns to fetch (optional, defaults to every column).
         
         Returns:
         pl.DataFrame: A Polars DataFrame containing the first record from the table.
         """
-        if columns is None:
-            query = f"SELECT * FROM {table_name} LIMIT 1"
-        else:
-            cols = ', '.join(columns)
-            query = f"SELECT {cols} FROM {table_name} LIMIT 1"
-        
         df = pl.read_database(
-            query = query,
+            query = self._select_sql(table_name, columns) + ' LIMIT 1',
             connection = self.conn
         )
+        # End the read transaction so the pooled connection is not left idle in transaction
+        if not self.in_transaction():
+            self.conn.commit()
         return df
     
     # Fetch all records from a table
-    def fetch_all(self, table_name: str, columns: list = None):
+    def fetch_all(self, table_name: str, columns: list = None, iter_batches: bool = False, batch_size: int = 10000):
         """
         Fetch all records from a specified table.
         
+        The whole table is held in memory; pass iter_batches=True to stream large
+        tables in bounded batches instead.
+        
         Parameters:
-        table_name (str): The name of the table to fetch records from.
+        table_name (str): The name of the table to fetch records from (quoted for you).
+        columns (list): The columns to fetch (optional, defaults to every column).
+        iter_batches (bool): Return an iterator of DataFrames of at most batch_size rows.
+        batch_size (int): Rows per batch when iter_batches is True.
         
         Returns:
-        pl.DataFrame: A Polars DataFrame containing the records from the table.
+        pl.DataFrame: A Polars DataFrame containing the records from the table, or an
+        iterator of DataFrames when iter_batches is True.
         """
-        if columns is None:
-            query = f"SELECT * FROM {table_name}"
-        else:
-            cols = ', '.join(columns)
-            query = f"SELECT {cols} FROM {table_name}"
+        query = self._select_sql(table_name, columns)
+        if iter_batches:
+            return self.iter_batches(query, batch_size=batch_size)
         
         df = pl.read_database(
             query = query,
             connection = self.conn
         )
-        return df
\ No newline at end of file
+        # End the read transaction so the pooled connection is not left idle in transaction
+        if not self.in_transaction():
+            self.conn.commit()
+        return df
+    
+    # Stream the result of a query in bounded batches
+    def iter_batches(self, query, params: dict = None, batch_size: int = 10000):
+        """
+        Run a SELECT and yield its rows as Polars DataFrames of at most batch_size rows.
+        
+        The rows are fetched with a server-side cursor on PostgreSQL, so memory stays
+        bounded by batch_size whatever the size of the result. The read transaction is
+        ended once the iterator is exhausted or closed.
+        
+        Parameters:
+        query (str | TextClause): The SELECT statement, with :name placeholders.
+        params (dict): Values for the placeholders (optional).
+        batch_size (int): Maximum rows per DataFrame.
+        
+        Returns:
+        Iterator[pl.DataFrame]: The result, batch by batch.
+        """
+        statement = db.text(query) if isinstance(query, str) else query
+        statement = statement.execution_options(yield_per=batch_size)
+        try:
+            yield from pl.read_database(
+                query=statement,
+                connection=self.conn,
+                iter_batches=True,
+                batch_size=batch_size,
+                execute_options={'parameters': params} if params else None
+            )
+        finally:
+            if not self.in_transaction():
+                self.conn.commit()
+    
+    # Fetch the history of one unit over a time range
+    def fetch_unit_history(self, table_name: str, unit_id: str, start, end=None, columns: list = None,
+                           iter_batches: bool = False, batch_size: int = 10000):
+        """
+        Fetch the rows of one unit recorded in [start, end), oldest first.
+        
+        The unit and time predicates and the column list are sent to the database, so
+        only the matching rows of the requested columns are read.
+        
+        Parameters:
+        table_name (str): A history table with unit_id and recorded_at, e.g. "SpeedHistory".
+        unit_id (str): The unit UUID.
+        start (datetime): First recorded_at included.
+        end (datetime): First recorded_at excluded (optional, defaults to no upper bound).
+        columns (list): The columns to fetch (optional, defaults to every column).
+        iter_batches (bool): Return an iterator of DataFrames of at most batch_size rows.
+        batch_size (int): Rows per batch when iter_batches is True.
+        
+        Returns:
+        pl.DataFrame: The matching rows, or an iterator of DataFrames when iter_batches is True.
+        """
+        where = '"unit_id" = :unit_id AND "recorded_at" >= :start'
+        params = {'unit_id': unit_id, 'start': start}
+        if end is not None:
+            where += ' AND "recorded_at" < :end'
+            params['end'] = end
+        query = self._select_sql(table_name, columns) + f' WHERE {where} ORDER BY "recorded_at"'
+        if iter_batches:
+            return self.iter_batches(query, params, batch_size)
+        return self.fetch_frame(query, params)
+    
+    # Fetch the latest rows of every unit
+    def fetch_latest(self, table_name: str, n: int = 1, unit_ids: list = None, columns: list = None, since=None):
+        """
+        Fetch the latest n rows of each unit, newest first per unit.
+        
+        On PostgreSQL each unit of "Units" is looked up with a LATERAL subquery, which
+        reads n rows per unit from the (unit_id, recorded_at) index instead of the whole
+        table; elsewhere a ROW_NUMBER() window is used.
+        
+        Parameters:
+        table_name (str): A history table with unit_id and recorded_at, e.g. "LocationHistory".
+        n (int): Rows per unit.
+        unit_ids (list): Only these units (optional, defaults to every unit).
+        columns (list): The columns to fetch; unit_id and recorded_at are always included.
+        since (datetime): Ignore rows recorded before this time (optional).
+        
+        Returns:
+        pl.DataFrame: Up to n rows per unit, ordered by unit_id and newest recorded_at first.
+        """
+        columns = ['unit_id', 'recorded_at'] + [col for col in (columns or []) if col not in ('unit_id', 'recorded_at')]
+        if not unit_ids and unit_ids is not None:
+            return pl.DataFrame(schema=columns)
+        table = self.quote_identifier(table_name)
+        params = {'n': n}
+        time_filter = ''
+        if since is not None:
+            time_filter = ' AND h."recorded_at" >= :since'
+            params['since'] = since
+        unit_filter = ''
+        if unit_ids is not None:
+            params['unit_ids'] = [str(unit_id) for unit_id in unit_ids]
+        
+        if self.engine.dialect.name == 'postgresql':
+            column_list = ', '.join([f'h.{self.quote_identifier(col)}' for col in columns])
+            if unit_ids is not None:
+                unit_filter = ' WHERE u."unit_id" IN :unit_ids'
+            query = (f'SELECT l.* FROM "Units" u CROSS JOIN LATERAL ('
+                     f'SELECT {column_list} FROM {table} h WHERE h."unit_id" = u."unit_id"{time_filter} '
+                     f'ORDER BY h."recorded_at" DESC LIMIT :n) l{unit_filter} '
+                     f'ORDER BY l."unit_id", l."recorded_at" DESC')
+        else:
+            column_list = ', '.join([self.quote_identifier(col) for col in columns])
+            if unit_ids is not None:
+                unit_filter = ' AND h."unit_id" IN :unit_ids'
+            query = (f'SELECT {column_list} FROM ('
+                     'SELECT h.*, '
+                     f'ROW_NUMBER() OVER (PARTITION BY h."unit_id" ORDER BY h."recorded_at" DESC) AS "_rank" '
+                     f'FROM {table} h WHERE 1 = 1{time_filter}{unit_filter}) r '
+                     f'WHERE "_rank" <= :n ORDER BY "unit_id", "recorded_at" DESC')
+        statement = db.text(query)
+        if unit_ids is not None:
+            statement = statement.bindparams(db.bindparam('unit_ids', expanding=True))
+        return self.fetch_frame(statement, params)
+    
+    # List the columns of a table
+    def column_names(self, table_name: str) -> list:
+        """
+        Return the column names of a table, e.g. to check that a migration was applied.
+        
+        Parameters:
+        table_name (str): The name of the table.
+        
+        Returns:
+        list: The column names, or an empty list if the table cannot be inspected.
+        """
+        try:
+            return [column['name'] for column in db.inspect(self.engine).get_columns(table_name)]
+        except Exception as e:
+            logger.error("Error inspecting %s: %s", table_name, e)
+            return []
+    
+    # Quote a table or column name
+    @staticmethod
+    def quote_identifier(name: str) -> str:
+        """
+        Quote a table or column name so its case is kept and it cannot inject SQL.
+        
+        Names that are already quoted are kept as they are, and schema-qualified names
+        are quoted part by part (public.Units -> "public"."Units").
+        
+        Parameters:
+        name (str): The identifier.
+        
+        Returns:
+        str: The quoted identifier.
+        """
+        if len(name) >= 2 and name.startswith('"') and name.endswith('"'):
+            return name
+        return '.'.join(['"' + part.replace('"', '""') + '"' for part in name.split('.')])
+    
+    def _select_sql(self, table_name: str, columns: list = None) -> str:
+        """
+        Build a SELECT of some columns (every column if None) of a table, with quoted identifiers.
+        """
+        column_list = '*' if columns is None else ', '.join([self.quote_identifier(col) for col in columns])
+        return f'SELECT {column_list} FROM {self.quote_identifier(table_name)}'
+    
+    # Run a parameterized query and return the result as a DataFrame
+    def fetch_frame(self, query, params: dict = None):
+        """
+        Run a SELECT with bound parameters and return its rows as a Polars DataFrame.
+        
+        Parameters:
+        query (str | TextClause): The SELECT statement, with :name placeholders.
+        params (dict): Values for the placeholders (optional).
+        
+        Returns:
+        pl.DataFrame: One column per selected column, one row per result row.
+        """
+        result = self._execute(query, params or None)
+        columns = list(result.keys())
+        rows = [tuple(row) for row in result.fetchall()]
+        # End the read transaction so the pooled connection is not left idle in transaction
+        if not self.in_transaction():
+            self.conn.commit()
+        return pl.DataFrame(rows, schema=columns, orient='row')
\ No newline at end of file
@@ -0,0 +1,127 @@
+import http.server
+import json
+import os
+import socketserver
+import threading
+import urllib.parse
+
+
+class HttpEndpoint:
+    """
+    A small read-only HTTP server running on a background thread.
+
+    Each route maps a path to a handler called with the query string parameters as a
+    dict. A handler returns the response body: dicts and lists are sent as JSON, strings
+    as plain text. A ValueError raised by a handler becomes a 400 response. The server
+    listens on a TCP port, or on a Unix socket when `unix_socket` is given, and handles
+    every request on its own daemon thread so a slow client never blocks the writer.
+
+    Attributes:
+    - routes (dict): Path -> handler(query) returning the response body.
+    - host (str): The interface to listen on.
+    - port (int): The TCP port to listen on.
+    - unix_socket (str): Path of a Unix socket to listen on instead of TCP (optional).
+    - requests (int): Number of requests served.
+
+    Methods:
+    - start(): Start serving on a background thread.
+    - stop(): Stop serving and release the socket.
+    """
+
+    class _Handler(http.server.BaseHTTPRequestHandler):
+        """Dispatch GET requests to the endpoint's routes"""
+        endpoint = None
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            handler = self.endpoint.routes.get(url.path)
+            if handler is None:
+                self._respond(404, {'error': f"Unknown path: {url.path}"})
+                return
+            query = dict(urllib.parse.parse_qsl(url.query))
+            try:
+                self._respond(200, handler(query))
+            except ValueError as e:
+                self._respond(400, {'error': str(e)})
+            except Exception as e:
+                self._respond(500, {'error': str(e)})
+
+        def _respond(self, status, body):
+            if isinstance(body, str):
+                payload, content_type = body.encode(), 'text/plain; charset=utf-8'
+            else:
+                payload, content_type = json.dumps(body, default=str).encode(), 'application/json'
+            self.endpoint.requests += 1
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def address_string(self):
+            # Unix socket clients have no address
+            return self.client_address[0] if self.client_address else 'unix'
+
+        def log_message(self, format, *args):
+            # No per-request output
+            pass
+
+    class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """Threaded HTTP server on a Unix socket"""
+        daemon_threads = True
+
+    def __init__(self, routes: dict, host: str = '127.0.0.1', port: int = 8081, unix_socket: str = None):
+        """
+        Initialize the HttpEndpoint.
+
+        Parameters:
+        - routes (dict): Path -> handler(query) returning the response body.
+        - host (str): The interface to listen on.
+        - port (int): The TCP port to listen on.
+        - unix_socket (str): Path of a Unix socket to listen on instead of TCP (optional).
+        """
+        self.routes = routes
+        self.host = host
+        self.port = port
+        self.unix_socket = unix_socket
+        self.requests = 0
+
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """
+        Start serving on a background thread.
+
+        Returns:
+        - None
+        """
+        if self._server is not None:
+            return
+        handler = type('Handler', (self._Handler,), {'endpoint': self})
+        if self.unix_socket:
+            # A socket file left by a previous run would make bind fail
+            if os.path.exists(self.unix_socket):
+                os.remove(self.unix_socket)
+            self._server = self._UnixServer(self.unix_socket, handler)
+        else:
+            self._server = http.server.ThreadingHTTPServer((self.host, self.port), handler)
+            self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="http-endpoint", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop serving and release the socket.
+
+        Returns:
+        - None
+        """
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        if self.unix_socket and os.path.exists(self.unix_socket):
+            os.remove(self.unix_socket)
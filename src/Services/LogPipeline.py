@@ -0,0 +1,207 @@
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+
+class LogPipeline:
+    """
+    Structured, rate-limited logging that never blocks the thread emitting a record.
+
+    The root logger gets a single queue handler: the emitting thread (the MQTT network
+    thread, the writer thread...) only checks the rate limit and puts the record on a
+    bounded in-memory queue. A listener thread formats the records, as JSON lines or
+    text, and writes them to the stream. When the stream stalls (a full pipe, a slow log
+    driver) the queue fills up and further records are dropped and counted instead of
+    blocking the emitter.
+
+    Every event, i.e. every logger and message template ("Could not route topic: %s"),
+    may emit `rate_limit` records per `rate_interval` seconds; the next ones are
+    suppressed and their count is reported on the first record of that event in the
+    following interval. Records below INFO are not limited, so per-unit traces stay
+    complete. Messages must therefore be logged as templates with arguments, not as
+    preformatted strings.
+
+    Attributes:
+    - level (str): Level of the root logger (e.g. 'INFO').
+    - json_output (bool): Write JSON lines instead of text.
+    - rate_limit (int): Records per event and interval; 0 disables the limit.
+    - rate_interval (float): Seconds of a rate limit interval.
+    - queue_size (int): Maximum number of records waiting for the listener.
+    - stream: Where the listener writes (defaults to sys.stdout).
+
+    Methods:
+    - start(): Install the queue handler on the root logger and start the listener thread.
+    - stop(): Write the queued records and stop the listener thread.
+    - stats(): Return the dropped and suppressed record counts.
+    """
+
+    class JsonFormatter(logging.Formatter):
+        """One JSON object per record, with the fields passed as `extra`"""
+        # Attributes every LogRecord has; anything else came from `extra`
+        RESERVED = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+        def format(self, record):
+            created = datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+            entry = {
+                'time': created.isoformat(timespec='milliseconds'),
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage(),
+            }
+            for key, value in record.__dict__.items():
+                if key not in self.RESERVED:
+                    entry[key] = value
+            if record.exc_info and not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+            if record.exc_text:
+                entry['exception'] = record.exc_text
+            return json.dumps(entry, default=str, ensure_ascii=False)
+
+    class TextFormatter(logging.Formatter):
+        """Classic log lines, followed by the fields passed as `extra`"""
+
+        def __init__(self):
+            super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+        def format(self, record):
+            line = super().format(record)
+            fields = ' '.join(f"{key}={value}" for key, value in record.__dict__.items()
+                              if key not in LogPipeline.JsonFormatter.RESERVED)
+            if not fields:
+                return line
+            # Keep a traceback below the fields
+            head, newline, tail = line.partition('\n')
+            return f"{head} [{fields}]{newline}{tail}"
+
+    class RateLimitFilter(logging.Filter):
+        """
+        Let `limit` records per event through every `interval` seconds, count the rest.
+
+        Runs on the emitting threads without a lock: two threads racing on the same event
+        may let one record too many through or miscount one, never raise.
+        """
+
+        def __init__(self, limit, interval):
+            super().__init__()
+            self.limit = limit
+            self.interval = interval
+            # (logger, template) -> [interval start, records let through, records suppressed]
+            self._events = {}
+            self.suppressed = 0
+
+        def filter(self, record):
+            if record.levelno < logging.INFO or self.limit <= 0:
+                return True
+            now = time.monotonic()
+            key = (record.name, record.msg)
+            event = self._events.get(key)
+            if event is None or now - event[0] >= self.interval:
+                if event is not None and event[2]:
+                    record.suppressed = event[2]
+                self._events[key] = [now, 1, 0]
+                return True
+            if event[1] < self.limit:
+                event[1] += 1
+                return True
+            event[2] += 1
+            self.suppressed += 1
+            return False
+
+    class _QueueHandler(logging.handlers.QueueHandler):
+        """Enqueue without waiting; records that do not fit are dropped and counted"""
+
+        def __init__(self, records):
+            super().__init__(records)
+            self.dropped = 0
+
+        def prepare(self, record):
+            # Merge the arguments now, the listener may format the record much later, but
+            # leave the traceback apart for the formatter (the default folds it into msg)
+            record = logging.makeLogRecord(record.__dict__)
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            return record
+
+        def enqueue(self, record):
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+    class _QueueListener(logging.handlers.QueueListener):
+        """Wait for room to queue the stop sentinel, the queue may be full when stopping"""
+
+        def enqueue_sentinel(self):
+            self.queue.put(self._sentinel)
+
+    def __init__(self, level: str = 'INFO', json_output: bool = True, rate_limit: int = 10,
+                 rate_interval: float = 10.0, queue_size: int = 10000, stream=None):
+        """
+        Initialize the LogPipeline.
+
+        Parameters:
+        - level (str): Level of the root logger (e.g. 'INFO').
+        - json_output (bool): Write JSON lines instead of text.
+        - rate_limit (int): Records per event and interval; 0 disables the limit.
+        - rate_interval (float): Seconds of a rate limit interval.
+        - queue_size (int): Maximum number of records waiting for the listener.
+        - stream: Where the listener writes (defaults to sys.stdout).
+        """
+        self.level = level.upper()
+        self.json_output = json_output
+        self.rate_limit = rate_limit
+        self.rate_interval = rate_interval
+        self.queue_size = queue_size
+        self.stream = stream
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(self.JsonFormatter() if json_output else self.TextFormatter())
+        self.rate_filter = self.RateLimitFilter(rate_limit, rate_interval)
+        self.handler = self._QueueHandler(queue.Queue(maxsize=queue_size))
+        self.handler.addFilter(self.rate_filter)
+        self.listener = self._QueueListener(self.handler.queue, output)
+        self._previous = None
+
+    def start(self):
+        """
+        Route every record through the queue and start the listener thread.
+
+        Returns:
+        - None
+        """
+        root = logging.getLogger()
+        self._previous = (root.handlers[:], root.level)
+        root.handlers = [self.handler]
+        root.setLevel(self.level)
+        self.listener.start()
+
+    def stop(self):
+        """
+        Write the records still queued, stop the listener and restore the root logger.
+
+        Returns:
+        - None
+        """
+        if self._previous is None:
+            return
+        root = logging.getLogger()
+        root.handlers, level = self._previous
+        root.setLevel(level)
+        self._previous = None
+        self.listener.stop()
+
+    def stats(self) -> dict:
+        """
+        Return the records lost to back pressure and to the rate limit.
+
+        Returns:
+        - dict: dropped (queue full) and suppressed (rate limited) record counts.
+        """
+        return {'dropped': self.handler.dropped, 'suppressed': self.rate_filter.suppressed}
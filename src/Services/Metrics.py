@@ -0,0 +1,269 @@
+import bisect
+import math
+
+
+class Metrics:
+    """
+    A registry of counters, histograms and gauges rendered in the Prometheus text format.
+
+    Built for the hot path: each series is a slot in a preallocated list, found with one
+    dict lookup on its label value, so counting a message allocates no containers once
+    the series exists. There are no locks: every counter and histogram must be updated
+    from a single thread (the one that owns the code path it measures), and under the
+    GIL readers see each slot either before or after an update. A scrape may thus see a
+    histogram's buckets one observation apart from its sum, which Prometheus tolerates.
+
+    Gauges are callbacks read at scrape time, so the measured code does nothing for them.
+    Counter views do the same for counters an object already keeps in its own attributes.
+
+    Attributes:
+    - namespace (str): Prefix of every metric name.
+
+    Methods:
+    - counter(name, help, labels): Register a counter family.
+    - histogram(name, help, buckets, labels): Register a histogram family.
+    - gauge(name, help, read): Register a gauge read from a callback.
+    - counter_view(name, help, read, labels): Register a counter read from a callback.
+    - render(): Return every metric in the Prometheus text format.
+    - routes(): Return the HttpEndpoint route serving /metrics.
+    """
+    # Seconds, from a fast statement to a stalled commit
+    LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    class Counter:
+        """
+        A monotonically increasing value per label value (or per tuple of label values).
+        """
+        __slots__ = ('name', 'help', 'labels', '_index', '_values')
+
+        def __init__(self, name, help, labels):
+            self.name = name
+            self.help = help
+            self.labels = labels
+            # Label value(s) -> slot in _values
+            self._index = {}
+            self._values = []
+
+        def inc(self, key=None, amount=1):
+            """
+            Add to the series of a label value (a tuple for several labels, None for none).
+            """
+            slot = self._index.get(key)
+            if slot is None:
+                # Grow _values before publishing the slot, a scrape may read the index at any time
+                slot = len(self._values)
+                self._values.append(0)
+                self._index[key] = slot
+            self._values[slot] += amount
+
+        def value(self, key=None):
+            """
+            Return the current value of a series.
+            """
+            slot = self._index.get(key)
+            return 0 if slot is None else self._values[slot]
+
+        def samples(self):
+            """
+            Yield (suffix, label pairs, value) for the exposition.
+            """
+            for key, slot in self._index.copy().items():
+                yield '', Metrics._label_pairs(self.labels, key), self._values[slot]
+
+    class Histogram:
+        """
+        Observation counts per bucket, plus their sum, per label value.
+        """
+        __slots__ = ('name', 'help', 'labels', 'buckets', '_index')
+
+        def __init__(self, name, help, labels, buckets):
+            self.name = name
+            self.help = help
+            self.labels = labels
+            self.buckets = tuple(sorted(buckets))
+            # Label value(s) -> [per-bucket counts (the last one for +Inf), sum]
+            self._index = {}
+
+        def observe(self, value, key=None):
+            """
+            Record one observation in the series of a label value.
+            """
+            series = self._index.get(key)
+            if series is None:
+                series = self._index[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            # A value equal to a bound belongs to that bucket (le = less or equal)
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+        def samples(self):
+            """
+            Yield (suffix, label pairs, value) for the exposition, with cumulative buckets.
+            """
+            for key, (counts, total) in self._index.copy().items():
+                pairs = Metrics._label_pairs(self.labels, key)
+                cumulative = 0
+                for bound, count in zip(self.buckets + (math.inf,), list(counts)):
+                    cumulative += count
+                    yield '_bucket', pairs + [('le', '+Inf' if bound == math.inf else repr(float(bound)))], cumulative
+                yield '_sum', pairs, total
+                yield '_count', pairs, cumulative
+
+    class Gauge:
+        """
+        A value read from a callback when the metrics are rendered.
+        """
+        __slots__ = ('name', 'help', 'labels', 'read')
+
+        def __init__(self, name, help, read):
+            self.name = name
+            self.help = help
+            self.labels = ()
+            self.read = read
+
+        def samples(self):
+            yield '', [], self.read()
+
+    class CounterView:
+        """
+        Counters kept by another object, read from a callback when the metrics are rendered.
+        """
+        __slots__ = ('name', 'help', 'labels', 'read')
+
+        def __init__(self, name, help, labels, read):
+            self.name = name
+            self.help = help
+            self.labels = labels
+            self.read = read
+
+        def samples(self):
+            for key, value in self.read().items():
+                yield '', Metrics._label_pairs(self.labels, key), value
+
+    def __init__(self, namespace: str = 'mqtt_writer'):
+        """
+        Initialize an empty Metrics registry.
+
+        Parameters:
+        - namespace (str): Prefix of every metric name.
+        """
+        self.namespace = namespace
+        self._families = []
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> 'Metrics.Counter':
+        """
+        Register a counter family.
+
+        Parameters:
+        - name (str): The metric name, without the namespace (e.g. 'messages_received_total').
+        - help (str): The description shown by Prometheus.
+        - labels (tuple): The label names.
+
+        Returns:
+        - Metrics.Counter: The family, updated with inc(key).
+        """
+        return self._register(self.Counter(self._name(name), help, tuple(labels)))
+
+    def histogram(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS,
+                  labels: tuple = ()) -> 'Metrics.Histogram':
+        """
+        Register a histogram family.
+
+        Parameters:
+        - name (str): The metric name, without the namespace (e.g. 'commit_seconds').
+        - help (str): The description shown by Prometheus.
+        - buckets (tuple): The upper bounds of the buckets (defaults to latencies in seconds).
+        - labels (tuple): The label names.
+
+        Returns:
+        - Metrics.Histogram: The family, updated with observe(value, key).
+        """
+        return self._register(self.Histogram(self._name(name), help, tuple(labels), buckets))
+
+    def gauge(self, name: str, help: str, read) -> 'Metrics.Gauge':
+        """
+        Register a gauge read from a callback at scrape time.
+
+        Parameters:
+        - name (str): The metric name, without the namespace.
+        - help (str): The description shown by Prometheus.
+        - read (callable): Returns the current value.
+
+        Returns:
+        - Metrics.Gauge: The family.
+        """
+        return self._register(self.Gauge(self._name(name), help, read))
+
+    def counter_view(self, name: str, help: str, read, labels: tuple = ()) -> 'Metrics.CounterView':
+        """
+        Register a counter family whose values are kept elsewhere and read at scrape time.
+
+        Parameters:
+        - name (str): The metric name, without the namespace (e.g. 'location_halves_total').
+        - help (str): The description shown by Prometheus.
+        - read (callable): Returns {label value(s): current value}, with None as key when there are no labels.
+        - labels (tuple): The label names.
+
+        Returns:
+        - Metrics.CounterView: The family.
+        """
+        return self._register(self.CounterView(self._name(name), help, tuple(labels), read))
+
+    def render(self) -> str:
+        """
+        Return every metric in the Prometheus text exposition format.
+
+        Returns:
+        - str: The exposition, one sample per line.
+        """
+        kinds = {self.Counter: 'counter', self.CounterView: 'counter',
+                 self.Histogram: 'histogram', self.Gauge: 'gauge'}
+        lines = []
+        for family in list(self._families):
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {kinds[type(family)]}")
+            for suffix, pairs, value in family.samples():
+                labels = ','.join(f'{name}="{self._escape(label)}"' for name, label in pairs)
+                series = f"{family.name}{suffix}{{{labels}}}" if labels else f"{family.name}{suffix}"
+                lines.append(f"{series} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def routes(self) -> dict:
+        """
+        Return the HttpEndpoint route serving the metrics.
+
+        Returns:
+        - dict: {'/metrics': handler}.
+        """
+        return {'/metrics': lambda query: self.render()}
+
+    def _register(self, family):
+        """
+        Add a family to the registry, rejecting duplicate names.
+        """
+        if any(existing.name == family.name for existing in self._families):
+            raise ValueError(f"Metric already registered: {family.name}")
+        self._families.append(family)
+        return family
+
+    def _name(self, name):
+        """
+        Prefix a metric name with the namespace.
+        """
+        return f"{self.namespace}_{name}" if self.namespace else name
+
+    @staticmethod
+    def _label_pairs(names, key):
+        """
+        Pair label names with the values of a series key.
+        """
+        if not names:
+            return []
+        values = key if len(names) > 1 else (key,)
+        return list(zip(names, values))
+
+    @staticmethod
+    def _escape(value):
+        """
+        Escape a label value for the exposition format.
+        """
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
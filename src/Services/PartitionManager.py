@@ -0,0 +1,325 @@
+import datetime
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PartitionManager:
+    """
+    Keep the daily partitions of the history tables ahead of the data, and detach old ones.
+
+    For every table partitioned by range on "recorded_at" (see migration 001), the
+    partitions "<table>_pYYYYMMDD" from yesterday through `days_ahead` days from today
+    are created if missing, so rows never pile up in the default partition. With a
+    `retention_days` (one for every table, or per table), partitions whose whole day is
+    older than that are detached; they
+    are kept as plain tables for archiving unless `drop_detached` is set. Detaching or
+    dropping a partition is a metadata change, unlike DELETE over millions of rows.
+
+    Rows written while their day had no partition land in the default partition, where
+    they would make creating that day's partition fail; they are moved into the new
+    partition before it is attached. A day that still cannot be created is reported and
+    the following days are created anyway.
+
+    Tables that are not partitioned (migration not applied, or not PostgreSQL) are
+    skipped. Maintenance runs on its own thread (see start()), never on the thread
+    writing batches, and under a PostgreSQL advisory lock: when several writers share
+    the database (sharded workers, replicas), one of them maintains the partitions and
+    the others skip the run instead of racing on the same DDL.
+
+    Attributes:
+    - db (DatabaseConnection): The database connection.
+    - tables (list): The partitioned tables to maintain.
+    - days_ahead (int): Days of partitions created ahead of today.
+    - retention_days (int or dict): Days of partitions kept attached, or table -> days (None keeps every partition).
+    - drop_detached (bool): Drop partitions instead of only detaching them.
+    - interval (float): Seconds between two maintenance runs.
+    - created (int): Partitions created.
+    - moved (int): Rows moved out of the default partition into a new partition.
+    - detached (int): Partitions detached (or dropped).
+
+    Methods:
+    - start(): Run maintain() now, then every `interval` seconds on a background thread.
+    - stop(): Stop the background thread.
+    - maintain_if_due(): Run maintain() if the interval has elapsed.
+    - maintain(): Create the upcoming partitions and detach the expired ones.
+    - create_partitions(table, first_day, last_day): Create the daily partitions of a date range.
+    - partitions(table): Return the day of every daily partition of a table.
+    - is_partitioned(table): Check whether a table is partitioned.
+    """
+    PARTITION_NAME = re.compile(r'_p(\d{8})$')
+    # pg_try_advisory_lock key shared by every writer maintaining the same database
+    LOCK_KEY = 0x6d717474_70617274
+
+    def __init__(self, db, tables: list = None, days_ahead: int = 7, retention_days=None,
+                 drop_detached: bool = False, interval: float = 3600):
+        """
+        Initialize the PartitionManager.
+
+        Parameters:
+        - db (DatabaseConnection): The database connection.
+        - tables (list): The partitioned tables to maintain (defaults to SpeedHistory and LocationHistory).
+        - days_ahead (int): Days of partitions created ahead of today.
+        - retention_days (int or dict): Days of partitions kept attached, or table -> days
+          (None, or a table missing from the dict, keeps every partition).
+        - drop_detached (bool): Drop partitions instead of only detaching them.
+        - interval (float): Seconds between two maintenance runs.
+        """
+        self.db = db
+        self.tables = tables or ['SpeedHistory', 'LocationHistory']
+        self.days_ahead = days_ahead
+        self.retention_days = retention_days
+        self.drop_detached = drop_detached
+        self.interval = interval
+        self._next_run = 0.0
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self.created = 0
+        self.moved = 0
+        self.detached = 0
+
+    def start(self):
+        """
+        Run maintain() now, so today's partitions exist before the first rows arrive,
+        then every `interval` seconds on a background thread.
+
+        Returns:
+        - None
+        """
+        self.maintain()
+        self._next_run = time.monotonic() + self.interval
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='partition-maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread, waiting for a maintenance run in progress.
+
+        Returns:
+        - None
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def maintain_if_due(self) -> bool:
+        """
+        Run maintain() if the interval has elapsed since the last run.
+
+        Returns:
+        - bool: True if maintenance ran.
+        """
+        if time.monotonic() < self._next_run:
+            return False
+        self._next_run = time.monotonic() + self.interval
+        self.maintain()
+        return True
+
+    def maintain(self):
+        """
+        Create the upcoming partitions and detach the expired ones, for every partitioned table.
+
+        Errors are reported and left for the next run. The run is skipped while another
+        writer holds the maintenance lock.
+        """
+        if not self._lock():
+            logger.debug("🗄️ Partition maintenance running in another writer, skipped")
+            return
+        try:
+            today = datetime.date.today()
+            for table in self.tables:
+                try:
+                    if not self.is_partitioned(table):
+                        continue
+                    self.create_partitions(table, today - datetime.timedelta(days=1),
+                                           today + datetime.timedelta(days=self.days_ahead))
+                    retention_days = self.retention_days
+                    if isinstance(retention_days, dict):
+                        retention_days = retention_days.get(table)
+                    if retention_days is not None:
+                        self._detach_before(table, today - datetime.timedelta(days=retention_days))
+                except Exception as e:
+                    logger.warning("⚠️ Partition maintenance of %s failed: %s", table, e)
+        finally:
+            self._unlock()
+
+    def create_partitions(self, table: str, first_day: datetime.date, last_day: datetime.date) -> int:
+        """
+        Create the missing daily partitions of a table from first_day through last_day.
+
+        Parameters:
+        - table (str): The partitioned table.
+        - first_day (datetime.date): First day to cover.
+        - last_day (datetime.date): Last day to cover.
+
+        Returns:
+        - int: Number of partitions created.
+        """
+        existing = set(self.partitions(table))
+        default, key = self._default_partition(table)
+        created = 0
+        day = first_day
+        while day <= last_day:
+            if day not in existing:
+                try:
+                    self._create_partition(table, day, default, key)
+                    created += 1
+                except Exception as e:
+                    logger.warning("⚠️ Partition %s could not be created: %s", self._partition_name(table, day), e)
+            day += datetime.timedelta(days=1)
+        self.created += created
+        return created
+
+    def partitions(self, table: str) -> list:
+        """
+        Return the day of every daily partition attached to a table.
+
+        Parameters:
+        - table (str): The partitioned table.
+
+        Returns:
+        - list: datetime.date of each partition, oldest first.
+        """
+        df = self.db.fetch_frame(
+            'SELECT c."relname" FROM pg_inherits i JOIN pg_class c ON c."oid" = i."inhrelid" '
+            'WHERE i."inhparent" = to_regclass(:table)',
+            {'table': f'"{table}"'}
+        )
+        days = []
+        for name in df['relname'].to_list() if df.height else []:
+            match = self.PARTITION_NAME.search(name)
+            if match and name == self._partition_name(table, self._day(match.group(1))):
+                days.append(self._day(match.group(1)))
+        return sorted(days)
+
+    def is_partitioned(self, table: str) -> bool:
+        """
+        Check whether a table is partitioned.
+
+        Parameters:
+        - table (str): The table name.
+
+        Returns:
+        - bool: True if it is a partitioned PostgreSQL table.
+        """
+        if self.db.engine.dialect.name != 'postgresql':
+            return False
+        df = self.db.fetch_frame(
+            'SELECT 1 AS "partitioned" FROM pg_partitioned_table WHERE "partrelid" = to_regclass(:table)',
+            {'table': f'"{table}"'}
+        )
+        return df.height > 0
+
+    def _run(self):
+        """
+        Background thread: run maintain() every interval until stop() is called.
+        """
+        while not self._stopping.wait(max(0.0, self._next_run - time.monotonic())):
+            self.maintain_if_due()
+
+    def _lock(self):
+        """
+        Take the session-level maintenance lock without waiting; True outside PostgreSQL.
+        """
+        if self.db.engine.dialect.name != 'postgresql':
+            return True
+        try:
+            return bool(self.db.fetch_frame('SELECT pg_try_advisory_lock(:key) AS "locked"',
+                                            {'key': self.LOCK_KEY})['locked'][0])
+        except Exception as e:
+            logger.warning("⚠️ Partition maintenance lock failed: %s", e)
+            return False
+
+    def _unlock(self):
+        """
+        Release the maintenance lock taken by _lock() on this thread's connection.
+        """
+        if self.db.engine.dialect.name != 'postgresql':
+            return
+        try:
+            self.db.fetch_frame('SELECT pg_advisory_unlock(:key) AS "unlocked"', {'key': self.LOCK_KEY})
+        except Exception as e:
+            # A lost connection releases its session locks anyway
+            logger.warning("⚠️ Partition maintenance unlock failed: %s", e)
+
+    def _create_partition(self, table, day, default, key):
+        """
+        Create the partition of one day, moving the rows of that day out of the default partition.
+        """
+        name = self._partition_name(table, day)
+        start, end = day, day + datetime.timedelta(days=1)
+        bounds = f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        params = {'start': start, 'end': end}
+        if default is None or not self.db.fetch_frame(
+            f'SELECT 1 AS "found" FROM {default} WHERE "{key}" >= :start AND "{key}" < :end LIMIT 1', params
+        ).height:
+            self.db.execute_query(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" {bounds}')
+            return
+        # PARTITION OF would fail on those rows: fill a standalone table, then attach it
+        columns = ', '.join(f'"{column}"' for column in self._stored_columns(table))
+        with self.db.transaction():
+            self.db.execute_query(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING GENERATED)')
+            moved = self.db.execute_query(
+                f'WITH moved AS (DELETE FROM {default} WHERE "{key}" >= :start AND "{key}" < :end '
+                f'RETURNING {columns}) INSERT INTO "{name}" ({columns}) SELECT {columns} FROM moved',
+                params
+            ).rowcount
+            self.db.execute_query(f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" {bounds}')
+        self.moved += moved
+        logger.info("🗄️ Moved %d rows of %s from the default partition into %s", moved, day, name)
+
+    def _default_partition(self, table):
+        """
+        Return the default partition of a table (quoted, None if it has none) and its partition key column.
+        """
+        df = self.db.fetch_frame(
+            'SELECT CASE WHEN p."partdefid" = 0 THEN NULL ELSE p."partdefid"::regclass::text END '
+            'AS "default_partition", a."attname" AS "key" FROM pg_partitioned_table p '
+            'JOIN pg_attribute a ON a."attrelid" = p."partrelid" AND a."attnum" = p."partattrs"[0] '
+            'WHERE p."partrelid" = to_regclass(:table)',
+            {'table': f'"{table}"'}
+        )
+        if not df.height:
+            return None, None
+        return df['default_partition'][0], df['key'][0]
+
+    def _stored_columns(self, table):
+        """
+        Return the columns of a table that hold values (not generated), in table order.
+        """
+        df = self.db.fetch_frame(
+            'SELECT "attname" FROM pg_attribute WHERE "attrelid" = to_regclass(:table) '
+            'AND "attnum" > 0 AND NOT "attisdropped" AND "attgenerated" = \'\' ORDER BY "attnum"',
+            {'table': f'"{table}"'}
+        )
+        return df['attname'].to_list()
+
+    def _detach_before(self, table, cutoff):
+        """
+        Detach (or drop) the partitions whose day ends before the cutoff date.
+        """
+        for day in self.partitions(table):
+            if day >= cutoff:
+                break
+            name = self._partition_name(table, day)
+            self.db.execute_query(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+            if self.drop_detached:
+                self.db.execute_query(f'DROP TABLE "{name}"')
+            self.detached += 1
+            logger.info("🗄️ %s partition %s", 'Dropped' if self.drop_detached else 'Detached', name)
+
+    @staticmethod
+    def _partition_name(table, day):
+        """Name of the partition of a table holding one day"""
+        return f"{table}_p{day.strftime('%Y%m%d')}"
+
+    @staticmethod
+    def _day(digits):
+        """Parse the YYYYMMDD suffix of a partition name"""
+        return datetime.datetime.strptime(digits, '%Y%m%d').date()
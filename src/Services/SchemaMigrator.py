@@ -0,0 +1,131 @@
+import logging
+import os
+import re
+
+import sqlalchemy as db
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaMigrator:
+    """
+    Apply versioned SQL migrations to a PostgreSQL database, in order, once each.
+
+    Migrations are the files named NNN_description.sql in `directory`; NNN is the
+    version. Each pending migration runs in its own transaction together with its
+    row in "SchemaMigrations", so a failed migration leaves no trace and is retried on
+    the next run. An advisory lock keeps two processes from migrating at the same time.
+
+    The base schema ("Diagrama AV.sql") is version 0. Migrations use PostgreSQL
+    features (partitioning, BRIN, DO blocks) and are not applied to other databases.
+
+    Attributes:
+    - db (DatabaseConnection): The database connection.
+    - directory (str): Directory holding the migration files.
+
+    Methods:
+    - available(): Return the (version, name, path) of every migration file.
+    - applied(): Return the versions already applied.
+    - pending(): Return the migrations not applied yet.
+    - migrate(target): Apply the pending migrations up to a version.
+    """
+    DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'Database', 'migrations')
+
+    # Key of the advisory lock taken while migrating
+    LOCK_KEY = 727274
+
+    FILE_NAME = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+    def __init__(self, db, directory: str = None):
+        """
+        Initialize the SchemaMigrator.
+
+        Parameters:
+        - db (DatabaseConnection): The database connection.
+        - directory (str): Directory holding the migration files (defaults to src/Database/migrations).
+        """
+        self.db = db
+        self.directory = directory or self.DEFAULT_DIRECTORY
+
+    def available(self) -> list:
+        """
+        Return every migration file, ordered by version.
+
+        Returns:
+        - list: (version, name, path) tuples.
+        """
+        migrations = []
+        for file_name in os.listdir(self.directory):
+            match = self.FILE_NAME.match(file_name)
+            if match:
+                migrations.append((int(match.group(1)), match.group(2), os.path.join(self.directory, file_name)))
+        return sorted(migrations)
+
+    def applied(self) -> set:
+        """
+        Return the versions already applied.
+
+        Returns:
+        - set: Applied versions.
+        """
+        with self.db.engine.begin() as conn:
+            self._ensure_table(conn)
+            return {row[0] for row in conn.execute(db.text('SELECT "version" FROM "SchemaMigrations"'))}
+
+    def pending(self) -> list:
+        """
+        Return the migrations not applied yet, ordered by version.
+
+        Returns:
+        - list: (version, name, path) tuples.
+        """
+        applied = self.applied()
+        return [migration for migration in self.available() if migration[0] not in applied]
+
+    def migrate(self, target: int = None) -> list:
+        """
+        Apply the pending migrations up to a version.
+
+        Parameters:
+        - target (int): Last version to apply (optional, defaults to every migration).
+
+        Returns:
+        - list: The (version, name) of the migrations applied.
+        """
+        if self.db.engine.dialect.name != 'postgresql':
+            raise ValueError(f"Migrations require PostgreSQL, not {self.db.engine.dialect.name}")
+        done = []
+        for version, name, path in self.available():
+            if target is not None and version > target:
+                break
+            with open(path, encoding='utf-8') as file:
+                sql = file.read()
+            with self.db.engine.begin() as conn:
+                conn.execute(db.text('SELECT pg_advisory_xact_lock(:key)'), {'key': self.LOCK_KEY})
+                self._ensure_table(conn)
+                # Checked under the lock: another process may have applied it meanwhile
+                exists = conn.execute(
+                    db.text('SELECT 1 FROM "SchemaMigrations" WHERE "version" = :version'), {'version': version}
+                ).first()
+                if exists:
+                    continue
+                logger.info("🛠️ Applying migration %03d %s", version, name)
+                # Sent as is (no_parameters keeps the driver from reading "%" as a placeholder)
+                conn.exec_driver_sql(sql, execution_options={'no_parameters': True})
+                conn.execute(
+                    db.text('INSERT INTO "SchemaMigrations" ("version", "name", "applied_at") '
+                            'VALUES (:version, :name, now())'),
+                    {'version': version, 'name': name}
+                )
+            done.append((version, name))
+        return done
+
+    @staticmethod
+    def _ensure_table(conn):
+        """
+        Create the "SchemaMigrations" table if it does not exist.
+        """
+        conn.execute(db.text(
+            'CREATE TABLE IF NOT EXISTS "SchemaMigrations" ('
+            '"version" int PRIMARY KEY, "name" varchar, "applied_at" timestamp)'
+        ))
@@ -1 +1,9 @@
-from Services.DatabaseConnection import DatabaseConnection
\ No newline at end of file
+from Services.DatabaseConnection import DatabaseConnection
+from Services.BatchWriter import BatchWriter
+from Services.CommitPolicy import CommitPolicy
+from Services.AsyncDatabaseConnection import AsyncDatabaseConnection
+from Services.HttpEndpoint import HttpEndpoint
+from Services.SchemaMigrator import SchemaMigrator
+from Services.PartitionManager import PartitionManager
+from Services.Metrics import Metrics
+from Services.LogPipeline import LogPipeline
\ No newline at end of file
@@ -1,17 +1,18 @@
+import logging
 import os
-import threading
 from dotenv import load_dotenv
-from Schemas import MQTTToDatabaseWriter
+from Schemas import (MQTTToDatabaseWriter, AsyncMQTTToDatabaseWriter, ShardedWriter, TopicRouter, DeadbandFilter,
+                     TrajectoryCompressor, DailyReportAggregator, RuleEngine, FleetState, RollupAggregator)
+from Services import CommitPolicy, HttpEndpoint, DatabaseConnection, SchemaMigrator, Metrics, LogPipeline
 
-# MQTT topics to subscribe to - using wildcard to catch all unit topics
-TOPICS = ["U+_Combustible", "U+_Velocidad", "U+_Panic", "U+_RPM", "U+_Temperatura", "U+_Latitud", "U+_Longitud"]
+logger = logging.getLogger(__name__)
 
 def __main__():
     """
     Main function to initialize and run the MQTTToDatabaseWriter.
     
     This function loads environment variables, initializes the MQTTToDatabaseWriter with
-    wildcard topics to catch all unit messages, and starts the MQTT client.
+    the configured unit subscriptions, and starts the MQTT client.
     
     Returns:
     - None
@@ -19,6 +20,19 @@ def __main__():
     # Load environment variables from .env file
     load_dotenv()
     
+    # Get logging configuration from environment variables and route every record through the log queue
+    log_options = dict(
+        level=os.getenv("LOG_LEVEL", "INFO"),
+        json_output=os.getenv("LOG_FORMAT", "json").lower() == "json",
+        rate_limit=int(os.getenv("LOG_RATE_LIMIT", "10")),
+        rate_interval=float(os.getenv("LOG_RATE_INTERVAL_S", "10")),
+        queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    )
+    log_pipeline = LogPipeline(**log_options)
+    log_pipeline.start()
+    # Units whose messages are traced one by one at debug level ("1-3,7"; empty = none)
+    trace_units = TopicRouter.parse_units(os.getenv("LOG_TRACE_UNITS", "")) or []
+    
     # Get the database URL from environment variables
     db_url = os.getenv("DATABASE_URL")
     if not db_url:
@@ -29,18 +43,224 @@ def __main__():
     mqtt_port = int(os.getenv("MQTT_PORT", "1883"))
     mqtt_keepalive = int(os.getenv("MQTT_KEEPALIVE", "60"))
     
-    print(f"Starting MQTT to Database Writer...")
-    print(f"Database URL: {db_url}")
-    print(f"MQTT Broker: {mqtt_host}:{mqtt_port}")
+    # Units to subscribe to ("1-3,7"; "*" = every unit under fleet/+/+) and legacy U{unit}_{parameter} topics
+    subscribed_units = TopicRouter.parse_units(os.getenv("MQTT_UNITS", "1-3"))
+    legacy_topics = os.getenv("MQTT_LEGACY_TOPICS", "true").lower() == "true"
+    
+    # Get database pool configuration from environment variables
+    db_options = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT_S", "30")),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE_S", "1800")),
+        "retries": int(os.getenv("DB_RETRIES", "3")),
+        "retry_backoff": int(os.getenv("DB_RETRY_BACKOFF_MS", "500")) / 1000,
+        "statement_cache": os.getenv("DB_STATEMENT_CACHE", "true").lower() == "true",
+        "prepared_statements": os.getenv("DB_PREPARED_STATEMENTS", "true").lower() == "true",
+    }
+    
+    # Get write pipeline configuration from environment variables
+    writer_mode = os.getenv("WRITER_MODE", "sync")
+    if writer_mode not in ("sync", "async"):
+        raise ValueError(f"Unknown WRITER_MODE: {writer_mode}. Expected 'sync' or 'async'")
+    queue_size = int(os.getenv("WRITER_QUEUE_SIZE", "10000"))
+    flush_size = int(os.getenv("WRITER_FLUSH_SIZE", "500"))
+    flush_interval_ms = int(os.getenv("WRITER_FLUSH_INTERVAL_MS", "500"))
+    workers = int(os.getenv("WRITER_WORKERS", "1"))
+    if workers > 1 and writer_mode != "sync":
+        raise ValueError("WRITER_WORKERS > 1 runs sharded sync writers and requires WRITER_MODE=sync")
+    
+    # Get commit policy configuration from environment variables
+    commit_policy = CommitPolicy(
+        mode=os.getenv("WRITER_COMMIT_POLICY", "batch"),
+        every=int(os.getenv("WRITER_COMMIT_EVERY", "100")),
+        interval=int(os.getenv("WRITER_COMMIT_INTERVAL_MS", "1000")) / 1000
+    )
+    history_async_commit = os.getenv("WRITER_HISTORY_ASYNC_COMMIT", "false").lower() == "true"
+    
+    # Get location pairing configuration from environment variables
+    location_pair_window_ms = int(os.getenv("LOCATION_PAIR_WINDOW_MS", "2000"))
+    location_orphan_policy = os.getenv("LOCATION_ORPHAN_POLICY", "flush")
+    
+    # Get trajectory compression configuration from environment variables (0 m = keep every fix)
+    trajectory = None
+    location_tolerance_m = float(os.getenv("LOCATION_TOLERANCE_M", "0"))
+    if location_tolerance_m > 0:
+        trajectory = TrajectoryCompressor(
+            tolerance=location_tolerance_m,
+            max_points=int(os.getenv("LOCATION_MAX_POINTS", "32")),
+            max_interval=int(os.getenv("LOCATION_MAX_INTERVAL_S", "60"))
+        )
+    
+    # Get daily report configuration from environment variables
+    daily_reports = None
+    if os.getenv("DAILY_REPORT_ENABLED", "false").lower() == "true":
+        daily_reports = DailyReportAggregator(
+            speed_limit=float(os.getenv("SPEED_LIMIT_KMH", "80")),
+            acceleration_threshold=float(os.getenv("SUDDEN_ACCELERATION_KMH_S", "10")),
+            brake_threshold=float(os.getenv("SUDDEN_BRAKE_KMH_S", "12")),
+            turn_threshold=float(os.getenv("SUDDEN_TURN_DEG_S", "30")),
+            flush_interval=int(os.getenv("DAILY_REPORT_FLUSH_INTERVAL_S", "60"))
+        )
+    
+    # Get rollup configuration from environment variables (needs migration 002)
+    rollups = None
+    if os.getenv("ROLLUPS_ENABLED", "false").lower() == "true":
+        rollups = RollupAggregator(flush_interval=int(os.getenv("ROLLUP_FLUSH_INTERVAL_S", "60")))
+    
+    # Get deadband configuration from environment variables
+    deadband = None
+    if os.getenv("DEADBAND_ENABLED", "false").lower() == "true":
+        deadband = DeadbandFilter(
+            absolute=DeadbandFilter.parse_bands(os.getenv("DEADBAND_ABSOLUTE", "")),
+            relative=float(os.getenv("DEADBAND_RELATIVE", "0")),
+            max_silence=int(os.getenv("DEADBAND_MAX_SILENCE_S", "60"))
+        )
+    
+    # Get alert rule configuration from environment variables
+    rules = None
+    if os.getenv("RULES_ENABLED", "false").lower() == "true":
+        rules = RuleEngine(
+            speed_limit=float(os.getenv("SPEED_LIMIT_KMH", "80")),
+            temperature_limit=float(os.getenv("TEMPERATURE_LIMIT", "110")),
+            rpm_limit=float(os.getenv("RPM_LIMIT", "4500")),
+            hold=float(os.getenv("ALERT_HOLD_S", "3")),
+            rpm_hold=float(os.getenv("RPM_HOLD_S", "30")),
+            cooldown=float(os.getenv("ALERT_COOLDOWN_S", "300")),
+            panic_hold=float(os.getenv("PANIC_HOLD_S", "0")),
+            panic_cooldown=float(os.getenv("PANIC_COOLDOWN_S", "30")),
+            alert_topic=os.getenv("ALERT_TOPIC") or None
+        )
+    
+    # Get fleet status endpoint configuration from environment variables (port 0 and no socket = disabled)
+    status_http_host = os.getenv("STATUS_HTTP_HOST", "127.0.0.1")
+    status_http_port = int(os.getenv("STATUS_HTTP_PORT", "8081"))
+    status_http_socket = os.getenv("STATUS_HTTP_SOCKET") or None
+    fleet_state = None
+    if (status_http_port or status_http_socket) and workers == 1:
+        fleet_state = FleetState()
+    
+    # Get metrics configuration from environment variables (served as /metrics on the status endpoint)
+    metrics = None
+    metrics_enabled = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    if metrics_enabled and (status_http_port or status_http_socket) and workers == 1:
+        metrics = Metrics()
+    
+    # Get history partition configuration from environment variables (empty retention = keep every day)
+    history_retention_days = os.getenv("HISTORY_RETENTION_DAYS")
+    minute_rollup_retention_days = os.getenv("MINUTE_ROLLUP_RETENTION_DAYS")
+    partition_options = dict(
+        tables=['SpeedHistory', 'LocationHistory'] + (['MinuteRollup'] if rollups is not None else []),
+        days_ahead=int(os.getenv("PARTITION_DAYS_AHEAD", "7")),
+        retention_days={
+            'SpeedHistory': int(history_retention_days) if history_retention_days else None,
+            'LocationHistory': int(history_retention_days) if history_retention_days else None,
+            'MinuteRollup': int(minute_rollup_retention_days) if minute_rollup_retention_days else None,
+        },
+        drop_detached=os.getenv("PARTITION_DROP_DETACHED", "false").lower() == "true"
+    )
     
-    # Initialize the MQTTToDatabaseWriter - topic will be ignored since we subscribe to multiple topics in on_connect
-    writer = MQTTToDatabaseWriter(
+    # Get late sample handling configuration from environment variables
+    reorder_window_ms = int(os.getenv("REORDER_WINDOW_MS", "2000"))
+    
+    # Get unit registry configuration from environment variables
+    unknown_unit_policy = os.getenv("UNKNOWN_UNIT_POLICY", "register")
+    unit_refresh_interval = int(os.getenv("UNIT_REFRESH_INTERVAL_S", "300"))
+    
+    status_address = status_http_socket or f'{status_http_host}:{status_http_port}'
+    logger.info("Starting MQTT to Database Writer...")
+    logger.info("Database URL: %s", db_url)
+    logger.info("MQTT Broker: %s:%s", mqtt_host, mqtt_port)
+    logger.info("MQTT Units: %s%s", 'all' if subscribed_units is None else len(subscribed_units),
+                ' (+ legacy topics)' if legacy_topics and subscribed_units else '')
+    logger.info("Write pipeline (%s): queue=%d, flush every %d messages or %d ms",
+                writer_mode, queue_size, flush_size, flush_interval_ms)
+    if workers > 1:
+        logger.info("Sharded ingest: %d worker processes, units assigned by hash", workers)
+    logger.info("Commit policy: %s%s", commit_policy, ', async history commits' if history_async_commit else '')
+    logger.info("History reorder window: %d ms", reorder_window_ms)
+    if trajectory is not None:
+        logger.info("Trajectory compression: %s m tolerance, a fix at least every %s s",
+                    trajectory.tolerance, trajectory.max_interval)
+    if daily_reports is not None:
+        logger.info("Daily reports: speed limit %s km/h, written every %s s",
+                    daily_reports.speed_limit, daily_reports.flush_interval)
+    if rollups is not None:
+        logger.info("Rollups: minute and hour buckets, written every %s s", rollups.flush_interval)
+    if deadband is not None:
+        logger.info("Deadband: %s, relative %s, heartbeat every %.0f s", deadband.absolute or 'exact repeats',
+                    deadband.relative, deadband.max_silence.total_seconds())
+    if rules is not None:
+        logger.info("Alert rules: notifications%s", f', published on {rules.alert_topic}' if rules.alert_topic else '')
+    if fleet_state is not None:
+        logger.info("Fleet status: http://%s/units", status_address)
+    if metrics is not None:
+        logger.info("Metrics: http://%s/metrics", status_address)
+    elif (status_http_port or status_http_socket) and workers > 1:
+        logger.info("Fleet status and metrics endpoint disabled: each sharded worker only sees its own units")
+    if trace_units:
+        logger.info("Tracing every message of units %s", ', '.join(trace_units))
+    
+    writer_options = dict(
         topic="vehicle_telemetry",  # Descriptive name, not used for subscription
         url=db_url,
         table_name="Units",  # Main table for unit data
-        columns=["unit_id", "fuel_level", "current_speed", "panic_button_active", "rpm", "temperature", "updated_at"]
+        columns=["unit_id", "fuel_level", "current_speed", "panic_button_active", "rpm", "temperature", "updated_at"],
+        queue_size=queue_size,
+        flush_size=flush_size,
+        flush_interval=flush_interval_ms / 1000,
+        location_pair_window=location_pair_window_ms / 1000,
+        location_orphan_policy=location_orphan_policy,
+        unknown_unit_policy=unknown_unit_policy,
+        unit_refresh_interval=unit_refresh_interval,
+        db_options=db_options,
+        commit_policy=commit_policy,
+        history_async_commit=history_async_commit,
+        subscribed_units=subscribed_units,
+        legacy_topics=legacy_topics,
+        reorder_window=reorder_window_ms / 1000,
+        deadband=deadband,
+        trajectory=trajectory,
+        daily_reports=daily_reports,
+        rules=rules,
+        fleet_state=fleet_state,
+        partition_options=partition_options,
+        rollups=rollups,
+        metrics=metrics,
+        trace_units=trace_units
     )
     
+    # Bring the schema up to date before the writer touches it
+    if os.getenv("DB_MIGRATE_ON_START", "false").lower() == "true":
+        migration_db = DatabaseConnection(db_url)
+        try:
+            applied = SchemaMigrator(migration_db).migrate()
+            logger.info("Schema migrations applied: %s",
+                        [f'{version:03d}_{name}' for version, name in applied] or 'none pending')
+        finally:
+            migration_db.close()
+    
+    # Initialize the writer - topic will be ignored since we subscribe to multiple topics on connect
+    if workers > 1:
+        writer = ShardedWriter(workers, writer_options, queue_size=queue_size, log_options=log_options)
+    elif writer_mode == "async":
+        writer = AsyncMQTTToDatabaseWriter(**writer_options)
+    else:
+        writer = MQTTToDatabaseWriter(**writer_options)
+    
+    # Serve the fleet state once the writer has loaded it, and the metrics
+    routes = {}
+    if fleet_state is not None:
+        routes.update(fleet_state.routes())
+    if metrics is not None:
+        routes.update(metrics.routes())
+    status_endpoint = None
+    if routes:
+        status_endpoint = HttpEndpoint(routes, host=status_http_host, port=status_http_port,
+                                       unix_socket=status_http_socket)
+        status_endpoint.start()
+    
     try:
         # Start the MQTT client loop
         writer.start(
@@ -49,11 +269,16 @@ def __main__():
             keep_alive=mqtt_keepalive
         )
     except KeyboardInterrupt:
-        print("\nShutting down...")
-        writer.db.close()
+        logger.info("Shutting down...")
+        writer.close()
     except Exception as e:
-        print(f"Error: {e}")
-        writer.db.close()
+        logger.exception("Error: %s", e)
+        writer.close()
+    finally:
+        if status_endpoint is not None:
+            status_endpoint.stop()
+        logger.info("Logging: %s", log_pipeline.stats())
+        log_pipeline.stop()
         
 if __name__ == "__main__":
     __main__()
\ No newline at end of file
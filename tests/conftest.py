@@ -0,0 +1,21 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+SCHEMA = os.path.join(os.path.dirname(__file__), '..', 'src', 'Database', 'Diagrama AV.sql')
+
+
+@pytest.fixture
+def sqlite_url(tmp_path):
+    """A SQLite database with the base schema (foreign keys left out), as a SQLAlchemy URL"""
+    path = tmp_path / 'telemetry.db'
+    sql = '\n'.join(line for line in open(SCHEMA).read().splitlines() if not line.startswith('ALTER TABLE'))
+    connection = sqlite3.connect(path)
+    connection.executescript(sql)
+    connection.commit()
+    connection.close()
+    return f'sqlite:///{path}'
@@ -0,0 +1,44 @@
+import threading
+
+from Schemas import LocationPairer
+from Services import Metrics
+
+
+def test_counter_view_exports_the_location_pairing_counters():
+    pairer = LocationPairer(orphan_policy='drop')
+    metrics = Metrics()
+    metrics.counter_view('location_pairing_total', 'Pairing outcomes',
+                         lambda: {'paired': pairer.pairs, 'orphan_dropped': pairer.orphans_dropped},
+                         labels=('outcome',))
+    pairer.add('unit', 'latitude', 19.4, None)
+    pairer.add('unit', 'latitude', 19.5, None)
+    body = metrics.render()
+    assert '# TYPE mqtt_writer_location_pairing_total counter' in body
+    assert 'mqtt_writer_location_pairing_total{outcome="orphan_dropped"} 1' in body
+    assert 'mqtt_writer_location_pairing_total{outcome="paired"} 0' in body
+
+
+def test_render_while_new_series_are_added():
+    metrics = Metrics()
+    counter = metrics.counter('unit_messages_total', 'Messages per unit', labels=('unit',))
+    stop = threading.Event()
+    errors = []
+
+    def scrape():
+        while not stop.is_set():
+            try:
+                metrics.render()
+            except Exception as e:
+                errors.append(e)
+                return
+
+    scraper = threading.Thread(target=scrape)
+    scraper.start()
+    try:
+        for unit in range(50000):
+            counter.inc(unit)
+    finally:
+        stop.set()
+        scraper.join()
+    assert errors == []
+    assert counter.value(49999) == 1
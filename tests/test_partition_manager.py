@@ -0,0 +1,83 @@
+import contextlib
+import datetime
+import types
+
+import polars as pl
+
+from Services import PartitionManager
+
+TODAY = datetime.date(2024, 6, 10)
+
+
+class FakePostgres:
+    """Answers the catalog queries of PartitionManager and records the statements it runs"""
+
+    engine = types.SimpleNamespace(dialect=types.SimpleNamespace(name='postgresql'))
+
+    def __init__(self, existing=(), default_rows=(), failing=(), locked_elsewhere=False):
+        self.existing = [f'SpeedHistory_p{day:%Y%m%d}' for day in existing]
+        self.default_rows = set(default_rows)
+        self.failing = set(failing)
+        self.locked_elsewhere = locked_elsewhere
+        self.statements = []
+
+    def fetch_frame(self, query, params=None):
+        if 'advisory' in query:
+            self.statements.append(query)
+            return pl.DataFrame({'locked': [not self.locked_elsewhere]})
+        if 'pg_partitioned_table WHERE' in query:
+            return pl.DataFrame({'partitioned': [1]})
+        if 'pg_inherits' in query:
+            return pl.DataFrame({'relname': self.existing}, schema={'relname': pl.Utf8})
+        if 'partdefid' in query:
+            return pl.DataFrame({'default_partition': ['"SpeedHistory_default"'], 'key': ['recorded_at']})
+        if 'attgenerated' in query:
+            return pl.DataFrame({'attname': ['unit_id', 'speed', 'recorded_at']})
+        found = [1] if params['start'] in self.default_rows else []
+        return pl.DataFrame({'found': found}, schema={'found': pl.Int64})
+
+    def execute_query(self, query, params=None):
+        self.statements.append(query)
+        for day in self.failing:
+            if f'_p{day:%Y%m%d}' in query:
+                raise RuntimeError('updated partition constraint for default partition would be violated')
+
+        class Result:
+            rowcount = 3
+        return Result()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        yield
+
+
+def test_a_failing_day_does_not_stop_the_following_days():
+    db = FakePostgres(failing=[TODAY + datetime.timedelta(days=1)])
+    manager = PartitionManager(db, tables=['SpeedHistory'])
+    assert manager.create_partitions('SpeedHistory', TODAY, TODAY + datetime.timedelta(days=3)) == 3
+    assert any('_p20240613' in statement for statement in db.statements)
+
+
+def test_rows_in_the_default_partition_are_moved_before_attaching():
+    db = FakePostgres(default_rows=[TODAY])
+    manager = PartitionManager(db, tables=['SpeedHistory'])
+    assert manager.create_partitions('SpeedHistory', TODAY, TODAY) == 1
+    create, move, attach = db.statements
+    assert create.startswith('CREATE TABLE "SpeedHistory_p20240610" (LIKE "SpeedHistory"')
+    assert 'DELETE FROM "SpeedHistory_default"' in move and 'INSERT INTO "SpeedHistory_p20240610"' in move
+    assert attach.startswith('ALTER TABLE "SpeedHistory" ATTACH PARTITION "SpeedHistory_p20240610"')
+    assert manager.moved == 3
+
+
+def test_maintenance_is_skipped_while_another_writer_holds_the_lock():
+    db = FakePostgres(locked_elsewhere=True)
+    PartitionManager(db, tables=['SpeedHistory']).maintain()
+    assert db.statements == ['SELECT pg_try_advisory_lock(:key) AS "locked"']
+
+
+def test_maintenance_releases_the_lock():
+    db = FakePostgres()
+    PartitionManager(db, tables=['SpeedHistory'], days_ahead=1).maintain()
+    assert db.statements[0].startswith('SELECT pg_try_advisory_lock')
+    assert db.statements[-1].startswith('SELECT pg_advisory_unlock')
+    assert sum('PARTITION OF' in statement for statement in db.statements) == 3
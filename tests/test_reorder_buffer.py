@@ -0,0 +1,48 @@
+import datetime
+import threading
+
+from Schemas import ReorderBuffer
+
+UNIT_ID = '00000000-0000-0000-0000-000000000001'
+
+
+def test_held_counts_the_rows_waiting_in_the_window():
+    reorder = ReorderBuffer(window=2.0)
+    start = datetime.datetime(2024, 6, 10, 12, 0, 0)
+    for second in (0, 2, 1, 1, 5):
+        reorder.add('SpeedHistory', UNIT_ID, start + datetime.timedelta(seconds=second), (second,))
+    # The second 1 is a duplicate
+    assert reorder.held == len(reorder) == 4
+    released = reorder.release(0.0)
+    assert [row[0] for row in released['SpeedHistory']] == [0, 1, 2]
+    assert reorder.stats()['held'] == 1
+    reorder.release()
+    assert reorder.held == 0
+
+
+def test_stats_can_be_read_while_the_writer_adds_and_releases():
+    reorder = ReorderBuffer(window=0.0)
+    start = datetime.datetime(2024, 6, 10, 12, 0, 0)
+    stop = threading.Event()
+    errors = []
+
+    def scrape():
+        while not stop.is_set():
+            try:
+                reorder.stats()
+            except Exception as e:
+                errors.append(e)
+                return
+
+    scraper = threading.Thread(target=scrape)
+    scraper.start()
+    try:
+        for step in range(20000):
+            unit_id = f'unit-{step % 500}'
+            reorder.add('SpeedHistory', unit_id, start + datetime.timedelta(seconds=step), (step,))
+            if step % 50 == 0:
+                reorder.release()
+    finally:
+        stop.set()
+        scraper.join()
+    assert errors == []
@@ -0,0 +1,30 @@
+import datetime
+
+from Schemas import RuleEngine
+
+UNIT_ID = '00000000-0000-0000-0000-000000000001'
+
+
+def test_flapping_panic_button_fires_once_per_cooldown_window():
+    rules = RuleEngine(panic_cooldown=30.0)
+    start = datetime.datetime(2024, 6, 10, 12, 0, 0)
+    # The button chatters on and off every 100 ms for 75 s
+    for step in range(750):
+        timestamp = start + datetime.timedelta(milliseconds=100 * step)
+        rules.evaluate(UNIT_ID, 'panic_button_active', step % 2 == 0, timestamp)
+    notifications, _ = rules.take()
+    fired_at = [row[4] - start for row in notifications]
+    assert fired_at == [datetime.timedelta(seconds=seconds) for seconds in (0, 30, 60)]
+
+
+def test_panic_hold_ignores_presses_shorter_than_the_hold():
+    rules = RuleEngine(panic_hold=1.0)
+    start = datetime.datetime(2024, 6, 10, 12, 0, 0)
+    for step in range(20):
+        timestamp = start + datetime.timedelta(milliseconds=100 * step)
+        rules.evaluate(UNIT_ID, 'panic_button_active', step % 2 == 0, timestamp)
+    assert rules.take()[0] == []
+    for step in range(11):
+        timestamp = start + datetime.timedelta(seconds=5, milliseconds=100 * step)
+        rules.evaluate(UNIT_ID, 'panic_button_active', True, timestamp)
+    assert len(rules.take()[0]) == 1
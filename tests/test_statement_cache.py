@@ -0,0 +1,46 @@
+from Services import DatabaseConnection
+
+
+class FakeConnection:
+    """Stands in for a PostgreSQL connection: keeps the pool info dict and records driver SQL"""
+
+    def __init__(self):
+        self.closed = False
+        self.connection = self
+        self.info = {}
+        self.sql = []
+
+    def exec_driver_sql(self, sql):
+        self.sql.append(sql)
+
+
+def test_cache_evicts_the_least_recently_used_shape(sqlite_url):
+    database = DatabaseConnection(sqlite_url)
+    database.STATEMENT_CACHE_SIZE = 3
+    for key in ('a', 'b', 'c'):
+        database._statement((key,), lambda: key)
+    database._statement(('a',), lambda: 'rebuilt')
+    database._statement(('d',), lambda: 'd')
+    assert list(database._statements) == [('c',), ('a',), ('d',)]
+    assert database._statement(('a',), lambda: 'rebuilt') == 'a'
+    database.close()
+
+
+def test_evicted_prepared_statements_are_deallocated(sqlite_url):
+    database = DatabaseConnection(sqlite_url)
+    database.STATEMENT_CACHE_SIZE = 2
+    connection = database._local.conn = FakeConnection()
+
+    def prepare(key):
+        _, prepared = database._statement(
+            key, lambda: database._prepared_statement(key, 'SELECT :value', ['value']))
+        database._ensure_prepared(*prepared)
+        return prepared[0]
+
+    first = prepare(('first',))
+    prepare(('second',))
+    prepare(('third',))
+    assert f'DEALLOCATE {first}' in connection.sql
+    assert connection.info['prepared_statements'] == set(database._prepared_keys.values())
+    database._local.conn = None
+    database.close()
@@ -0,0 +1,76 @@
+import datetime
+import math
+import random
+
+import pytest
+
+from Schemas import TrajectoryCompressor
+
+START = datetime.datetime(2024, 6, 10, 12, 0, 0)
+
+
+def track(kind, points, rng, unit_id='unit-1'):
+    """A simulated track of one fix per second, as LocationHistory rows"""
+    latitude, longitude, heading = 19.4326, -99.1332, rng.uniform(0, 360)
+    rows = []
+    for i in range(points):
+        if kind == 'winding':
+            heading += rng.gauss(0, 8)
+        elif kind == 'random walk':
+            heading = rng.uniform(0, 360)
+        step = 0.0 if kind == 'parked' else rng.uniform(5, 20)
+        # Meters to degrees, plus a meter or two of GPS noise
+        latitude += (step * math.cos(math.radians(heading)) + rng.gauss(0, 1)) / 111195
+        longitude += (step * math.sin(math.radians(heading)) + rng.gauss(0, 1)) / (
+            111195 * math.cos(math.radians(latitude)))
+        rows.append((f'{unit_id}-{i}', unit_id, latitude, longitude, START + datetime.timedelta(seconds=i)))
+    return rows
+
+
+def compress(compressor, rows):
+    kept = []
+    for row in rows:
+        kept.extend(compressor.add(row))
+    kept.extend(compressor.expire())
+    return kept
+
+
+@pytest.mark.parametrize('kind', ['straight', 'winding', 'random walk', 'parked'])
+@pytest.mark.parametrize('tolerance', [2.0, 10.0, 50.0])
+def test_every_dropped_point_is_within_tolerance_of_its_kept_segment(kind, tolerance):
+    rows = track(kind, 2000, random.Random(f'{kind}-{tolerance}'))
+    compressor = TrajectoryCompressor(tolerance=tolerance, max_points=32, max_interval=60.0)
+    kept = compress(compressor, rows)
+
+    assert kept == sorted(kept, key=lambda row: row[4])
+    kept_ids = [row[0] for row in kept]
+    segment = 0
+    for row in rows:
+        while segment + 1 < len(kept) and kept[segment + 1][4] <= row[4]:
+            segment += 1
+        if row[0] in kept_ids:
+            continue
+        start, end = kept[segment], kept[segment + 1]
+        assert start[4] < row[4] < end[4]
+        deviation = TrajectoryCompressor.distance_to_segment(row[2:4], start[2:4], end[2:4])
+        assert deviation <= tolerance + 1e-6
+
+
+@pytest.mark.parametrize('kind', ['straight', 'winding', 'random walk', 'parked'])
+def test_first_and_last_points_are_always_kept(kind):
+    rows = track(kind, 500, random.Random(kind))
+    kept = compress(TrajectoryCompressor(tolerance=25.0, max_interval=3600.0), rows)
+    assert kept[0] == rows[0]
+    assert kept[-1] == rows[-1]
+
+
+def test_tracks_of_several_units_are_compressed_independently():
+    rng = random.Random(7)
+    tracks = [track('winding', 300, rng, unit_id=f'unit-{unit}') for unit in range(5)]
+    # Interleaved like a live feed
+    feed = [rows[i] for i in range(300) for rows in tracks]
+    kept = compress(TrajectoryCompressor(tolerance=10.0), feed)
+    for rows in tracks:
+        unit_kept = [row for row in kept if row[1] == rows[0][1]]
+        assert unit_kept[0] == rows[0] and unit_kept[-1] == rows[-1]
+    assert len(kept) < len(feed)
@@ -0,0 +1,60 @@
+import datetime
+import sqlite3
+
+from Schemas import MQTTToDatabaseWriter, UnitStateBuffer
+
+UNIT_ID = '00000000-0000-0000-0000-000000000001'
+
+
+def add_field_times(url):
+    """Apply the columns of migration 003 (SQLite adds one column per statement)"""
+    connection = sqlite3.connect(url[len('sqlite:///'):])
+    for field in UnitStateBuffer.FIELDS:
+        connection.execute(f'ALTER TABLE "Units" ADD COLUMN "{field}_at" timestamp')
+    connection.commit()
+    connection.close()
+
+
+def writer(url):
+    return MQTTToDatabaseWriter(topic='test', url=url, table_name='Units', columns=[], rules=None)
+
+
+def write(writer, samples):
+    """Apply (field, value, timestamp) samples and upsert the coalesced row"""
+    for field, value, timestamp in samples:
+        writer._update_unit_field(UNIT_ID, field, value, timestamp)
+    writer._upsert_units(writer.unit_state.drain())
+
+
+def stored(url):
+    connection = sqlite3.connect(url[len('sqlite:///'):])
+    row = connection.execute('SELECT "fuel_level", "current_speed" FROM "Units" WHERE "unit_id" = ?',
+                             (UNIT_ID,)).fetchone()
+    connection.close()
+    return tuple(float(value) for value in row)
+
+
+def test_newer_field_value_is_kept_when_another_field_is_newer(sqlite_url):
+    add_field_times(sqlite_url)
+    now = datetime.datetime(2024, 6, 10, 12, 0, 0)
+    first = writer(sqlite_url)
+    assert first.unit_state.field_timestamps
+    write(first, [('fuel_level', 10, now - datetime.timedelta(seconds=10))])
+    write(first, [('current_speed', 50, now)])
+    write(first, [('fuel_level', 20, now - datetime.timedelta(seconds=1))])
+    assert stored(sqlite_url) == (20, 50)
+    first.close()
+
+
+def test_older_field_value_from_another_writer_is_ignored(sqlite_url):
+    add_field_times(sqlite_url)
+    now = datetime.datetime(2024, 6, 10, 12, 0, 0)
+    first = writer(sqlite_url)
+    write(first, [('fuel_level', 10, now - datetime.timedelta(seconds=10)), ('current_speed', 50, now)])
+    first.close()
+    # A second process has not seen those values: only its fuel sample is newer
+    second = writer(sqlite_url)
+    write(second, [('fuel_level', 20, now - datetime.timedelta(seconds=1)),
+                   ('current_speed', 40, now - datetime.timedelta(seconds=5))])
+    assert stored(sqlite_url) == (20, 50)
+    second.close()